@@ -0,0 +1,356 @@
+"""
+Year-end batch recompute: runs every user's stored transactions through classification,
+transfer matching, price backfill, lot matching and report generation.
+
+    python -m app.batch [--year 2025] [--methods fifo,hifo] [--formats csv,form8949]
+                        [--users u1,u2] [--shard 0/4] [--concurrency 8] [--upstream-rate 5]
+                        [--run NAME] [--force] [--no-ai] [--no-backfill]
+
+Progress is checkpointed per user and stage in BATCH_STATE_PATH, so re-running the same
+--run resumes after a crash: finished users are skipped and an interrupted user continues
+at its next stage. A user whose inputs (stored rows, wallets, price series of their assets
+and the pipeline settings) hash the same as at their last successful run is skipped.
+Upstream calls (AI classification and price backfill) share one token bucket, so the
+whole batch stays under --upstream-rate requests per second. Ledger rebuilds run in the tax
+process pool (TAX_WORKERS), one task per user in flight. --shard I/N processes the users that
+hash to shard I, so N processes (or machines) can split the users.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+from termcolor import cprint
+
+DEFAULT_BATCH_STATE_PATH = "data/batch_state.db"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_UPSTREAM_RATE = 5.0
+# Rows per classification call, read from the store one chunk at a time.
+CLASSIFY_CHUNK = 2000
+# Bump when a stage changes in a way that should recompute every user.
+PIPELINE_VERSION = "2"
+
+STAGES = ("classify", "transfers", "prices", "tax", "reports")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batch_runs (
+    run_id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    started_at INTEGER NOT NULL,
+    finished_at INTEGER,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS batch_users (
+    run_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    stage TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (run_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS batch_user_hashes (
+    user_id TEXT PRIMARY KEY,
+    input_hash TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    finished_at INTEGER NOT NULL
+);
+"""
+
+
+class BatchState:
+    """
+    Checkpoints of batch runs: the last finished stage and status of each user per run, and
+    each user's input hash as of their last successful run.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("BATCH_STATE_PATH", DEFAULT_BATCH_STATE_PATH)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def start_run(self, run_id: str, params):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO batch_runs (run_id, params, started_at) VALUES (?, ?, ?)",
+                (run_id, json.dumps(params, sort_keys=True), int(time.time())),
+            )
+
+    def finish_run(self, run_id: str, summary):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE batch_runs SET finished_at = ?, summary = ? WHERE run_id = ?",
+                              (int(time.time()), json.dumps(summary), run_id))
+
+    def progress(self, run_id: str):
+        """{user_id: (last finished stage, status)} for a run."""
+        with self.lock:
+            rows = self.conn.execute("SELECT user_id, stage, status FROM batch_users WHERE run_id = ?", (run_id,)).fetchall()
+        return {user_id: (stage, status) for user_id, stage, status in rows}
+
+    def save_stage(self, run_id: str, user_id: str, stage: str):
+        self._set(run_id, user_id, stage, "running")
+
+    def finish_user(self, run_id: str, user_id: str, status: str, input_hash: str = None, error: str = None):
+        """Record a user's outcome; a clean finish ("done" or "unchanged") also records the input hash."""
+        self._set(run_id, user_id, None, status, error)
+        if input_hash is not None and status in ("done", "unchanged"):
+            with self.lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO batch_user_hashes (user_id, input_hash, run_id, finished_at) VALUES (?, ?, ?, ?)",
+                    (user_id, input_hash, run_id, int(time.time())),
+                )
+
+    def last_hash(self, user_id: str):
+        with self.lock:
+            row = self.conn.execute("SELECT input_hash FROM batch_user_hashes WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, run_id, user_id, stage, status, error=None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO batch_users (run_id, user_id, stage, status, error, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, user_id) DO UPDATE SET stage = COALESCE(excluded.stage, batch_users.stage), "
+                "status = excluded.status, error = excluded.error, updated_at = excluded.updated_at",
+                (run_id, user_id, stage, status, error, int(time.time())),
+            )
+
+
+def in_shard(user_id: str, shard: int, shards: int) -> bool:
+    """Stable assignment of users to shards (CRC32 of the user id), the same in every process."""
+    return shards <= 1 or zlib.crc32(user_id.encode("utf-8")) % shards == shard
+
+
+class YearEndBatch:
+    def __init__(self, run_id: str, year: int, methods, formats, state: BatchState, upstream, concurrency: int = None,
+                 use_ai: bool = True, backfill: bool = True, force: bool = False, task_complexity: str = "simple"):
+        from app.services.ai_service import CLASSIFIER_VERSION
+        self.run_id, self.year, self.methods, self.formats = run_id, year, list(methods), list(formats)
+        self.state, self.upstream = state, upstream
+        self.concurrency = concurrency or DEFAULT_CONCURRENCY
+        self.use_ai, self.backfill, self.force = use_ai, backfill, force
+        self.task_complexity = task_complexity
+        # Anything that changes the output for the same stored rows belongs in the settings key.
+        self.settings = json.dumps([PIPELINE_VERSION, CLASSIFIER_VERSION, year, self.methods, self.formats, use_ai], sort_keys=True)
+        self.counts = {"done": 0, "unchanged": 0, "resumed": 0, "partial": 0, "error": 0}
+        self.started = time.time()
+
+    def input_hash(self, user_id: str) -> str:
+        """Hash of everything a user's results depend on: stored rows, wallets, price series and settings."""
+        from app.utils.price_oracle import get_price_oracle
+        from app.utils.tx_store import get_store
+        store = get_store()
+        prices = get_price_oracle().store.fingerprint(store.user_tokens(user_id))
+        return hashlib.sha256("|".join((self.settings, store.content_hash(user_id), prices)).encode("utf-8")).hexdigest()
+
+    async def run(self, user_ids):
+        """Process `user_ids` with up to `concurrency` users in flight. Returns the run summary."""
+        progress = self.state.progress(self.run_id)
+        queue = asyncio.Queue()
+        for user_id in user_ids:
+            stage, status = progress.get(user_id, (None, None))
+            if status in ("done", "unchanged"):
+                self.counts["resumed"] += 1
+            else:
+                # A user interrupted mid-run continues after its last finished stage; one that
+                # finished with problems or failed starts over.
+                queue.put_nowait((user_id, stage if status == "running" else None))
+        total = len(user_ids)
+        cprint(f"[INFO] Batch {self.run_id}: {total} users, {self.counts['resumed']} already finished in this run.", "cyan")
+
+        async def worker():
+            while not queue.empty():
+                user_id, stage = queue.get_nowait()
+                status = await self.process_user(user_id, stage)
+                self.counts[status] += 1
+                finished = sum(self.counts.values())
+                if finished % 50 == 0 or finished == total:
+                    rate = (finished - self.counts["resumed"]) / max(time.time() - self.started, 1e-9)
+                    cprint(f"[INFO] Batch {self.run_id}: {finished}/{total} users ({self.counts['unchanged']} unchanged, "
+                           f"{self.counts['partial']} partial, {self.counts['error']} failed), {rate:.1f} users/s.", "cyan")
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        summary = {**self.counts, "users": total, "seconds": round(time.time() - self.started, 1)}
+        self.state.finish_run(self.run_id, summary)
+        return summary
+
+    async def process_user(self, user_id: str, resume_after: str = None) -> str:
+        try:
+            if resume_after is None and not self.force:
+                input_hash = await asyncio.to_thread(self.input_hash, user_id)
+                if input_hash == self.state.last_hash(user_id):
+                    self.state.finish_user(self.run_id, user_id, "unchanged", input_hash)
+                    return "unchanged"
+            stages = STAGES[STAGES.index(resume_after) + 1:] if resume_after in STAGES else STAGES
+            problems = []
+            for stage in stages:
+                problems += await getattr(self, f"stage_{stage}")(user_id)
+                self.state.save_stage(self.run_id, user_id, stage)
+            if problems:
+                # No input hash: the next run retries this user.
+                self.state.finish_user(self.run_id, user_id, "partial", error="; ".join(problems)[:2000])
+                return "partial"
+            # Hashed after the stages, which rewrite transfer matches and price series.
+            self.state.finish_user(self.run_id, user_id, "done", await asyncio.to_thread(self.input_hash, user_id))
+            return "done"
+        except Exception as e:
+            cprint(f"[ERROR] Batch {self.run_id}: {user_id} failed: {e}", "red")
+            self.state.finish_user(self.run_id, user_id, "error", error=str(e)[:2000])
+            return "error"
+
+    # Each stage returns a list of non-fatal problems; an exception fails the user.
+
+    async def stage_classify(self, user_id):
+        """
+        Classify every stored row (rules first, AI for the rest unless --no-ai) and store each
+        type on its row as `classification`, which lot matching reads (cost_basis.tax_type).
+        AI results also land in the classification memo. Only changed classifications are written.
+        """
+        from app.services.ai_service import ai_classify_transactions
+        from app.services.rule_classifier import classify_with_rules, split_by_rules
+        from app.utils.tx_store import get_store
+        store = get_store()
+        rows = store.iter_user_rows(user_id)
+        problems = []
+        while True:
+            chunk = await asyncio.to_thread(lambda: list(islice(rows, CLASSIFY_CHUNK)))
+            if not chunk:
+                break
+            transactions = [tx for _, _, _, tx in chunk]
+            if self.use_ai:
+                results = await classify_with_rules(transactions, lambda residue: ai_classify_transactions(residue, self.task_complexity))
+            else:
+                results = split_by_rules(transactions)[0]
+            if isinstance(results, dict) and "error" in results:
+                problems.append(f"classification: {results['error']}")
+                break
+            updates = []
+            for (chain, address, tx_id, tx), result in zip(chunk, results):
+                classification = result.get("type") if isinstance(result, dict) else None
+                classification = str(classification).lower() if classification else None
+                if classification and classification != tx.get("classification"):
+                    updates.append((chain, address, tx_id, tx, classification))
+            await asyncio.to_thread(store.set_classifications, updates)
+        return problems
+
+    async def stage_transfers(self, user_id):
+        from app.services.transfer_matcher import match_user_transfers
+        await asyncio.to_thread(match_user_transfers, user_id)
+        return []
+
+    async def stage_prices(self, user_id):
+        """Backfill price bars over the time range of each asset that has unpriced rows."""
+        if not self.backfill:
+            return []
+        from app.utils.price_oracle import USD_STABLES, get_price_oracle, price_symbol
+        from app.utils.tx_store import get_store
+        ranges = {}
+        for token, (first, last) in (await asyncio.to_thread(get_store().unpriced_ranges, user_id)).items():
+            symbol = price_symbol(token)
+            if symbol in USD_STABLES:
+                continue
+            lo, hi = ranges.get(symbol, (first, last))
+            ranges[symbol] = (min(lo, first), max(hi, last))
+        problems = []
+        oracle = get_price_oracle()
+        for symbol, (first, last) in sorted(ranges.items()):
+            await self.upstream.acquire()
+            try:
+                await asyncio.to_thread(oracle.backfill, symbol, first, last)
+            except Exception as e:
+                problems.append(f"price backfill {symbol}: {e}")
+        return problems
+
+    async def stage_tax(self, user_id):
+        """Rebuild each method's ledger in the tax process pool, one task per user and method."""
+        from app.services.parallel_gains import rebuild_ledger_in_pool
+        for method in self.methods:
+            # A full rebuild: prices or rules may have changed without any stored row changing.
+            await rebuild_ledger_in_pool(user_id, method)
+        return []
+
+    async def stage_reports(self, user_id):
+        """Write the year's reports into the report cache, where /report/generate serves them from."""
+        from app.services.report_service import iter_and_cache, iter_report, report_cache_path
+        from app.services.tax_ledger import get_tax_ledger
+        ledger = get_tax_ledger()
+
+        def write(report_format, method):
+            path = report_cache_path(user_id, report_format, method, self.year, ledger.data_version(user_id, self.year))
+            if not os.path.exists(path):
+                for _ in iter_and_cache(iter_report(ledger, user_id, report_format, method, self.year), path):
+                    pass
+
+        for method in self.methods:
+            for report_format in self.formats:
+                await asyncio.to_thread(write, report_format, method)
+        return []
+
+
+async def run_batch(args):
+    from app.services.openrouter_client import close_openrouter_client, set_throttle
+    from app.utils.rate_limiter import TokenBucket
+    from app.utils.tx_store import get_store
+    shard, shards = (int(part) for part in args.shard.split("/")) if args.shard else (0, 1)
+    users = args.users.split(",") if args.users else get_store().get_users()
+    users = [user_id for user_id in users if in_shard(user_id, shard, shards)]
+    run_id = args.run or f"year-end-{args.year}" + (f"-{shard}of{shards}" if shards > 1 else "")
+    params = {"year": args.year, "methods": args.methods, "formats": args.formats, "shard": args.shard, "ai": not args.no_ai}
+    state = BatchState()
+    state.start_run(run_id, params)
+    # One bucket for all upstream calls of this process; with --shard, each process gets rate / shards.
+    upstream = TokenBucket(args.upstream_rate / shards, max(1, int(args.upstream_rate / shards)))
+    set_throttle(upstream)
+    batch = YearEndBatch(run_id, args.year, args.methods.split(","), args.formats.split(","), state, upstream,
+                         args.concurrency, use_ai=not args.no_ai, backfill=not args.no_backfill, force=args.force,
+                         task_complexity=args.task_complexity)
+    try:
+        return await batch.run(users)
+    finally:
+        from app.services.parallel_gains import close_process_pool
+        set_throttle(None)
+        await close_openrouter_client()
+        close_process_pool()
+
+
+def main(argv=None):
+    from app.services.cost_basis import METHODS
+    from app.services.report_service import REPORT_FORMATS
+    parser = argparse.ArgumentParser(prog="python -m app.batch", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--year", type=int, default=datetime.now(timezone.utc).year - 1, help="tax year (default: last year)")
+    parser.add_argument("--methods", default="fifo", help=f"comma-separated, from {', '.join(METHODS)}")
+    parser.add_argument("--formats", default="csv,form8949", help=f"comma-separated, from {', '.join(REPORT_FORMATS)}")
+    parser.add_argument("--users", help="comma-separated user ids (default: every user in the store)")
+    parser.add_argument("--shard", help="I/N: only the users in shard I of N")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="users in flight")
+    parser.add_argument("--upstream-rate", type=float, default=float(os.getenv("BATCH_UPSTREAM_RATE", DEFAULT_UPSTREAM_RATE)),
+                        help="upstream requests per second across the whole batch")
+    parser.add_argument("--task-complexity", default="simple", choices=("simple", "complex"))
+    parser.add_argument("--run", help="run name to create or resume (default: year-end-YEAR)")
+    parser.add_argument("--force", action="store_true", help="recompute users whose inputs are unchanged")
+    parser.add_argument("--no-ai", action="store_true", help="rule-based classification only")
+    parser.add_argument("--no-backfill", action="store_true", help="price from the local store only")
+    args = parser.parse_args(argv)
+    unknown = [m for m in args.methods.split(",") if m not in METHODS] + [f for f in args.formats.split(",") if f not in REPORT_FORMATS]
+    if unknown:
+        parser.error(f"unsupported method or format: {', '.join(unknown)}")
+    if args.shard and not (args.shard.count("/") == 1 and all(p.isdigit() for p in args.shard.split("/"))
+                           and int(args.shard.split("/")[0]) < int(args.shard.split("/")[1])):
+        parser.error("--shard must be I/N with 0 <= I < N")
+    summary = asyncio.run(run_batch(args))
+    cprint(f"[INFO] Batch finished: {json.dumps(summary)}", "green")
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
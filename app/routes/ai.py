@@ -1,20 +1,33 @@
 from fastapi import APIRouter, HTTPException, Request
 from termcolor import cprint
-from app.services.ai_service import ai_classify_transactions
 
 router = APIRouter()
 
 @router.post("/ai/classify_transactions")
-def classify_transactions_api(request: Request):
+async def classify_transactions_api(request: Request):
     try:
+        from app.services.ai_service import ai_classify_transactions, stream_classify_transactions
+        from app.utils.cancellation import cancel_on_disconnect
+        from app.utils.ndjson import ndjson_response
         data = await request.json()
         transactions = data.get("transactions", [])
         task_complexity = data.get("task_complexity", "simple")
-        cprint(f"[INFO] Received {len(transactions)} transactions for AI classification.", "cyan")
-        result = ai_classify_transactions(transactions, task_complexity)
-        if "error" in result:
+        from app.utils.log import get_logger
+        get_logger(__name__).info("classify request", extra={"transactions": len(transactions), "stream": bool(data.get("stream"))})
+        if data.get("stream"):
+            return ndjson_response(stream_classify_transactions(transactions, task_complexity), len(transactions))
+        result = await cancel_on_disconnect(request, ai_classify_transactions(transactions, task_complexity))
+        if isinstance(result, dict) and "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
-        return result
+        return {"results": result}
+    except HTTPException:
+        raise
     except Exception as e:
         cprint(f"[ERROR] AI classify endpoint failed: {e}", "red")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ai/model_stats")
+async def model_stats_api():
+    """Per-model latency percentiles, error and JSON-validity rates seen by the model router."""
+    from app.services.model_router import get_model_router
+    return {"models": get_model_router().snapshot()}
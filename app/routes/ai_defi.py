@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Request
-from app.services.ai_defi_service import ai_classify_defi_protocols
 
 router = APIRouter()
 
 @router.post("/classify_defi_protocols")
 async def classify_defi_protocols(request: Request):
+    from app.services.ai_defi_service import ai_classify_defi_protocols, stream_classify_defi_protocols
+    from app.utils.cancellation import cancel_on_disconnect
+    from app.utils.ndjson import ndjson_response
     body = await request.json()
     transactions = body.get("transactions", [])
-    result = ai_classify_defi_protocols(transactions)
+    if body.get("stream"):
+        return ndjson_response(stream_classify_defi_protocols(transactions), len(transactions))
+    result = await cancel_on_disconnect(request, ai_classify_defi_protocols(transactions))
     return {"results": result}
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Request
-from app.services.ai_nft_service import ai_classify_nft_transactions
 
 router = APIRouter()
 
 @router.post("/classify_nft_transactions")
-def classify_nft_transactions(request: Request):
+async def classify_nft_transactions(request: Request):
+    from app.services.ai_nft_service import ai_classify_nft_transactions, stream_classify_nft_transactions
+    from app.utils.cancellation import cancel_on_disconnect
+    from app.utils.ndjson import ndjson_response
     body = await request.json()
     transactions = body.get("transactions", [])
     task_complexity = body.get("task_complexity", "simple")
-    result = ai_classify_nft_transactions(transactions, task_complexity)
+    if body.get("stream"):
+        return ndjson_response(stream_classify_nft_transactions(transactions, task_complexity), len(transactions))
+    result = await cancel_on_disconnect(request, ai_classify_nft_transactions(transactions, task_complexity))
     return {"results": result}
@@ -1,12 +1,36 @@
-from fastapi import APIRouter, Request
-from app.services.ai_search_service import ai_search_transactions
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
+from termcolor import cprint
 
 router = APIRouter()
 
 @router.post("/search_transactions")
 async def search_transactions(request: Request):
-    body = await request.json()
-    transactions = body.get("transactions", [])
-    query = body.get("query", "")
-    result = ai_search_transactions(transactions, query)
-    return {"results": result}
+    """
+    Body: {"query": "..."} or {"filter": {...}}, plus "user_id" (search the stored history, default)
+    or "transactions" (search the given list), and optional "limit" / "offset".
+    """
+    from app.services.ai_search_service import ai_search_transactions
+    from app.utils.cancellation import cancel_on_disconnect
+    from app.utils.search_index import build_index, get_user_index
+    from app.utils.transaction_batch import TransactionBatch
+    try:
+        body = await request.json()
+        query = body.get("query", "")
+        search_filter = body.get("filter")
+        if not query and search_filter is None:
+            raise HTTPException(status_code=400, detail="query or filter is required.")
+        if "transactions" in body:
+            batch = await asyncio.to_thread(TransactionBatch.from_dicts, body["transactions"])
+            index = await asyncio.to_thread(build_index, batch, body.get("addresses"))
+        else:
+            index = await asyncio.to_thread(get_user_index, body.get("user_id", "default"))
+        result = await cancel_on_disconnect(
+            request, ai_search_transactions(index, query, search_filter, body.get("limit", 100), body.get("offset", 0))
+        )
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=500, detail="Transaction search failed.")
@@ -1,14 +1,37 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from termcolor import cprint
 
 router = APIRouter()
 
 @router.post("/transactions/classify")
-def classify_transactions():
+async def classify_transactions(request: Request):
     try:
-        cprint("[INFO] Transaction classification started.", "cyan")
-        # Placeholder: Implement transaction parsing/classification logic
-        return {"message": "Transaction classification (to be implemented)"}
+        from app.services.ai_service import ai_classify_transactions, stream_classify_transactions
+        from app.services.rule_classifier import classify_with_rules, split_by_rules, stream_with_rules
+        from app.utils.cancellation import cancel_on_disconnect
+        from app.utils.ndjson import ndjson_response
+
+        data = await request.json()
+        transactions = data.get("transactions", [])
+        task_complexity = data.get("task_complexity", "simple")
+        cprint(f"[INFO] Transaction classification started for {len(transactions)} transactions.", "cyan")
+        if data.get("use_ai", True) and data.get("stream"):
+            return ndjson_response(stream_with_rules(
+                transactions, lambda residue: stream_classify_transactions(residue, task_complexity)
+            ), len(transactions))
+        if data.get("use_ai", True):
+            results = await cancel_on_disconnect(request, classify_with_rules(
+                transactions, lambda residue: ai_classify_transactions(residue, task_complexity)
+            ))
+            if isinstance(results, dict) and "error" in results:
+                raise HTTPException(status_code=502, detail=results["error"])
+        else:
+            results, _ = split_by_rules(transactions)
+        by_rules = sum(1 for result in results if isinstance(result, dict) and result.get("source") == "rules")
+        cprint(f"[INFO] Rules classified {by_rules} of {len(transactions)} transactions.", "cyan")
+        return {"results": results, "rule_classified": by_rules, "ai_classified": len(transactions) - by_rules}
+    except HTTPException:
+        raise
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Classification failed.")
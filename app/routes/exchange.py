@@ -9,15 +9,23 @@ def import_exchange(
     api_key: str = Form(None),
     api_secret: str = Form(None),
     csv_file: UploadFile = File(None),
-    xpub: str = Form(None)
+    xpub: str = Form(None),
+    account: str = Form("default"),
+    user_id: str = Form("default")
 ):
     try:
         cprint(f"[INFO] Importing exchange data for {exchange_name}.", "cyan")
-        # Placeholder: Implement API/CSV/xPub import logic
+        # Placeholder: Implement API/xPub import logic
         if csv_file:
-            content = csv_file.file.read().decode("utf-8")
-            cprint(f"[INFO] CSV file received. Length: {len(content)}", "green")
+            from app.utils.csv_importer import import_csv
+            # The upload is spooled to disk by Starlette and parsed row by row from there.
+            result = import_csv(csv_file.file, exchange_name, account, user_id, total_bytes=csv_file.size)
+            cprint(f"[INFO] CSV import finished: {result['rows']} rows, {result['imported']} new transactions.", "green")
+            return {"message": f"Exchange {exchange_name} CSV imported", **result}
         return {"message": f"Exchange {exchange_name} import started (to be implemented)"}
+    except ValueError as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Exchange import failed.")
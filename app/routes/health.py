@@ -1,9 +1,10 @@
 from fastapi import APIRouter
-from termcolor import cprint
+from app.utils.log import get_logger
 
 router = APIRouter()
+log = get_logger(__name__)
 
 @router.get("/health")
 def health_check():
-    cprint("Health check endpoint hit.", "green")
+    log.debug("health check")
     return {"status": "ok"}
@@ -0,0 +1,96 @@
+import uuid
+import shutil
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form, Header
+from termcolor import cprint
+
+router = APIRouter()
+
+
+def _user(x_user_id: str, user_id: str) -> str:
+    return x_user_id or user_id or "default"
+
+
+def _job_for(job_id: str, user: str):
+    from app.utils.job_queue import get_job_runner
+    job = get_job_runner().store.get(job_id)
+    if job is None or job["user_id"] != user:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+def _status(job):
+    return {key: job[key] for key in ("id", "kind", "status", "progress", "error", "attempts", "created_at", "started_at", "finished_at")}
+
+
+@router.post("/jobs")
+async def submit_job(request: Request, x_user_id: str = Header(None)):
+    """Body: {"kind": "wallet_sync"|"report"|"tax"|"classification"|"price_backfill", "params": {...}, "user_id"}."""
+    try:
+        from app.utils.job_queue import get_job_runner
+        body = await request.json()
+        user = _user(x_user_id, body.get("user_id"))
+        job = get_job_runner().submit(user, body.get("kind", ""), body.get("params", {}))
+        return _status(job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=500, detail="Job submission failed.")
+
+
+@router.post("/jobs/csv_import")
+async def submit_csv_import(
+    exchange_name: str = Form(...),
+    csv_file: UploadFile = File(...),
+    account: str = Form("default"),
+    profile_name: str = Form(None),
+    user_id: str = Form(None),
+    x_user_id: str = Header(None),
+):
+    try:
+        from app.services.job_handlers import upload_path
+        from app.utils.job_queue import get_job_runner
+        path = upload_path(uuid.uuid4().hex)
+
+        def save():
+            with open(path, "wb") as f:
+                shutil.copyfileobj(csv_file.file, f)
+
+        await asyncio.to_thread(save)
+        params = {"path": path, "exchange": exchange_name, "account": account, "profile": profile_name}
+        return _status(get_job_runner().submit(_user(x_user_id, user_id), "csv_import", params))
+    except Exception as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=500, detail="Job submission failed.")
+
+
+@router.get("/jobs")
+def list_jobs(user_id: str = None, x_user_id: str = Header(None)):
+    from app.utils.job_queue import get_job_runner
+    return {"jobs": [_status(job) for job in get_job_runner().store.list(_user(x_user_id, user_id))]}
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, user_id: str = None, x_user_id: str = Header(None)):
+    return _status(_job_for(job_id, _user(x_user_id, user_id)))
+
+
+@router.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, user_id: str = None, x_user_id: str = Header(None)):
+    from app.utils.job_queue import FINISHED, SUCCEEDED
+    job = _job_for(job_id, _user(x_user_id, user_id))
+    if job["status"] not in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}.")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=job["error"] or f"Job {job['status']}.")
+    return job["result"]
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, user_id: str = None, x_user_id: str = Header(None)):
+    from app.utils.job_queue import get_job_runner
+    _job_for(job_id, _user(x_user_id, user_id))
+    if not get_job_runner().cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished.")
+    return {"id": job_id, "cancelled": True}
@@ -1,14 +1,31 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
 from termcolor import cprint
 
 router = APIRouter()
 
-@router.post("/lp/analyze")
-def analyze_lp_transactions():
+@router.post("/analyze")
+async def analyze_lp_transactions(request: Request):
+    """
+    LP positions per pool from add/remove/collect/swap events (`lp_transactions`). With a
+    `user_id` the events are applied on top of that user's stored positions (`reset` starts over).
+    """
     try:
-        cprint("[INFO] LP (liquidity pool) transaction analysis started.", "cyan")
-        # Placeholder: Implement LP transaction analysis logic
-        return {"message": "LP transaction analysis (to be implemented)"}
+        from app.services.lp_tracker import analyze_lp_events, get_lp_tracker
+        data = await request.json()
+        lp_transactions = data.get("lp_transactions", [])
+        user_id = data.get("user_id")
+        if not isinstance(lp_transactions, list):
+            raise HTTPException(status_code=400, detail="lp_transactions must be a list.")
+        cprint(f"[INFO] LP (liquidity pool) transaction analysis started: {len(lp_transactions)} events.", "cyan")
+        if not user_id:
+            return await asyncio.to_thread(analyze_lp_events, lp_transactions)
+        tracker = get_lp_tracker()
+        if data.get("reset"):
+            await asyncio.to_thread(tracker.reset, user_id)
+        return await asyncio.to_thread(tracker.apply, user_id, lp_transactions)
+    except HTTPException:
+        raise
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="LP analysis failed.")
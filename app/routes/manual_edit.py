@@ -1,14 +1,40 @@
-from fastapi import APIRouter, HTTPException
+import time
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
 from termcolor import cprint
 
 router = APIRouter()
 
 @router.put("/transactions/manual_edit")
-def manual_edit_transaction():
+async def manual_edit_transaction(request: Request):
+    """
+    Edit one stored transaction. Body: {"user_id", "chain", "address", "tx_id", "changes": {...}}.
+    Realized gains for the user are recomputed incrementally: only the edited assets, from
+    the last checkpoint before the edit.
+    """
     try:
-        cprint("[INFO] Manual transaction edit endpoint hit.", "cyan")
-        # Placeholder: Implement manual edit logic
-        return {"message": "Manual transaction edit (to be implemented)"}
+        from app.services.tax_ledger import get_tax_ledger
+        from app.utils.tx_store import get_store
+        body = await request.json()
+        user_id = body.get("user_id", "default")
+        chain, address, tx_id = body.get("chain"), body.get("address"), body.get("tx_id")
+        changes = body.get("changes") or {}
+        if not chain or not address or tx_id is None or not changes:
+            raise HTTPException(status_code=400, detail="chain, address, tx_id and changes are required.")
+        cprint(f"[INFO] Manual edit of {chain}:{address}:{tx_id} ({', '.join(sorted(changes))}).", "cyan")
+        started = time.perf_counter()
+        try:
+            edited = await asyncio.to_thread(get_store().update_transaction, chain, address, tx_id, changes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if edited is None:
+            raise HTTPException(status_code=404, detail="Transaction not found.")
+        recomputed = await asyncio.to_thread(get_tax_ledger().refresh_all, user_id)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        cprint(f"[INFO] Manual edit applied; tax state refreshed in {elapsed_ms:.1f} ms.", "cyan")
+        return {"transaction": edited[1], "recomputed": recomputed, "elapsed_ms": round(elapsed_ms, 1)}
+    except HTTPException:
+        raise
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Manual edit failed.")
@@ -0,0 +1,9 @@
+from fastapi import APIRouter, Response
+
+router = APIRouter()
+
+@router.get("/metrics")
+def metrics():
+    """Request, upstream, token and cache metrics in the Prometheus text format."""
+    from app.utils.metrics import CONTENT_TYPE, REGISTRY
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,92 @@
+import pkgutil
+import importlib
+from fastapi import APIRouter
+from termcolor import cprint
+
+# Every route module under app/routes and the prefix it is mounted at, in registration order.
+# Route modules import their services inside the handlers, so registering a router only
+# costs FastAPI itself; service modules (httpx, numpy, SQLite stores) load on first request.
+ROUTERS = [
+    ("health", ""),
+    ("auth", ""),
+    ("wallet", ""),
+    ("exchange", ""),
+    ("transactions", ""),
+    ("classification", ""),
+    ("manual_edit", ""),
+    ("audit", ""),
+    ("tax", ""),
+    ("report", ""),
+    ("lp", "/lp"),
+    ("ai", ""),
+    ("ai_nft", "/ai"),
+    ("ai_tax", "/ai"),
+    ("ai_search", "/ai"),
+    ("ai_defi", "/ai"),
+    ("lp_ai", "/lp"),
+    ("jobs", ""),
+    ("metrics", ""),
+]
+
+# Modules that live in app/routes but are not route modules.
+NOT_ROUTES = {"registry"}
+
+
+def discover_route_modules():
+    """Names of the modules in the app.routes package."""
+    import app.routes
+    return sorted(info.name for info in pkgutil.iter_modules(app.routes.__path__) if info.name not in NOT_ROUTES)
+
+
+def load_router(module: str) -> APIRouter:
+    router = getattr(importlib.import_module(f"app.routes.{module}"), "router", None)
+    if not isinstance(router, APIRouter):
+        raise TypeError(f"app.routes.{module} has no APIRouter named 'router'.")
+    return router
+
+
+def register_routers(app, routers=ROUTERS):
+    """Include every router in the table on `app`."""
+    for module, prefix in routers:
+        app.include_router(load_router(module), prefix=prefix)
+    unregistered = set(discover_route_modules()) - {module for module, _ in routers}
+    if unregistered:
+        cprint(f"[WARN] Route modules not in the router table: {', '.join(sorted(unregistered))}", "yellow")
+
+
+def route_templates(routers=ROUTERS):
+    """
+    Full path template (prefix included) of every route in the table, keyed by id() of the
+    route object the router holds. FastAPI puts that object in scope["route"], with the path it
+    was declared with, not the one it is mounted at.
+    """
+    templates = {}
+    for module, prefix in routers:
+        for route in load_router(module).routes:
+            if getattr(route, "path", None) is not None:
+                templates[id(route)] = prefix + route.path
+    return templates
+
+
+def check_routers(routers=ROUTERS):
+    """
+    Problems with the router table: modules that do not import or have no router, route
+    modules missing from the table, and method + path pairs registered twice. Empty if all is well.
+    """
+    problems = []
+    seen = {}
+    for module, prefix in routers:
+        try:
+            router = load_router(module)
+        except Exception as e:
+            problems.append(f"{module}: {e}")
+            continue
+        for route in router.routes:
+            for method in sorted(getattr(route, "methods", None) or ()):
+                key = (method, prefix + route.path)
+                if key in seen:
+                    problems.append(f"{method} {prefix + route.path} is registered by both {seen[key]} and {module}")
+                seen[key] = module
+    listed = {module for module, _ in routers}
+    problems += [f"{module}: route module is not in the router table" for module in discover_route_modules() if module not in listed]
+    return problems
@@ -1,14 +1,47 @@
+import os
+import asyncio
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
 from termcolor import cprint
 
 router = APIRouter()
 
 @router.get("/report/generate")
-def generate_report():
+async def generate_report(user_id: str = "default", format: str = None, method: str = "fifo", year: int = None):
+    """
+    Without `format`: holdings summary. With `format` = csv | form8949 | pdf: realized-gains
+    export for `year` (default all years), streamed as it is generated and cached per data version.
+    """
     try:
+        from app.services.cost_basis import METHODS
+        from app.services.report_service import (REPORT_FORMATS, build_report_summary, iter_and_cache,
+                                                 iter_report, report_cache_path)
+        from app.services.tax_ledger import get_tax_ledger
         cprint("[INFO] Report generation started.", "cyan")
-        # Placeholder: Implement report generation logic (PDF, CSV, IRS forms)
-        return {"message": "Report generation (to be implemented)"}
+        if format is None:
+            return await asyncio.to_thread(build_report_summary, user_id)
+        report_format, method = format.lower(), method.lower()
+        if report_format not in REPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'. Use one of {', '.join(REPORT_FORMATS)}.")
+        if method not in METHODS:
+            raise HTTPException(status_code=400, detail=f"Unsupported method '{method}'.")
+        ledger = get_tax_ledger()
+        await asyncio.to_thread(ledger.refresh, user_id, method)
+        path = report_cache_path(user_id, report_format, method, year, ledger.data_version(user_id, year))
+        media_type, extension = REPORT_FORMATS[report_format]
+        filename = f"{report_format}_{year or 'all'}_{method}.{extension}"
+        from app.utils.metrics import CACHE_LOOKUPS
+        cached = os.path.exists(path)
+        CACHE_LOOKUPS.inc(cache="report", result="hit" if cached else "miss")
+        if cached:
+            cprint(f"[INFO] Serving cached {report_format} report for {user_id}.", "cyan")
+            return FileResponse(path, media_type=media_type, filename=filename)
+        chunks = iter_and_cache(iter_report(ledger, user_id, report_format, method, year), path)
+        # A sync generator: Starlette pulls it in a worker thread, so the event loop stays free.
+        return StreamingResponse(chunks, media_type=media_type,
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    except HTTPException:
+        raise
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Report generation failed.")
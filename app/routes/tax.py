@@ -1,14 +1,44 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
 from termcolor import cprint
 
 router = APIRouter()
 
 @router.post("/tax/calculate")
-def calculate_tax():
+async def calculate_tax(request: Request):
+    """
+    Deterministic realized gains. Body: {"method": "fifo"|"lifo"|"hifo"|"spec_id", and either
+    "transactions": [...] or "user_id" to use every stored wallet of that user}. Stored wallets
+    go through the incremental tax ledger, so repeat calls only replay assets changed since.
+    """
     try:
-        cprint("[INFO] Tax calculation started.", "cyan")
-        # Placeholder: Implement tax calculation logic
-        return {"message": "Tax calculation (to be implemented)"}
+        from app.services.cost_basis import METHODS
+        from app.services.parallel_gains import calculate_batch_gains
+        from app.services.tax_ledger import get_tax_ledger
+        from app.services.transfer_matcher import find_transfer_pairs
+        from app.utils.price_oracle import get_price_oracle
+        from app.utils.transaction_batch import TransactionBatch
+        body = await request.json()
+        method = body.get("method", "fifo").lower()
+        if method not in METHODS:
+            raise HTTPException(status_code=400, detail=f"Unsupported method '{method}'.")
+        cprint(f"[INFO] Tax calculation started ({method}).", "cyan")
+        if "transactions" in body:
+            owned = body.get("addresses", [])
+            transactions = body["transactions"]
+            # Legs of transfers between the user's own accounts are not taxable.
+            pairs = await asyncio.to_thread(find_transfer_pairs, transactions, owned)
+            matched = {i for out_index, in_index, _ in pairs for i in (out_index, in_index)}
+            batch = TransactionBatch.from_dicts([tx for i, tx in enumerate(transactions) if i not in matched])
+            await asyncio.to_thread(get_price_oracle().price_batch, batch)
+            # Large portfolios are sharded by asset across the tax process pool.
+            result = await asyncio.to_thread(calculate_batch_gains, batch, owned, method)
+            result["internal_transfers"] = len(pairs)
+        else:
+            result = await asyncio.to_thread(get_tax_ledger().result, body.get("user_id", "default"), method)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Tax calculation failed.")
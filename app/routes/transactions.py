@@ -4,14 +4,31 @@ from termcolor import cprint
 router = APIRouter()
 
 @router.post("/transactions/import")
-def import_transactions(chain: str, file: UploadFile = File(None)):
+def import_transactions(chain: str, file: UploadFile = File(None), account: str = "import", user_id: str = "default"):
     try:
         cprint(f"[INFO] Importing transactions for chain: {chain}.", "cyan")
-        # Placeholder: Implement NFT, DeFi, ordinals transaction ingestion logic
         if file:
-            content = file.file.read().decode("utf-8")
-            cprint(f"[INFO] Transaction file received. Length: {len(content)}", "green")
+            from app.utils.csv_importer import import_csv
+            # Canonical-schema CSV (id, timestamp, type, token, amount, from, to, price_usd, ...)
+            result = import_csv(file.file, chain, account, user_id, total_bytes=file.size, profile_name="generic")
+            cprint(f"[INFO] Transaction import finished: {result['rows']} rows, {result['imported']} new.", "green")
+            return {"message": f"Transactions imported for {chain}", **result}
         return {"message": f"Transactions import for {chain} started (to be implemented)"}
+    except ValueError as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Transaction import failed.")
+
+
+@router.post("/transactions/match_transfers")
+def match_transfers(user_id: str = "default"):
+    """Pair transfers between the user's own wallets and exchange accounts; matched legs become non-taxable."""
+    try:
+        from app.services.transfer_matcher import match_user_transfers
+        cprint(f"[INFO] Transfer matching started for {user_id}.", "cyan")
+        return match_user_transfers(user_id)
+    except Exception as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=500, detail="Transfer matching failed.")
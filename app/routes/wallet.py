@@ -1,25 +1,80 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
 from termcolor import cprint
 
 router = APIRouter()
 
 @router.post("/wallet/import")
-def import_wallet(address: str, chain: str):
+async def import_wallet(request: Request, address: str, chain: str, user_id: str = "default"):
+    from app.utils.rate_limiter import ProviderError
     try:
+        from app.utils.cancellation import cancel_on_disconnect
+        from app.utils.fetch_wallet_transactions import SUPPORTED_CHAINS, UnsupportedChainError, normalize_chain
+        from app.utils.tx_store import get_store
+        from app.utils.wallet_sync import sync_wallet
         cprint(f"[INFO] Importing wallet {address} on {chain}.", "cyan")
-        # Placeholder: Implement wallet import logic for all major chains
-        return {"message": f"Wallet {address} imported for {chain} (to be implemented)"}
+        chain = normalize_chain(chain)
+        if chain not in SUPPORTED_CHAINS:
+            raise UnsupportedChainError(chain)
+        get_store().add_wallet(user_id, chain, address)
+        result = await cancel_on_disconnect(request, sync_wallet(address, chain))
+        return {"message": f"Wallet {address} imported for {chain}", **result}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProviderError as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Wallet import failed.")
 
 @router.post("/wallet/fetch_transactions")
-def fetch_transactions(address: str, chain: str = "eth"):
+async def fetch_transactions(request: Request, address: str, chain: str = "eth"):
+    from app.utils.rate_limiter import ProviderError
     try:
-        from app.utils.fetch_wallet_transactions import fetch_wallet_transactions
+        from app.utils.cancellation import cancel_on_disconnect
+        from app.utils.fetch_wallet_transactions import normalize_chain
+        from app.utils.tx_store import get_store
+        from app.utils.wallet_sync import sync_wallet
         cprint(f"[INFO] Fetching transactions for {address} on {chain}.", "cyan")
-        txs = fetch_wallet_transactions(address, chain)
-        return {"transactions": txs}
+        chain = normalize_chain(chain)
+        result = await cancel_on_disconnect(request, sync_wallet(address, chain))
+        txs = await asyncio.to_thread(get_store().get_transactions, chain, address)
+        return {"transactions": txs, "new_transactions": result["inserted"]}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProviderError as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        cprint(f"[ERROR] {str(e)}", "red")
+        raise HTTPException(status_code=500, detail="Fetch transactions failed.")
+
+@router.post("/wallet/fetch_transactions_batch")
+async def fetch_transactions_batch(request: Request):
+    try:
+        from app.utils.cancellation import cancel_on_disconnect
+        from app.utils.fetch_wallet_transactions import normalize_chain
+        from app.utils.tx_store import get_store
+        from app.utils.wallet_sync import sync_wallets
+        body = await request.json()
+        wallets = [(w["address"], normalize_chain(w.get("chain", "eth"))) for w in body.get("wallets", [])]
+        cprint(f"[INFO] Fetching transactions for {len(wallets)} wallets.", "cyan")
+        synced = await cancel_on_disconnect(request, sync_wallets(wallets))
+        store = get_store()
+        results = [
+            {**result, "transactions": await asyncio.to_thread(store.get_transactions, result["chain"], result["address"])}
+            for result in synced
+        ]
+        return {"wallets": results}
+    except HTTPException:
+        raise
     except Exception as e:
         cprint(f"[ERROR] {str(e)}", "red")
         raise HTTPException(status_code=500, detail="Fetch transactions failed.")
@@ -0,0 +1,186 @@
+import os
+import json
+import random
+import asyncio
+from app.services.classification_memo import align_results
+from app.utils.log import get_logger
+
+log = get_logger(__name__)
+
+# Rough prompt budget per chunk; ~4 characters per token for JSON-ish payloads.
+DEFAULT_INPUT_TOKEN_BUDGET = int(os.getenv("AI_CHUNK_INPUT_TOKENS", 3000))
+DEFAULT_MAX_ITEMS = int(os.getenv("AI_CHUNK_MAX_ITEMS", 40))
+OUTPUT_TOKENS_PER_ITEM = 80
+OUTPUT_TOKENS_OVERHEAD = 256
+MAX_OUTPUT_TOKENS = 4096
+DEFAULT_MAX_WORKERS = int(os.getenv("AI_MAX_CONCURRENCY", 4))
+DEFAULT_RETRIES = 2
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(obj) -> int:
+    return len(json.dumps(obj, default=str)) // CHARS_PER_TOKEN + 1
+
+
+def output_token_budget(item_count: int) -> int:
+    """max_tokens for a chunk: enough room for one JSON object per transaction."""
+    return min(MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_OVERHEAD + item_count * OUTPUT_TOKENS_PER_ITEM)
+
+
+def chunk_transactions(transactions, input_budget: int = DEFAULT_INPUT_TOKEN_BUDGET, max_items: int = DEFAULT_MAX_ITEMS):
+    """
+    Split transactions into consecutive chunks whose estimated prompt size stays under
+    `input_budget` tokens and whose output fits `max_items` result objects.
+    A single oversized transaction gets a chunk of its own. Returns (start_index, chunk) pairs.
+    """
+    chunks = []
+    start, current, used = 0, [], 0
+    for index, tx in enumerate(transactions):
+        cost = estimate_tokens(tx)
+        if current and (used + cost > input_budget or len(current) >= max_items):
+            chunks.append((start, current))
+            start, current, used = index, [], 0
+        current.append(tx)
+        used += cost
+    if current:
+        chunks.append((start, current))
+    return chunks
+
+
+def _has_errors(results) -> bool:
+    return any(isinstance(item, dict) and "error" in item for item in results)
+
+
+async def _run_chunk(chunk, classify_chunk, retries: int, semaphore):
+    """Classify one chunk, retrying it on its own when the response is an error or does not map back."""
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(min(8, 0.5 * 2 ** attempt) + random.random() / 2)
+        async with semaphore:
+            results = await classify_chunk(chunk)
+        if isinstance(results, dict) and "error" in results:
+            error = results["error"]
+            continue
+        aligned = align_results(chunk, results)
+        if aligned is None:
+            error = "AI response did not cover every transaction in the chunk"
+            continue
+        if _has_errors(aligned) and attempt < retries:
+            error = "AI returned errors for part of the chunk"
+            continue
+        return aligned
+    log.error("chunk failed", extra={"transactions": len(chunk), "attempts": retries + 1, "error": str(error)})
+    return [{"error": error} for _ in chunk]
+
+
+async def classify_in_chunks(transactions, classify_chunk, input_budget: int = DEFAULT_INPUT_TOKEN_BUDGET,
+                             max_items: int = DEFAULT_MAX_ITEMS, max_workers: int = DEFAULT_MAX_WORKERS,
+                             retries: int = DEFAULT_RETRIES):
+    """
+    Classify a transaction list in token-budgeted chunks dispatched concurrently, with at most
+    `max_workers` chunks in flight. `classify_chunk(chunk)` is awaited and returns a result list.
+    The reassembled output has exactly one result per input transaction, in input order
+    (failed chunks get error items).
+    """
+    transactions = list(transactions)
+    chunks = chunk_transactions(transactions, input_budget, max_items)
+    if not chunks:
+        return []
+    log.info("dispatching chunks", extra={"transactions": len(transactions), "chunks": len(chunks), "concurrency": max_workers})
+    semaphore = asyncio.Semaphore(max_workers)
+    chunk_results = await asyncio.gather(*(_run_chunk(chunk, classify_chunk, retries, semaphore) for _, chunk in chunks))
+    results = [None] * len(transactions)
+    for (start, _), aligned in zip(chunks, chunk_results):
+        results[start:start + len(aligned)] = aligned
+    return results
+
+
+def _id_slots(transactions):
+    """{str(id): position} when every transaction has a distinct id, else None (match by position)."""
+    slots = {}
+    for position, tx in enumerate(transactions):
+        tx_id = tx.get("id") if isinstance(tx, dict) else None
+        if tx_id is None or str(tx_id) in slots:
+            return None
+        slots[str(tx_id)] = position
+    return slots
+
+
+async def _stream_chunk(start, chunk, stream_chunk, retries: int, semaphore, emit):
+    """
+    Stream one chunk's results to `emit(index, result)` as they arrive. Transactions the stream
+    did not cover (truncated output, a dropped connection, error items) are retried on their own.
+    """
+    pending = list(range(len(chunk)))
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(min(8, 0.5 * 2 ** attempt) + random.random() / 2)
+        subset = [chunk[i] for i in pending]
+        slots = _id_slots(subset)
+        covered = set()
+        position = 0
+        async with semaphore:
+            try:
+                async for item in stream_chunk(subset):
+                    slot = position if slots is None else slots.get(str(item.get("id")) if isinstance(item, dict) else None)
+                    position += 1
+                    if slot is None or slot >= len(subset) or slot in covered:
+                        continue
+                    if isinstance(item, dict) and "error" in item:
+                        error = item["error"]
+                        continue
+                    covered.add(slot)
+                    emit(start + pending[slot], item)
+            except Exception as e:
+                error = str(e)
+        pending = [index for slot, index in enumerate(pending) if slot not in covered]
+        if not pending:
+            return
+        error = error or "AI response did not cover every transaction in the chunk"
+    log.error("chunk failed", extra={"failed": len(pending), "transactions": len(chunk), "attempts": retries + 1, "error": str(error)})
+    for index in pending:
+        emit(start + index, {"error": error})
+
+
+async def stream_in_chunks(transactions, stream_chunk, input_budget: int = DEFAULT_INPUT_TOKEN_BUDGET,
+                           max_items: int = DEFAULT_MAX_ITEMS, max_workers: int = DEFAULT_MAX_WORKERS,
+                           retries: int = DEFAULT_RETRIES):
+    """
+    Streamed classify_in_chunks: yields (index, result) pairs in arrival order, from up to
+    `max_workers` chunks streaming at once. `stream_chunk(chunk)` is an async iterator of result
+    items, matched back by echoed id or else by position. Every transaction gets exactly one
+    result (an error item if it could not be classified).
+    """
+    transactions = list(transactions)
+    chunks = chunk_transactions(transactions, input_budget, max_items)
+    if not chunks:
+        return
+    log.info("streaming chunks", extra={"transactions": len(transactions), "chunks": len(chunks), "concurrency": max_workers})
+    semaphore = asyncio.Semaphore(max_workers)
+    queue = asyncio.Queue()
+    finished = object()
+
+    async def worker(start, chunk):
+        try:
+            await _stream_chunk(start, chunk, stream_chunk, retries, semaphore, lambda index, result: queue.put_nowait((index, result)))
+        except Exception as e:
+            log.error("chunk stream failed", extra={"error": str(e)})
+            for index in range(start, start + len(chunk)):
+                queue.put_nowait((index, {"error": str(e)}))
+        finally:
+            queue.put_nowait(finished)
+
+    tasks = [asyncio.ensure_future(worker(start, chunk)) for start, chunk in chunks]
+    try:
+        running = len(tasks)
+        while running:
+            entry = await queue.get()
+            if entry is finished:
+                running -= 1
+            else:
+                yield entry
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from app.utils.log import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_CACHE_PATH = "data/ai_cache.db"
+DEFAULT_MEMORY_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_DISK_MAX_BYTES = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ai_cache_access ON ai_cache (last_access);
+"""
+
+
+def cache_key(service: str, model: str, transactions, params=None) -> str:
+    """Content hash of a request: service, model, transactions and parameters, with dict keys normalized."""
+    payload = json.dumps([service, model, transactions, params or {}], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(result) -> bool:
+    """Error responses are never cached, so a transient failure is retried next time."""
+    if isinstance(result, dict):
+        return "error" not in result
+    if isinstance(result, list):
+        return not any(isinstance(item, dict) and "error" in item for item in result)
+    return result is not None
+
+
+class AICache:
+    """
+    Two-tier cache for AI responses: an in-process LRU in front of an SQLite table.
+    Entries expire after `ttl` seconds; the disk tier evicts least recently used entries
+    once it grows past `max_bytes`.
+    """
+
+    def __init__(self, path: str = None, memory_entries: int = None, ttl: int = None, max_bytes: int = None):
+        self.path = path or os.getenv("AI_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.memory_entries = memory_entries or int(os.getenv("AI_CACHE_MEMORY_ENTRIES", DEFAULT_MEMORY_ENTRIES))
+        self.ttl = ttl or int(os.getenv("AI_CACHE_TTL", DEFAULT_TTL_SECONDS))
+        self.max_bytes = max_bytes or int(os.getenv("AI_CACHE_MAX_BYTES", DEFAULT_DISK_MAX_BYTES))
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get(self, key: str):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[1]
+                del self.memory[key]
+            row = self.conn.execute("SELECT value, expires_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                self.counters["misses"] += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE ai_cache SET last_access = ? WHERE key = ?", (now, key))
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self.counters["disk_hits"] += 1
+            return value
+
+    def set(self, key: str, value):
+        now = time.time()
+        expires_at = now + self.ttl
+        encoded = json.dumps(value)
+        with self.lock:
+            self._remember(key, expires_at, value)
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ai_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, len(encoded), expires_at, now),
+                )
+                self._evict_disk(now)
+            self.counters["stores"] += 1
+
+    def _remember(self, key, expires_at, value):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self.conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (now,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_cache").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self.conn.execute("SELECT key, size FROM ai_cache ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                self.memory.pop(key, None)
+                self.counters["evictions"] += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+            }
+
+
+_cache = None
+
+
+def _cache_samples(cache):
+    stats = cache.stats()
+    yield "ai_cache_lookups_total", "counter", "AI response cache lookups by result.", [
+        ({"result": result}, stats[result]) for result in ("memory_hits", "disk_hits", "misses")
+    ]
+    yield "ai_cache_evictions_total", "counter", "AI response cache disk evictions.", [({}, stats["evictions"])]
+    yield "ai_cache_hit_rate", "gauge", "AI response cache hit rate since start.", [({}, stats["hit_rate"])]
+
+
+def get_ai_cache() -> AICache:
+    global _cache
+    if _cache is None:
+        from app.utils.metrics import REGISTRY
+        _cache = AICache()
+        REGISTRY.collector(lambda: _cache_samples(_cache))
+    return _cache
+
+
+async def cached_call(service: str, model: str, transactions, params, call, cacheable=is_cacheable):
+    """
+    Return the cached response for (service, model, transactions, params), or await `call()`
+    and cache its result if `cacheable(result)` (by default: it is not an error). Cache reads
+    and writes run in a worker thread, so SQLite I/O and disk eviction stay off the event loop.
+    """
+    cache = get_ai_cache()
+    key = cache_key(service, model, transactions, params)
+    result = await asyncio.to_thread(cache.get, key)
+    if result is not None:
+        log.debug("ai cache hit", extra={"service": service})
+        return result
+    result = await call()
+    if cacheable(result):
+        await asyncio.to_thread(cache.set, key, result)
+    return result
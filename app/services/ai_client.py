@@ -0,0 +1,85 @@
+import os
+import json
+import asyncio
+from app.services.ai_cache import cache_key, cached_call, get_ai_cache, is_cacheable
+from app.services.classification_memo import align_results
+from app.services.model_router import get_model_router, model_pool, route_content
+from app.utils.json_stream import JsonArrayParser
+from app.utils.log import get_logger
+
+log = get_logger(__name__)
+
+
+def api_key_error():
+    """The error message to return when no OpenRouter key is configured, else None."""
+    if not os.getenv("OPENROUTER_API_KEY"):
+        log.error("OPENROUTER_API_KEY not set")
+        return "API key not set."
+    return None
+
+
+def _cacheable(result, transactions) -> bool:
+    """
+    Errors are never cached, and neither is an array answer that does not map back onto the
+    transactions it classifies: a retry of the same chunk would only get it back from the cache.
+    """
+    if not is_cacheable(result):
+        return False
+    return not (transactions and isinstance(result, list)) or align_results(transactions, result) is not None
+
+
+async def json_completion(service: str, task_complexity: str, messages, transactions, cache_params,
+                          max_tokens: int = None, temperature: float = None):
+    """
+    One routed, hedged, cached completion parsed as JSON. Returns the parsed value, or
+    {"error": ...} (with the raw answer when it was not valid JSON).
+    """
+
+    async def request():
+        try:
+            model, answer = await route_content(task_complexity, messages, max_tokens=max_tokens, temperature=temperature,
+                                                json_output=True, hedge=True, service=service)
+            log.debug("completion answered", extra={"service": service, "model": model})
+        except Exception as e:
+            log.error("completion failed", extra={"service": service, "error": str(e)})
+            return {"error": str(e)}
+        try:
+            return json.loads(answer)
+        except ValueError:
+            return {"error": "AI response not valid JSON", "raw": answer}
+
+    # Keyed on the model pool rather than the routed pick, so repeats hit the cache.
+    return await cached_call(service, ",".join(model_pool(task_complexity)), transactions, cache_params, request,
+                             lambda result: _cacheable(result, transactions))
+
+
+async def stream_json_items(service: str, task_complexity: str, messages, transactions, cache_params,
+                            max_tokens: int = None, temperature: float = None):
+    """
+    Streamed json_completion for answers that are a JSON array: yields each element as soon
+    as it is complete. A complete array is cached under the same key as json_completion, and
+    a cached answer is replayed. A failed or truncated stream ends after the elements it completed.
+    """
+    cache = get_ai_cache()
+    key = cache_key(service, ",".join(model_pool(task_complexity)), transactions, cache_params)
+    cached = await asyncio.to_thread(cache.get, key)
+    if isinstance(cached, list):
+        log.debug("ai cache hit", extra={"service": service})
+        for item in cached:
+            yield item
+        return
+    parser = JsonArrayParser()
+    items = []
+    try:
+        async for delta in get_model_router().stream(task_complexity, messages, max_tokens=max_tokens,
+                                                     temperature=temperature, json_output=True, service=service):
+            for item in parser.feed(delta):
+                items.append(item)
+                yield item
+    except Exception as e:
+        log.error("stream failed", extra={"service": service, "items": len(items), "error": str(e)})
+        return
+    if not parser.finished:
+        log.warning("stream ended before the JSON array closed", extra={"service": service, "items": len(items)})
+    elif _cacheable(items, transactions):
+        await asyncio.to_thread(cache.set, key, items)
@@ -1,8 +1,13 @@
 import os
 from termcolor import cprint
-import requests
+from app.services.ai_batching import classify_in_chunks, output_token_budget, stream_in_chunks
+from app.services.classification_memo import classify_with_memo, stream_with_memo
+from app.services.ai_client import api_key_error, json_completion, stream_json_items
 
-def ai_classify_defi_protocols(transactions):
+# Bump when the prompt or output schema changes so memoized results are recomputed.
+CLASSIFIER_VERSION = "1"
+
+async def ai_classify_defi_protocols(transactions):
     """
     Uses OpenRouter API to classify DeFi protocol and action for each transaction.
     Returns a list of dicts with protocol, action, and explanation.
@@ -11,39 +16,37 @@ def ai_classify_defi_protocols(transactions):
     if not OPENROUTER_API_KEY:
         cprint("[ERROR] OPENROUTER_API_KEY not set.", "red")
         return [{"error": "No API key set"}]
+    return await classify_with_memo(
+        "defi_classification", CLASSIFIER_VERSION, transactions,
+        lambda unseen: classify_in_chunks(unseen, _classify_defi_batch),
+    )
+
+
+async def stream_classify_defi_protocols(transactions):
+    """Streamed ai_classify_defi_protocols: yields (index, result) as each result is parsed."""
+    error = api_key_error()
+    if error:
+        raise RuntimeError(error)
+    results = stream_with_memo(
+        "defi_classification", CLASSIFIER_VERSION, transactions,
+        lambda unseen: stream_in_chunks(unseen, lambda chunk: _classify_defi_batch(chunk, stream=True)),
+    )
+    async for entry in results:
+        yield entry
+
+
+def _classify_defi_batch(transactions, stream=False):
+    """Classify one chunk of transactions that have no memoized result yet (a parsed JSON list, or its items streamed)."""
+    max_tokens = output_token_budget(len(transactions))
     prompt = (
         "You are a DeFi protocol classification assistant. For each transaction, identify the DeFi protocol (e.g., Uniswap, Aave, Compound, Lido, etc.), "
         "the action (swap, deposit, borrow, stake, etc.), and provide a brief explanation. "
-        "Output a JSON list of objects with keys: protocol, action, explanation."
+        "Output a JSON list of objects with keys: id, protocol, action, explanation. Echo each input transaction's id and return one object per transaction, in input order."
     )
     messages = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": f"Classify these transactions: {transactions}"}
     ]
-    try:
-        cprint("[INFO] Requesting DeFi protocol classification via OpenRouter API...", "cyan")
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o",
-                "messages": messages,
-                "max_tokens": 1024,
-                "temperature": 0.3
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        answer = response.json()["choices"][0]["message"]["content"]
-        import json
-        try:
-            result = json.loads(answer)
-        except Exception:
-            result = [{"error": "AI response not valid JSON", "raw": answer}]
-        return result
-    except Exception as e:
-        cprint(f"[ERROR] DeFi protocol classification failed: {e}", "red")
-        return [{"error": str(e)}]
+    call = stream_json_items if stream else json_completion
+    return call("defi_classification", "complex", messages, transactions,
+                {"prompt": prompt, "max_tokens": max_tokens, "temperature": 0.3}, max_tokens=max_tokens, temperature=0.3)
@@ -1,52 +1,35 @@
-import os
-import random
-import requests
+import json
+from app.services.ai_cache import cached_call
+from app.services.ai_client import api_key_error
+from app.services.model_router import model_pool, route_content
 from termcolor import cprint
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 
-FREE_MODELS = [
-    "deepseek-chat",
-    "gemini-pro",
-]
-PAID_MODELS = [
-    "gpt-4o",
-    "claude-3-opus",
-]
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
-
-
-def select_model(task_complexity: str = "simple") -> str:
-    if task_complexity == "simple":
-        return random.choice(FREE_MODELS)
-    return random.choice(PAID_MODELS)
-
-
-def ai_analyze_lp_transactions(lp_transactions, task_complexity="simple"):
-    if not OPENROUTER_API_KEY:
-        cprint("[ERROR] OPENROUTER_API_KEY not set.", "red")
-        return {"error": "API key not set."}
-    model = select_model(task_complexity)
+async def ai_analyze_lp_transactions(lp_transactions, task_complexity="simple"):
+    """
+    Positions, per-event results and totals are computed locally (lp_tracker); the model only
+    explains them. Without an API key, or if the model fails, the computed result is still returned.
+    """
+    from app.services.lp_tracker import analyze_lp_events
+    result = analyze_lp_events(lp_transactions)
+    if api_key_error():
+        return {**result, "explanation": None}
     prompt = (
-        "Analyze the following DeFi liquidity pool (LP) transactions. For each, classify the action (add/remove liquidity, swap, farm, stake, borrow, lend, etc.), identify tokens involved, and summarize the tax implications. Return a JSON list with 'action', 'tokens', and 'tax_summary' for each transaction. Transactions: "
-        + str(lp_transactions)
+        "Explain these DeFi liquidity pool (LP) positions to a taxpayer in plain language: what each "
+        "pool's cost basis, realized gain, fee income and unrealized result mean for their taxes. "
+        "The numbers are already computed; do not recompute or change them. Positions: "
+        + json.dumps({"positions": result["positions"], "totals": result["totals"]})
     )
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
-    try:
-        cprint(f"[INFO] Sending LP analysis request to OpenRouter with model: {model}", "cyan")
-        resp = requests.post(OPENROUTER_URL, headers=headers, json=data, timeout=30)
-        resp.raise_for_status()
-        result = resp.json()
-        return result
-    except Exception as e:
-        cprint(f"[ERROR] AI LP analysis failed: {e}", "red")
-        return {"error": str(e)}
+
+    async def request():
+        try:
+            model, answer = await route_content(task_complexity, [{"role": "user", "content": prompt}], service="lp_analysis")
+            cprint(f"[INFO] LP explanation answered by OpenRouter model: {model}", "cyan")
+            return {"explanation": answer}
+        except Exception as e:
+            cprint(f"[ERROR] AI LP analysis failed: {e}", "red")
+            return {"error": str(e)}
+
+    # Keyed on the model pool rather than the routed pick, so repeats hit the cache.
+    answer = await cached_call("lp_analysis", ",".join(model_pool(task_complexity)), [], {"prompt": prompt}, request)
+    return {**result, "explanation": answer.get("explanation")}
@@ -1,49 +1,53 @@
 import os
+import json
 from termcolor import cprint
-import requests
+from app.services.ai_client import json_completion
 
-def ai_search_transactions(transactions, query):
+FILTER_SCHEMA = (
+    '{"tokens": [symbols], "addresses": [addresses], "types": [transaction types], "protocols": [protocol names], '
+    '"chains": [chains], "start": "YYYY-MM-DD" (inclusive), "end": "YYYY-MM-DD" (exclusive), '
+    '"min_amount": number, "max_amount": number, "min_value_usd": number, "max_value_usd": number, '
+    '"direction": "incoming"|"outgoing"|"internal", "sort": "time_desc"|"time_asc"|"amount_desc"|"amount_asc"}'
+)
+
+
+async def ai_parse_search_query(query, vocabulary=None):
     """
-    Uses OpenRouter API to perform natural language search over transactions.
-    Returns a list of matching transactions with AI explanations.
+    Uses OpenRouter API to translate a natural-language search into a structured filter
+    (see FILTER_SCHEMA). Only the query and a bounded vocabulary of known tokens, types and
+    protocols are sent, never the transactions themselves.
     """
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
     if not OPENROUTER_API_KEY:
         cprint("[ERROR] OPENROUTER_API_KEY not set.", "red")
-        return [{"error": "No API key set"}]
+        return {"error": "No API key set"}
     prompt = (
-        "You are a crypto transaction search assistant. Given a user query and a list of transactions, "
-        "return only the relevant transactions as a JSON list, each with a brief explanation of why it matches. "
-        "If no matches, return an empty list."
+        "You translate crypto transaction search queries into a JSON filter with this schema: "
+        f"{FILTER_SCHEMA}. Omit keys the query does not constrain. "
+        "Prefer values from the known vocabulary. Return only the JSON object."
     )
     messages = [
         {"role": "system", "content": prompt},
-        {"role": "user", "content": f"Query: {query}\nTransactions: {transactions}"}
+        {"role": "user", "content": f"Known vocabulary: {json.dumps(vocabulary or {})}\nQuery: {query}"}
     ]
+
+    cprint("[INFO] Requesting search filter via OpenRouter API...", "cyan")
+    return await json_completion("search_filter", "complex", messages, [], {"prompt": prompt, "query": query, "vocabulary": vocabulary},
+                                 max_tokens=256, temperature=0)
+
+
+async def ai_search_transactions(index, query=None, search_filter=None, limit=100, offset=0):
+    """
+    Search a TransactionIndex. A natural-language `query` is first translated into a filter by
+    the model; an explicit `search_filter` skips the model. The filter runs locally against the index.
+    """
+    if search_filter is None:
+        search_filter = await ai_parse_search_query(query, index.vocabulary())
+        if "error" in search_filter:
+            return search_filter
     try:
-        cprint("[INFO] Requesting transaction search via OpenRouter API...", "cyan")
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o",
-                "messages": messages,
-                "max_tokens": 1024,
-                "temperature": 0.3
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        answer = response.json()["choices"][0]["message"]["content"]
-        import json
-        try:
-            result = json.loads(answer)
-        except Exception:
-            result = [{"error": "AI response not valid JSON", "raw": answer}]
-        return result
-    except Exception as e:
-        cprint(f"[ERROR] Transaction search failed: {e}", "red")
-        return [{"error": str(e)}]
+        found = index.search(search_filter, limit, offset)
+    except (ValueError, TypeError) as e:
+        return {"error": f"Invalid filter: {e}", "filter": search_filter}
+    cprint(f"[INFO] Search matched {found['total']} of {len(index)} transactions.", "cyan")
+    return {"filter": search_filter, **found}
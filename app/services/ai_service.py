@@ -1,56 +1,42 @@
-import os
-import random
-import requests
-from termcolor import cprint
+from app.services.ai_batching import classify_in_chunks, output_token_budget, stream_in_chunks
+from app.services.ai_client import api_key_error, json_completion, stream_json_items
+from app.services.classification_memo import classify_with_memo, stream_with_memo
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+# Bump when the prompt or output schema changes so memoized results are recomputed.
+CLASSIFIER_VERSION = "1"
 
-FREE_MODELS = [
-    "deepseek-chat",
-    "gemini-pro",
-]
-PAID_MODELS = [
-    "gpt-4o",
-    "claude-3-opus",
-]
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+async def ai_classify_transactions(transactions, task_complexity="simple"):
+    """Call OpenRouter API for transaction classification, prioritizing free models."""
+    error = api_key_error()
+    if error:
+        return {"error": error}
+    return await classify_with_memo(
+        "classification", CLASSIFIER_VERSION, transactions,
+        lambda unseen: classify_in_chunks(unseen, lambda chunk: _classify_batch(chunk, task_complexity)),
+    )
 
-def select_model(task_complexity: str = "simple") -> str:
-    """Selects a model based on task complexity and shuffles free models if needed."""
-    if task_complexity == "simple":
-        model = random.choice(FREE_MODELS)
-    else:
-        model = random.choice(PAID_MODELS)
-    return model
 
+async def stream_classify_transactions(transactions, task_complexity="simple"):
+    """Streamed ai_classify_transactions: yields (index, result) as each result is parsed."""
+    error = api_key_error()
+    if error:
+        raise RuntimeError(error)
+    results = stream_with_memo(
+        "classification", CLASSIFIER_VERSION, transactions,
+        lambda unseen: stream_in_chunks(unseen, lambda chunk: _classify_batch(chunk, task_complexity, stream=True)),
+    )
+    async for entry in results:
+        yield entry
 
-def ai_classify_transactions(transactions, task_complexity="simple"):
-    """Call OpenRouter API for transaction classification, prioritizing free models."""
-    if not OPENROUTER_API_KEY:
-        cprint("[ERROR] OPENROUTER_API_KEY not set.", "red")
-        return {"error": "API key not set."}
-    model = select_model(task_complexity)
+
+def _classify_batch(transactions, task_complexity="simple", stream=False):
+    """Classify one chunk of transactions that have no memoized result yet (a parsed JSON list, or its items streamed)."""
     prompt = (
-        "Classify the following crypto transactions by type (trade, staking, LP, NFT, airdrop, etc.) and return a JSON list with a 'type' and 'explanation' for each transaction. "
+        "Classify the following crypto transactions by type (trade, staking, LP, NFT, airdrop, etc.) and return a JSON list with an 'id', 'type' and 'explanation' for each transaction. "
+        "Echo each input transaction's id and return one object per transaction, in input order. "
         "Transactions: " + str(transactions)
     )
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
-    try:
-        cprint(f"[INFO] Sending classification request to OpenRouter with model: {model}", "cyan")
-        resp = requests.post(OPENROUTER_URL, headers=headers, json=data, timeout=30)
-        resp.raise_for_status()
-        result = resp.json()
-        return result
-    except Exception as e:
-        cprint(f"[ERROR] AI classification failed: {e}", "red")
-        return {"error": str(e)}
+    call = stream_json_items if stream else json_completion
+    return call("classification", task_complexity, [{"role": "user", "content": prompt}], transactions,
+                {"prompt": prompt}, max_tokens=output_token_budget(len(transactions)))
@@ -1,46 +1,66 @@
 import os
+import json
+import asyncio
 from termcolor import cprint
-import requests
+from app.services.ai_cache import cached_call
+from app.services.model_router import model_pool, route_content
 
-def ai_generate_tax_summary(transactions, breakdown_by_chain=False, breakdown_by_asset=False):
+def compute_tax_totals(transactions, addresses=None, method="fifo"):
+    """
+    Deterministic gains for the summary prompt: rows are priced from the local price store,
+    then run through the cost-basis engine. The model explains these numbers, never derives them.
+    """
+    from app.services.cost_basis import calculate_gains, events_from_batch
+    from app.utils.price_oracle import get_price_oracle
+    from app.utils.transaction_batch import TransactionBatch
+
+    batch = TransactionBatch.from_dicts(transactions)
+    priced = get_price_oracle().price_batch(batch)
+    events, skipped = events_from_batch(batch, addresses or [])
+    result = calculate_gains(events, method)
+    return {
+        "method": result["method"],
+        "short_term": result["short_term"],
+        "long_term": result["long_term"],
+        "total_gain": result["total_gain"],
+        "by_year": result["by_year"],
+        "disposals": result["disposals"],
+        "priced_from_price_store": priced,
+        "skipped_without_price": skipped,
+    }
+
+
+async def ai_generate_tax_summary(transactions, breakdown_by_chain=False, breakdown_by_asset=False, addresses=None, method="fifo"):
     """
     Generates a plain-English tax summary for the given transactions using OpenRouter API.
-    Returns a summary string and optionally breakdowns.
+    Gains and losses are computed locally (see compute_tax_totals) and passed to the model.
+    Returns a summary string and the computed totals.
     """
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
     if not OPENROUTER_API_KEY:
         cprint("[ERROR] OPENROUTER_API_KEY not set.", "red")
         return {"error": "No API key set"}
+    totals = await asyncio.to_thread(compute_tax_totals, transactions, addresses, method)
     prompt = (
         "You are a crypto tax expert. Analyze the following transactions and generate a plain-English summary of the user's tax position. "
         "Include total gains/losses, taxable events, and key actions. "
+        "Use the computed totals provided exactly as given; do not recalculate gains or losses. "
         + ("Break down by chain. " if breakdown_by_chain else "")
         + ("Break down by asset. " if breakdown_by_asset else "")
         + "Be concise and clear."
     )
     messages = [
         {"role": "system", "content": prompt},
-        {"role": "user", "content": f"Analyze these transactions: {transactions}"}
+        {"role": "user", "content": f"Computed totals: {json.dumps(totals)}\nAnalyze these transactions: {transactions}"}
     ]
-    try:
-        cprint("[INFO] Requesting tax summary via OpenRouter API...", "cyan")
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-4o",
-                "messages": messages,
-                "max_tokens": 1024,
-                "temperature": 0.3
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        answer = response.json()["choices"][0]["message"]["content"]
-        return {"summary": answer}
-    except Exception as e:
-        cprint(f"[ERROR] Tax summary generation failed: {e}", "red")
-        return {"error": str(e)}
+
+    async def request():
+        try:
+            cprint("[INFO] Requesting tax summary via OpenRouter API...", "cyan")
+            _, answer = await route_content("complex", messages, max_tokens=1024, temperature=0.3, service="tax_summary")
+            return {"summary": answer, "totals": totals}
+        except Exception as e:
+            cprint(f"[ERROR] Tax summary generation failed: {e}", "red")
+            return {"error": str(e)}
+
+    return await cached_call("tax_summary", ",".join(model_pool("complex")), transactions, {"prompt": prompt, "totals": totals, "max_tokens": 1024, "temperature": 0.3}, request)
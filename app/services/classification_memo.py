@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from app.utils.log import get_logger
+from app.utils.metrics import CACHE_LOOKUPS
+
+log = get_logger(__name__)
+
+DEFAULT_MEMO_PATH = "data/classifications.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classification_memo (
+    classifier TEXT NOT NULL,
+    version TEXT NOT NULL,
+    tx_key TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    PRIMARY KEY (classifier, version, tx_key)
+);
+"""
+
+# SQLite caps bound parameters per statement; look keys up in slices of this size.
+LOOKUP_SLICE = 500
+
+
+def transaction_key(tx) -> str:
+    """Stable per-transaction key: chain + id when the transaction has an id, else a content hash."""
+    if isinstance(tx, dict) and tx.get("id") is not None:
+        return f"{tx.get('chain') or ''}:{tx['id']}"
+    payload = json.dumps(tx, sort_keys=True, separators=(",", ":"), default=str)
+    return "sha256:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ClassificationMemo:
+    """Stores one classification result per (classifier, classifier version, transaction key)."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("CLASSIFICATION_MEMO_PATH", DEFAULT_MEMO_PATH)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def get_many(self, classifier: str, version: str, keys):
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self.lock:
+            for start in range(0, len(keys), LOOKUP_SLICE):
+                chunk = keys[start:start + LOOKUP_SLICE]
+                rows = self.conn.execute(
+                    "SELECT tx_key, result FROM classification_memo WHERE classifier = ? AND version = ? "
+                    f"AND tx_key IN ({','.join('?' * len(chunk))})",
+                    (classifier, version, *chunk),
+                ).fetchall()
+                found.update((key, json.loads(result)) for key, result in rows)
+        return found
+
+    def put_many(self, classifier: str, version: str, results):
+        now = int(time.time())
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO classification_memo (classifier, version, tx_key, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(classifier, version, key, json.dumps(result), now) for key, result in results.items()],
+            )
+
+
+_memo = None
+
+
+def get_memo() -> ClassificationMemo:
+    global _memo
+    if _memo is None:
+        _memo = ClassificationMemo()
+    return _memo
+
+
+def align_results(transactions, results):
+    """
+    Map classifier output back onto the transactions it was given: by `id` when every item
+    echoes one, else by position when the lengths match. Returns None if neither works.
+    """
+    if not isinstance(results, list):
+        return None
+    ids = [tx.get("id") if isinstance(tx, dict) else None for tx in transactions]
+    by_id = {str(item["id"]): item for item in results if isinstance(item, dict) and item.get("id") is not None}
+    if all(tx_id is not None and str(tx_id) in by_id for tx_id in ids):
+        return [by_id[str(tx_id)] for tx_id in ids]
+    if len(results) == len(transactions):
+        return results
+    return None
+
+
+def _record_lookups(classifier, memoized, unseen):
+    CACHE_LOOKUPS.inc(memoized, cache=f"memo_{classifier}", result="hit")
+    CACHE_LOOKUPS.inc(unseen, cache=f"memo_{classifier}", result="miss")
+    log.info("memo lookup", extra={"classifier": classifier, "memoized": memoized, "to_classify": unseen})
+
+
+async def classify_with_memo(classifier: str, version: str, transactions, classify):
+    """
+    Classify `transactions`, sending only those without a stored result to `classify`
+    (an async function of a transaction list returning a result list). Fresh results are stored
+    and merged with stored ones in the original order. Classifier errors are returned as-is.
+    Memo reads and writes run in a worker thread, off the event loop.
+    """
+    memo = get_memo()
+    keys = [transaction_key(tx) for tx in transactions]
+    known = await asyncio.to_thread(memo.get_many, classifier, version, keys)
+    unseen = {}
+    for key, tx in zip(keys, transactions):
+        if key not in known and key not in unseen:
+            unseen[key] = tx
+    _record_lookups(classifier, len(transactions) - len(unseen), len(unseen))
+    if unseen:
+        results = await classify(list(unseen.values()))
+        if isinstance(results, dict) and "error" in results:
+            return results
+        aligned = align_results(list(unseen.values()), results)
+        if aligned is None:
+            log.warning("AI results could not be mapped to transactions", extra={"classifier": classifier})
+            return results
+        fresh = {
+            key: result for key, result in zip(unseen, aligned)
+            if not (isinstance(result, dict) and "error" in result)
+        }
+        await asyncio.to_thread(memo.put_many, classifier, version, fresh)
+        known.update(zip(unseen, aligned))
+    return [known[key] for key in keys]
+
+
+async def stream_with_memo(classifier: str, version: str, transactions, stream):
+    """
+    Streamed classify_with_memo: yields (index, result), memoized results first, then fresh
+    ones as `stream(unseen)` (an async iterator of (unseen index, result)) produces them.
+    Fresh results are stored as they arrive, so a stream cut short keeps what it finished.
+    """
+    memo = get_memo()
+    keys = [transaction_key(tx) for tx in transactions]
+    known = await asyncio.to_thread(memo.get_many, classifier, version, keys)
+    unseen = {}
+    for index, key in enumerate(keys):
+        if key in known:
+            yield index, known[key]
+        else:
+            unseen.setdefault(key, []).append(index)
+    _record_lookups(classifier, len(transactions) - sum(map(len, unseen.values())), len(unseen))
+    if not unseen:
+        return
+    unseen_keys = list(unseen)
+    async for position, result in stream([transactions[unseen[key][0]] for key in unseen_keys]):
+        key = unseen_keys[position]
+        if not (isinstance(result, dict) and "error" in result):
+            await asyncio.to_thread(memo.put_many, classifier, version, {key: result})
+        for index in unseen[key]:
+            yield index, result
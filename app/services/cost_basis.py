@@ -0,0 +1,503 @@
+import heapq
+from collections import deque, namedtuple
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from functools import lru_cache
+from termcolor import cprint
+from app.utils.transaction_batch import normalize_address
+
+METHODS = ("fifo", "lifo", "hifo", "spec_id")
+
+ACQUIRE = 0
+DISPOSE = 1
+
+ACQUIRE_TYPES = {"buy", "receive", "income", "airdrop", "staking", "mining", "reward", "interest", "fork"}
+DISPOSE_TYPES = {"sell", "send", "spend", "payment"}
+# Classifier types (rules or AI; stored per row as `classification` by the year-end batch)
+# that move no lot: an approval or a listing transfers nothing of value.
+NON_TAXABLE_CLASSES = {"approval", "nft_listing"}
+
+ZERO = Decimal(0)
+CENT = Decimal("0.01")
+SECONDS_PER_DAY = 86400
+
+# A single acquisition or disposal. `value` is the USD cost (acquire) or proceeds (dispose),
+# already adjusted for fees. `lot_id` names the lot created, or the lot to consume for spec-ID.
+TaxEvent = namedtuple("TaxEvent", "timestamp asset side quantity value lot_id tx_id")
+
+# One lot slice matched against a disposal; emitted to `on_disposal` callbacks.
+Disposal = namedtuple("Disposal", "asset tx_id lot_id acquired_at disposed_at quantity proceeds cost_basis gain long_term")
+
+
+class Lot:
+    __slots__ = ("lot_id", "acquired_at", "long_term_at", "quantity", "cost", "unit_cost")
+
+    def __init__(self, lot_id, acquired_at: int, quantity: Decimal, cost: Decimal):
+        self.lot_id = lot_id
+        self.acquired_at = acquired_at
+        self.long_term_at = _long_term_start(acquired_at // SECONDS_PER_DAY)
+        self.quantity = quantity
+        self.cost = cost
+        self.unit_cost = cost / quantity if quantity else ZERO
+
+
+@lru_cache(maxsize=8192)
+def _long_term_start(acquired_day: int) -> int:
+    """First timestamp at which a lot acquired on UTC day `acquired_day` is held more than one year (US rule)."""
+    acquired = date(1970, 1, 1) + timedelta(days=acquired_day)
+    try:
+        anniversary = acquired.replace(year=acquired.year + 1)
+    except ValueError:
+        # Acquired on Feb 29; the anniversary is Feb 28, so long-term starts Mar 1.
+        anniversary = acquired.replace(year=acquired.year + 1, month=2, day=28)
+    day_after = anniversary + timedelta(days=1)
+    return int(datetime(day_after.year, day_after.month, day_after.day, tzinfo=timezone.utc).timestamp())
+
+
+class FifoLots:
+    """Oldest lot first."""
+
+    def __init__(self):
+        self.lots = deque()
+
+    def add(self, lot: Lot):
+        self.lots.append(lot)
+
+    def peek(self, lot_id=None):
+        return self.lots[0] if self.lots else None
+
+    def pop(self, lot: Lot):
+        self.lots.popleft()
+
+    def __iter__(self):
+        return iter(self.lots)
+
+
+class LifoLots:
+    """Newest lot first."""
+
+    def __init__(self):
+        self.lots = []
+
+    def add(self, lot: Lot):
+        self.lots.append(lot)
+
+    def peek(self, lot_id=None):
+        return self.lots[-1] if self.lots else None
+
+    def pop(self, lot: Lot):
+        self.lots.pop()
+
+    def __iter__(self):
+        return iter(self.lots)
+
+
+class HifoLots:
+    """Highest unit cost first, via a heap (O(log n) per lot selected)."""
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+
+    def add(self, lot: Lot):
+        self.seq += 1
+        heapq.heappush(self.heap, (-lot.unit_cost, self.seq, lot))
+
+    def peek(self, lot_id=None):
+        return self.heap[0][2] if self.heap else None
+
+    def pop(self, lot: Lot):
+        heapq.heappop(self.heap)
+
+    def __iter__(self):
+        # Insertion order, so a snapshot restored by re-adding lots keeps the same tie-breaking.
+        return (entry[2] for entry in sorted(self.heap, key=lambda entry: entry[1]))
+
+
+class SpecIdLots:
+    """
+    Specific identification: disposals name the lot to consume. Disposals without a (known)
+    lot id fall back to FIFO. Emptied lots are dropped from the FIFO queue lazily.
+    """
+
+    def __init__(self):
+        self.by_id = {}
+        self.fifo = deque()
+
+    def add(self, lot: Lot):
+        self.by_id[lot.lot_id] = lot
+        self.fifo.append(lot)
+
+    def peek(self, lot_id=None):
+        if lot_id is not None and lot_id in self.by_id:
+            return self.by_id[lot_id]
+        while self.fifo and self.fifo[0].quantity <= 0:
+            self.fifo.popleft()
+        return self.fifo[0] if self.fifo else None
+
+    def pop(self, lot: Lot):
+        self.by_id.pop(lot.lot_id, None)
+        if self.fifo and self.fifo[0] is lot:
+            self.fifo.popleft()
+
+    def __iter__(self):
+        return (lot for lot in self.fifo if lot.quantity > 0)
+
+
+LOT_QUEUES = {"fifo": FifoLots, "lifo": LifoLots, "hifo": HifoLots, "spec_id": SpecIdLots}
+
+
+@lru_cache(maxsize=8192)
+def _year_of_day(day: int) -> int:
+    return (date(1970, 1, 1) + timedelta(days=day)).year
+
+
+def _empty_totals():
+    # [proceeds, cost_basis, gain]
+    return [ZERO, ZERO, ZERO]
+
+
+def _format_totals(totals):
+    return {key: str(value.quantize(CENT)) for key, value in zip(("proceeds", "cost_basis", "gain"), totals)}
+
+
+class CostBasisEngine:
+    """
+    Streaming lot matcher. Feed time-ordered TaxEvents through `process`; only open lots and
+    running totals are kept, so memory is bounded by open positions rather than history length.
+    """
+
+    def __init__(self, method: str = "fifo", on_disposal=None):
+        if method not in LOT_QUEUES:
+            raise ValueError(f"Unsupported cost basis method '{method}'. Use one of {', '.join(METHODS)}.")
+        self.method = method
+        self.on_disposal = on_disposal
+        self.queues = {}
+        self.totals = {"short_term": _empty_totals(), "long_term": _empty_totals()}
+        self.by_year = {}
+        self.unmatched = {}
+        self.disposals = 0
+        self.events = 0
+
+    def _queue(self, asset):
+        queue = self.queues.get(asset)
+        if queue is None:
+            queue = self.queues[asset] = LOT_QUEUES[self.method]()
+        return queue
+
+    def process(self, event: TaxEvent):
+        self.events += 1
+        if event.side == ACQUIRE:
+            if event.quantity > 0:
+                self._queue(event.asset).add(Lot(event.lot_id or event.tx_id, event.timestamp, event.quantity, event.value))
+        else:
+            self._dispose(event)
+
+    def _dispose(self, event: TaxEvent):
+        queue = self._queue(event.asset)
+        remaining = event.quantity
+        proceeds_left = event.value
+        while remaining > 0:
+            lot = queue.peek(event.lot_id)
+            if lot is None:
+                # Nothing left to match: treat the shortfall as zero-basis and report it.
+                self.unmatched[event.asset] = self.unmatched.get(event.asset, ZERO) + remaining
+                self._record(event, None, event.timestamp, remaining, proceeds_left, ZERO, False)
+                return
+            if lot.quantity <= remaining:
+                taken, cost = lot.quantity, lot.cost
+                queue.pop(lot)
+                lot.quantity, lot.cost = ZERO, ZERO
+            else:
+                taken = remaining
+                cost = lot.cost * taken / lot.quantity
+                lot.quantity -= taken
+                lot.cost -= cost
+            proceeds = proceeds_left if taken == remaining else event.value * taken / event.quantity
+            remaining -= taken
+            proceeds_left -= proceeds
+            self._record(event, lot.lot_id, lot.acquired_at, taken, proceeds, cost, event.timestamp >= lot.long_term_at)
+
+    def _record(self, event, lot_id, acquired_at, quantity, proceeds, cost, long_term):
+        self.disposals += 1
+        gain = proceeds - cost
+        term = "long_term" if long_term else "short_term"
+        for totals in (self.totals[term], self._year_totals(event.timestamp)[term]):
+            totals[0] += proceeds
+            totals[1] += cost
+            totals[2] += gain
+        if self.on_disposal is not None:
+            self.on_disposal(Disposal(
+                event.asset, event.tx_id, lot_id, acquired_at, event.timestamp, quantity, proceeds, cost, gain, long_term
+            ))
+
+    def _year_totals(self, timestamp):
+        return self._year_totals_for(_year_of_day(timestamp // SECONDS_PER_DAY))
+
+    def _year_totals_for(self, year: int):
+        totals = self.by_year.get(year)
+        if totals is None:
+            totals = self.by_year[year] = {"short_term": _empty_totals(), "long_term": _empty_totals()}
+        return totals
+
+    def state(self):
+        """JSON-serializable snapshot of open lots, totals and counters (see `from_state`)."""
+        return {
+            "lots": {
+                asset: [[lot.lot_id, lot.acquired_at, str(lot.quantity), str(lot.cost)] for lot in queue if lot.quantity > 0]
+                for asset, queue in self.queues.items()
+            },
+            "totals": {term: [str(v) for v in totals] for term, totals in self.totals.items()},
+            "by_year": {
+                str(year): {term: [str(v) for v in totals[term]] for term in totals}
+                for year, totals in self.by_year.items()
+            },
+            "unmatched": {asset: str(quantity) for asset, quantity in self.unmatched.items()},
+            "disposals": self.disposals,
+            "events": self.events,
+        }
+
+    @classmethod
+    def from_state(cls, method: str, state, on_disposal=None):
+        """Rebuild an engine from `state()` output; processing then continues where the snapshot left off."""
+        engine = cls(method, on_disposal)
+        for asset, lots in state["lots"].items():
+            queue = engine._queue(asset)
+            for lot_id, acquired_at, quantity, cost in lots:
+                queue.add(Lot(lot_id, acquired_at, Decimal(quantity), Decimal(cost)))
+        engine.totals = {term: [Decimal(v) for v in totals] for term, totals in state["totals"].items()}
+        engine.by_year = {
+            int(year): {term: [Decimal(v) for v in values] for term, values in totals.items()}
+            for year, totals in state["by_year"].items()
+        }
+        engine.unmatched = {asset: Decimal(quantity) for asset, quantity in state["unmatched"].items()}
+        engine.disposals = state["disposals"]
+        engine.events = state["events"]
+        return engine
+
+    def merge(self, other):
+        """Fold another engine's totals and open lots into this one (engines over disjoint assets)."""
+        for term in self.totals:
+            self.totals[term] = [a + b for a, b in zip(self.totals[term], other.totals[term])]
+        for year, totals in other.by_year.items():
+            mine = self._year_totals_for(year)
+            for term in mine:
+                mine[term] = [a + b for a, b in zip(mine[term], totals[term])]
+        for asset, quantity in other.unmatched.items():
+            self.unmatched[asset] = self.unmatched.get(asset, ZERO) + quantity
+        self.queues.update(other.queues)
+        self.disposals += other.disposals
+        self.events += other.events
+
+    def open_lots(self):
+        """Remaining quantity and cost basis per asset."""
+        holdings = {}
+        for asset, queue in self.queues.items():
+            quantity = sum((lot.quantity for lot in queue), ZERO)
+            if quantity > 0:
+                holdings[asset] = {"quantity": quantity, "cost_basis": sum((lot.cost for lot in queue), ZERO)}
+        return holdings
+
+    def result(self):
+        return {
+            "method": self.method,
+            "short_term": _format_totals(self.totals["short_term"]),
+            "long_term": _format_totals(self.totals["long_term"]),
+            "total_gain": str((self.totals["short_term"][2] + self.totals["long_term"][2]).quantize(CENT)),
+            "by_year": {
+                str(year): {term: _format_totals(totals[term]) for term in ("short_term", "long_term")}
+                for year, totals in sorted(self.by_year.items())
+            },
+            "events": self.events,
+            "disposals": self.disposals,
+            "unmatched": {asset: str(quantity) for asset, quantity in self.unmatched.items()},
+            "open_lots": {
+                asset: {"quantity": str(h["quantity"]), "cost_basis": str(h["cost_basis"].quantize(CENT))}
+                for asset, h in self.open_lots().items()
+            },
+        }
+
+
+def calculate_gains(events, method: str = "fifo", on_disposal=None):
+    """Run time-ordered TaxEvents through a CostBasisEngine and return realized gains."""
+    engine = CostBasisEngine(method, on_disposal)
+    for event in events:
+        engine.process(event)
+    return engine.result()
+
+
+def _to_decimal(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def _to_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def event_value(side: int, quantity, price, value, fee):
+    """
+    Fee-adjusted USD value of a tax event from Decimal parts (None where unknown): `value`, else
+    |quantity| * price (the side, not the amount's sign, says which way it moved); the fee is
+    added to cost and deducted from proceeds. None if no value.
+    """
+    if value is None and quantity is not None and price is not None:
+        value = abs(quantity) * price
+    if value is None:
+        return None
+    fee = fee or ZERO
+    return value + fee if side == ACQUIRE else value - fee
+
+
+def tax_type(tx) -> str:
+    """
+    A row's type for lot matching: its own `type`, or its stored classification when the type
+    does not decide the side (transfers and the like) and the classification moves no lot.
+    """
+    tx_type = (tx.get("type") or "transfer").lower()
+    classification = str(tx.get("classification") or "").lower()
+    if tx_type not in ACQUIRE_TYPES and tx_type not in DISPOSE_TYPES and classification in NON_TAXABLE_CLASSES:
+        return classification
+    return tx_type
+
+
+def _tax_event(tx, owned):
+    """Build a TaxEvent from a transaction dict; None if not taxable, False if it lacks data."""
+    if tx.get("internal_transfer"):
+        # One leg of a matched transfer between the user's own accounts.
+        return None
+    tx_type = tax_type(tx)
+    if tx_type in NON_TAXABLE_CLASSES:
+        return None
+    if tx_type in ACQUIRE_TYPES:
+        side = ACQUIRE
+    elif tx_type in DISPOSE_TYPES:
+        side = DISPOSE
+    else:
+        to_owned = normalize_address(tx.get("to")) in owned
+        from_owned = normalize_address(tx.get("from")) in owned
+        if to_owned == from_owned:
+            # Between two owned addresses (or unrelated to them): not a taxable event.
+            return None
+        side = ACQUIRE if to_owned else DISPOSE
+    quantity = _to_decimal(tx.get("amount"))
+    timestamp = _to_timestamp(tx.get("timestamp"))
+    quantity = None if quantity is None else abs(quantity)
+    value = event_value(side, quantity, _to_decimal(tx.get("price_usd")), _to_decimal(tx.get("value_usd")), _to_decimal(tx.get("fee_usd")))
+    if quantity is None or timestamp is None or value is None:
+        return False
+    return TaxEvent(timestamp, tx.get("token"), side, quantity, value, tx.get("lot_id"), tx.get("id"))
+
+
+def iter_tax_rows(transactions, owned_addresses=None):
+    """
+    Yield (tx, timestamp, event) per transaction dict. `event` is a TaxEvent, None if the row
+    is not taxable, or False if it lacks a timestamp or USD value; `timestamp` is the row's
+    parsed timestamp for taxable and skipped rows (None if missing or not taxable).
+    """
+    owned = {normalize_address(address) for address in owned_addresses or []}
+    for tx in transactions:
+        event = _tax_event(tx, owned)
+        if event:
+            yield tx, event.timestamp, event
+        else:
+            yield tx, _to_timestamp(tx.get("timestamp")) if event is False else None, event
+
+
+def iter_tax_events(transactions, owned_addresses=None, stats=None):
+    """
+    Lazily turn already time-ordered transaction dicts into TaxEvents.
+    Explicit types (buy, sell, income, ...) set the side directly; plain transfers are an
+    acquisition when they arrive at an owned address and a disposal when they leave one.
+    Legs marked `internal_transfer` by the transfer matcher are not taxable. USD value comes from `value_usd`, or `amount * price_usd`; `fee_usd` is added to cost
+    and deducted from proceeds. Rows without a timestamp or USD value are counted in
+    `stats["skipped"]` and dropped.
+    """
+    if stats is not None:
+        stats.setdefault("skipped", 0)
+    for _, _, event in iter_tax_rows(transactions, owned_addresses):
+        if event:
+            yield event
+        elif event is False and stats is not None:
+            stats["skipped"] += 1
+
+
+def events_from_transactions(transactions, owned_addresses=None):
+    """Like iter_tax_events for unordered input: returns (sorted events, skipped_count)."""
+    stats = {}
+    events = list(iter_tax_events(transactions, owned_addresses, stats))
+    # Acquisitions sort before disposals that share a timestamp.
+    events.sort(key=lambda e: (e.timestamp, e.side))
+    if stats["skipped"]:
+        cprint(f"[WARN] Skipped {stats['skipped']} transactions without timestamp or USD value.", "yellow")
+    return events, stats["skipped"]
+
+
+def batch_event_rows(batch, owned_addresses=None):
+    """
+    Column-wise tax events of a TransactionBatch: returns (rows, sides, values, skipped_count),
+    where `rows` are the taxable row indices in event order (time, acquisitions first) and
+    `sides` / `values` are per-row arrays over the whole batch (values fee-adjusted float64, for
+    masks and estimates; exact event values come from event_value over TransactionBatch.decimal).
+    """
+    import numpy as np
+    from app.utils.transaction_batch import MISSING
+
+    type_names = batch.tables["types"].values
+    # Per type id: ACQUIRE, DISPOSE, -2 for types that move no lot, or -1 for direction-based
+    # (transfers and anything else).
+    side_of_type = np.array(
+        [ACQUIRE if t in ACQUIRE_TYPES else DISPOSE if t in DISPOSE_TYPES else -2 if t in NON_TAXABLE_CLASSES else -1
+         for t in type_names] + [-1],
+        dtype=np.int8,
+    )
+    sides = side_of_type[batch.type]
+    direction = batch.direction(owned_addresses or [])
+    by_direction = sides == -1
+    moves_lot = sides != -2
+    sides = np.where(by_direction, np.where(direction > 0, ACQUIRE, DISPOSE), sides)
+    taxable = moves_lot & (~by_direction | (direction != 0))
+
+    values = np.where(np.isnan(batch.value_usd), np.abs(batch.float_amounts()) * batch.price_usd, batch.value_usd)
+    fees = np.nan_to_num(batch.fee_usd)
+    values = np.where(sides == ACQUIRE, values + fees, values - fees)
+    complete = (batch.timestamp != MISSING) & ~np.isnan(values)
+    skipped = int(np.count_nonzero(taxable & ~complete))
+    rows = np.flatnonzero(taxable & complete)
+    # Acquisitions sort before disposals that share a timestamp.
+    rows = rows[np.lexsort((sides[rows], batch.timestamp[rows]))]
+    return rows, sides, values, skipped
+
+
+def events_from_batch(batch, owned_addresses=None):
+    """
+    Vectorized counterpart of events_from_transactions for a TransactionBatch: sides and the
+    skip mask are computed column-wise, and only taxable rows are turned into TaxEvents, in
+    time order, with quantities and USD values computed exactly in Decimal. Returns
+    (events, skipped_count).
+    """
+    rows, sides, _, skipped = batch_event_rows(batch, owned_addresses)
+    tokens = batch.tables["tokens"].lookup
+    lots = batch.tables["lots"].lookup
+    events = []
+    for i in rows:
+        quantity = abs(batch.decimal("amount", i))
+        value = event_value(int(sides[i]), quantity, *(batch.decimal(name, i) for name in batch.USD_COLUMNS))
+        events.append(TaxEvent(int(batch.timestamp[i]), tokens(batch.token[i]), int(sides[i]), quantity,
+                               value, lots(batch.lot_id[i]), batch.ids[i]))
+    if skipped:
+        cprint(f"[WARN] Skipped {skipped} transactions without timestamp or USD value.", "yellow")
+    return events, skipped
+
@@ -0,0 +1,131 @@
+import os
+import asyncio
+from termcolor import cprint
+
+DEFAULT_UPLOAD_DIR = "data/uploads"
+
+
+def upload_path(job_key: str) -> str:
+    """Where an uploaded file waits for its import job; kept until the job succeeds."""
+    upload_dir = os.getenv("JOB_UPLOAD_DIR", DEFAULT_UPLOAD_DIR)
+    os.makedirs(upload_dir, exist_ok=True)
+    return os.path.join(upload_dir, f"{job_key}.csv")
+
+
+async def run_wallet_sync(context):
+    """
+    Sync the given wallets (default: every stored wallet of the user). The checkpoint records
+    finished wallets, so a resumed job only syncs the rest; each wallet is incremental anyway.
+    """
+    from app.utils.fetch_wallet_transactions import normalize_chain
+    from app.utils.tx_store import get_store
+    from app.utils.wallet_sync import sync_wallet
+
+    store = get_store()
+    wallets = context.params.get("wallets") or store.get_wallets(context.user_id)
+    wallets = [(w["address"], normalize_chain(w.get("chain", "eth"))) for w in wallets]
+    done = dict(context.checkpoint.get("done", {}))
+    pending = [(address, chain) for address, chain in wallets if f"{chain}:{address}" not in done]
+    if done:
+        cprint(f"[INFO] Resuming wallet sync: {len(done)} done, {len(pending)} left.", "cyan")
+    for address, chain in wallets:
+        store.add_wallet(context.user_id, chain, address)
+
+    async def sync_one(address, chain):
+        result = await sync_wallet(address, chain, store)
+        done[f"{chain}:{address}"] = result
+        context.save_checkpoint({"done": done}, wallets_done=len(done), wallets_total=len(wallets))
+
+    context.progress(wallets_done=len(done), wallets_total=len(wallets))
+    await asyncio.gather(*(sync_one(address, chain) for address, chain in pending))
+    return {"wallets": [done[f"{chain}:{address}"] for address, chain in wallets]}
+
+
+async def run_csv_import(context):
+    """Import an uploaded exchange CSV. Re-running is safe: rows already stored are skipped."""
+    from app.utils.csv_importer import import_csv
+
+    params = context.params
+    path = params["path"]
+
+    def progress(rows, bytes_read, total_bytes):
+        context.progress(rows=rows, bytes_read=bytes_read, total_bytes=total_bytes)
+
+    def run():
+        with open(path, "rb") as f:
+            return import_csv(f, params["exchange"], params.get("account", "default"), context.user_id,
+                              total_bytes=os.path.getsize(path), progress=progress, profile_name=params.get("profile"))
+
+    result = await asyncio.to_thread(run)
+    os.remove(path)
+    return result
+
+
+async def run_report(context):
+    from app.services.report_service import build_report_summary
+    return await asyncio.to_thread(build_report_summary, context.user_id)
+
+
+async def run_tax(context):
+    from app.services.cost_basis import METHODS
+    from app.services.tax_ledger import get_tax_ledger
+    method = context.params.get("method", "fifo").lower()
+    if method not in METHODS:
+        raise ValueError(f"Unsupported method '{method}'.")
+    return await asyncio.to_thread(get_tax_ledger().result, context.user_id, method)
+
+
+async def run_classification(context):
+    from app.services.ai_service import ai_classify_transactions
+    from app.services.rule_classifier import classify_with_rules
+
+    transactions = context.params.get("transactions", [])
+    task_complexity = context.params.get("task_complexity", "simple")
+    context.progress(transactions=len(transactions))
+    results = await classify_with_rules(transactions, lambda residue: ai_classify_transactions(residue, task_complexity))
+    if isinstance(results, dict) and "error" in results:
+        raise RuntimeError(results["error"])
+    return {"results": results}
+
+
+async def run_transfer_match(context):
+    from app.services.transfer_matcher import match_user_transfers
+    return await asyncio.to_thread(match_user_transfers, context.user_id)
+
+
+async def run_price_backfill(context):
+    """
+    Backfill OHLC bars for `assets` over [`start`, `end`] (defaults: every token and the full
+    time range of the user's stored transactions). The checkpoint records finished assets.
+    """
+    from app.utils.price_oracle import USD_STABLES, get_price_oracle, price_symbol
+    from app.utils.tx_store import get_store
+
+    params = context.params
+    resolution = params.get("resolution", "1d")
+    assets, start, end = params.get("assets"), params.get("start"), params.get("end")
+    if not assets or start is None or end is None:
+        batch = await asyncio.to_thread(get_store().load_user_batch, context.user_id)
+        known = batch.timestamp[batch.timestamp >= 0]
+        assets = assets or sorted({price_symbol(token) for token in batch.tables["tokens"].values} - USD_STABLES)
+        start = start if start is not None else int(known.min()) if len(known) else 0
+        end = end if end is not None else int(known.max()) if len(known) else 0
+    done = dict(context.checkpoint.get("done", {}))
+    oracle = get_price_oracle()
+    for asset in assets:
+        if asset in done:
+            continue
+        done[asset] = await asyncio.to_thread(oracle.backfill, asset, start, end, resolution)
+        context.save_checkpoint({"done": done}, assets_done=len(done), assets_total=len(assets))
+    return {"resolution": resolution, "start": start, "end": end, "new_bars": done}
+
+
+JOB_HANDLERS = {
+    "wallet_sync": run_wallet_sync,
+    "csv_import": run_csv_import,
+    "report": run_report,
+    "tax": run_tax,
+    "classification": run_classification,
+    "price_backfill": run_price_backfill,
+    "transfer_match": run_transfer_match,
+}
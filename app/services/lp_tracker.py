@@ -0,0 +1,379 @@
+import os
+import json
+import sqlite3
+import threading
+from decimal import Decimal, InvalidOperation
+from termcolor import cprint
+from app.services.cost_basis import CENT, ZERO, _to_decimal, _to_timestamp
+
+DEFAULT_LP_STATE_PATH = "data/lp_state.db"
+
+ACTIONS = {
+    "add": "add", "add_liquidity": "add", "mint": "add", "deposit": "add",
+    "remove": "remove", "remove_liquidity": "remove", "burn": "remove", "withdraw": "remove",
+    "collect": "collect", "claim": "collect", "harvest": "collect", "fees": "collect",
+    "swap": "swap",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lp_positions (
+    user_id TEXT NOT NULL,
+    pool TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (user_id, pool)
+);
+CREATE TABLE IF NOT EXISTS lp_events (
+    user_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    PRIMARY KEY (user_id, event_id)
+);
+"""
+
+
+def _usd(value: Decimal) -> float:
+    return float(value.quantize(CENT))
+
+
+def _token_amounts(tx, key="tokens"):
+    """{SYMBOL: Decimal} from a `tokens` map, or from token0/amount0, token1/amount1 pairs."""
+    amounts = {}
+    raw = tx.get(key)
+    if isinstance(raw, dict):
+        items = raw.items()
+    elif key == "tokens":
+        items = [(tx.get(f"token{i}"), tx.get(f"amount{i}")) for i in (0, 1)]
+    else:
+        items = ()
+    for token, amount in items:
+        amount = _to_decimal(amount)
+        if token and amount is not None:
+            amounts[str(token).upper()] = amounts.get(str(token).upper(), ZERO) + amount
+    return amounts
+
+
+def normalize_lp_event(tx):
+    """
+    Canonical LP event from a transaction dict, or None if it is not one. `action` (or `type`)
+    is add, remove, collect or swap (aliases: mint/burn/claim, ...); `pool` (or `pool_address`)
+    names the pool; `lp_amount` (or `shares`) is the LP tokens minted or burned (None if not
+    given); `tokens` maps
+    symbols to the amounts deposited, withdrawn or collected. Optional: `value_usd` for those
+    amounts, `fee_usd`, `prices` (symbol -> USD) and the pool's `reserves` and `total_supply`.
+    """
+    action = ACTIONS.get(str(tx.get("action") or tx.get("type") or "").lower())
+    pool = tx.get("pool") or tx.get("pool_address")
+    if action is None or not pool:
+        return None
+    try:
+        return {
+            "id": tx.get("id") or tx.get("tx_hash"),
+            "pool": str(pool),
+            "action": action,
+            "timestamp": _to_timestamp(tx.get("timestamp")),
+            "lp_amount": _to_decimal(tx.get("lp_amount", tx.get("shares"))),
+            "tokens": _token_amounts(tx),
+            "value_usd": _to_decimal(tx.get("value_usd")),
+            "fee_usd": _to_decimal(tx.get("fee_usd")) or ZERO,
+            "prices": _token_amounts(tx, "prices"),
+            "reserves": _token_amounts(tx, "reserves"),
+            "total_supply": _to_decimal(tx.get("total_supply")),
+        }
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+class LpPosition:
+    """
+    One pool position, updated one event at a time in O(1) (per token in the pool).
+    Cost basis is pooled per LP share: adds raise it by the USD value deposited (plus fees),
+    removes release it pro rata to the shares burned and realize proceeds minus that basis.
+    Collected fees are income. Swaps only refresh the pool's reserves and prices, which value
+    the remaining shares (unrealized result) against simply holding the deposited tokens.
+    """
+
+    def __init__(self, pool: str):
+        self.pool = pool
+        self.shares = ZERO
+        self.cost_basis = ZERO
+        self.deposited = {}
+        self.realized_gain = ZERO
+        self.proceeds = ZERO
+        self.fee_income = ZERO
+        self.fees = {}
+        self.reserves = {}
+        self.total_supply = None
+        self.prices = {}
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.events = 0
+        self.skipped = 0
+
+    def _value(self, amounts, event, price_lookup):
+        """
+        USD value of token amounts: the event's own value, else amounts at the event's prices,
+        the price store's price at the event time, or the last price seen for the pool.
+        """
+        if event["value_usd"] is not None:
+            return event["value_usd"]
+        total = ZERO
+        for token, amount in amounts.items():
+            price = event["prices"].get(token)
+            if price is None and price_lookup is not None:
+                price = price_lookup(token, event["timestamp"])
+                if price is not None:
+                    self.prices[token] = price
+            if price is None:
+                price = self.prices.get(token)
+            if price is None:
+                return None
+            total += amount * price
+        return total
+
+    def _shares(self, event):
+        """
+        LP shares minted by an add or burned by a remove: its `lp_amount`, else the deposited or
+        withdrawn share of the pool's reserves times the supply (as of the event). None if
+        neither is known; a missing amount is never taken as zero shares or a full exit.
+        """
+        shares = event["lp_amount"]
+        if shares is None:
+            if not self.total_supply:
+                return None
+            ratios = [amount / self.reserves[token] for token, amount in event["tokens"].items() if self.reserves.get(token)]
+            if not ratios:
+                return None
+            shares = self.total_supply * min(ratios)
+        return min(shares, self.shares) if event["action"] == "remove" else shares
+
+    def apply(self, event, price_lookup=None):
+        """Apply one normalized event; returns a per-event result row ({..., "tax_summary"})."""
+        self.prices.update(event["prices"])
+        if event["reserves"]:
+            self.reserves = event["reserves"]
+        if event["total_supply"] is not None:
+            self.total_supply = event["total_supply"]
+        timestamp = event["timestamp"]
+        if timestamp is not None:
+            self.first_timestamp = timestamp if self.first_timestamp is None else min(self.first_timestamp, timestamp)
+            self.last_timestamp = timestamp if self.last_timestamp is None else max(self.last_timestamp, timestamp)
+        action, amounts = event["action"], event["tokens"]
+        row = {"id": event["id"], "pool": self.pool, "action": action, "tokens": sorted(amounts), "timestamp": timestamp}
+        value = self._value(amounts, event, price_lookup) if action != "swap" else None
+        if action != "swap" and value is None:
+            self.skipped += 1
+            row["tax_summary"] = "Skipped: no USD value or price for the tokens."
+            return row
+        shares = self._shares(event) if action in ("add", "remove") else None
+        if action in ("add", "remove") and shares is None:
+            self.skipped += 1
+            if action == "add":
+                row["tax_summary"] = "Skipped: deposit without lp_amount, and no pool reserves and supply to derive the shares minted."
+            else:
+                row["tax_summary"] = "Skipped: withdrawal without lp_amount, and no pool reserves and supply to derive the shares burned."
+            return row
+        self.events += 1
+        if action == "add":
+            self.shares += shares
+            self.cost_basis += value + event["fee_usd"]
+            for token, amount in amounts.items():
+                self.deposited[token] = self.deposited.get(token, ZERO) + amount
+            row["value_usd"] = _usd(value)
+            row["tax_summary"] = f"Deposit: ${_usd(value + event['fee_usd']):,.2f} added to the LP cost basis; not taxable."
+        elif action == "remove":
+            fraction = shares / self.shares if self.shares else ZERO
+            basis = self.cost_basis * fraction
+            gain = value - event["fee_usd"] - basis
+            self.shares -= shares
+            self.cost_basis -= basis
+            self.proceeds += value - event["fee_usd"]
+            self.realized_gain += gain
+            for token in self.deposited:
+                self.deposited[token] -= self.deposited[token] * fraction
+            row.update(value_usd=_usd(value), cost_basis_usd=_usd(basis), gain_usd=_usd(gain))
+            row["tax_summary"] = f"Withdrawal: {'gain' if gain >= 0 else 'loss'} of ${abs(_usd(gain)):,.2f} on {fraction:.2%} of the position."
+        elif action == "collect":
+            self.fee_income += value
+            for token, amount in amounts.items():
+                self.fees[token] = self.fees.get(token, ZERO) + amount
+            row["value_usd"] = _usd(value)
+            row["tax_summary"] = f"Fee collection: ${_usd(value):,.2f} of income."
+        else:
+            row["tax_summary"] = "Pool swap: updates pool reserves and prices; no taxable event for the LP."
+        return row
+
+    def summary(self):
+        """Position totals; `value_usd` and the unrealized result need the pool's reserves, supply and prices."""
+        result = {
+            "pool": self.pool,
+            "shares": str(self.shares),
+            "cost_basis_usd": _usd(self.cost_basis),
+            "cost_per_share_usd": float(self.cost_basis / self.shares) if self.shares else 0.0,
+            "realized_gain_usd": _usd(self.realized_gain),
+            "proceeds_usd": _usd(self.proceeds),
+            "fee_income_usd": _usd(self.fee_income),
+            "fees": {token: str(amount) for token, amount in self.fees.items()},
+            "deposited": {token: str(amount) for token, amount in self.deposited.items()},
+            "value_usd": None,
+            "unrealized_gain_usd": None,
+            "hodl_value_usd": None,
+            "impermanent_loss_usd": None,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "events": self.events,
+            "skipped": self.skipped,
+        }
+        if not self.shares:
+            result["value_usd"] = result["unrealized_gain_usd"] = 0.0
+        elif self.total_supply and self.reserves and all(token in self.prices for token in self.reserves):
+            value = self.shares / self.total_supply * sum(amount * self.prices[token] for token, amount in self.reserves.items())
+            result["value_usd"] = _usd(value)
+            result["unrealized_gain_usd"] = _usd(value - self.cost_basis)
+            if all(token in self.prices for token in self.deposited):
+                hodl = sum((amount * self.prices[token] for token, amount in self.deposited.items()), ZERO)
+                result["hodl_value_usd"] = _usd(hodl)
+                result["impermanent_loss_usd"] = _usd(value - hodl)
+        return result
+
+    def state(self):
+        def strs(amounts):
+            return {token: str(amount) for token, amount in amounts.items()}
+        return {
+            "pool": self.pool, "shares": str(self.shares), "cost_basis": str(self.cost_basis),
+            "deposited": strs(self.deposited), "realized_gain": str(self.realized_gain),
+            "proceeds": str(self.proceeds), "fee_income": str(self.fee_income), "fees": strs(self.fees),
+            "reserves": strs(self.reserves), "total_supply": None if self.total_supply is None else str(self.total_supply),
+            "prices": strs(self.prices), "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp, "events": self.events, "skipped": self.skipped,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        def decimals(amounts):
+            return {token: Decimal(amount) for token, amount in amounts.items()}
+        position = cls(state["pool"])
+        position.shares = Decimal(state["shares"])
+        position.cost_basis = Decimal(state["cost_basis"])
+        position.deposited = decimals(state["deposited"])
+        position.realized_gain = Decimal(state["realized_gain"])
+        position.proceeds = Decimal(state["proceeds"])
+        position.fee_income = Decimal(state["fee_income"])
+        position.fees = decimals(state["fees"])
+        position.reserves = decimals(state["reserves"])
+        position.total_supply = None if state["total_supply"] is None else Decimal(state["total_supply"])
+        position.prices = decimals(state["prices"])
+        position.first_timestamp = state["first_timestamp"]
+        position.last_timestamp = state["last_timestamp"]
+        position.events = state["events"]
+        position.skipped = state["skipped"]
+        return position
+
+
+def oracle_price_lookup(token: str, timestamp):
+    """Local price store lookup for events without a value or price; None if unknown."""
+    from app.utils.price_oracle import get_price_oracle
+    if timestamp is None:
+        return None
+    price = get_price_oracle().prices(token, [timestamp])[0]
+    return None if price != price else Decimal(str(float(price)))
+
+
+def _sorted_events(transactions):
+    events = [event for event in map(normalize_lp_event, transactions) if event is not None]
+    # Stable sort: events without a timestamp keep their place relative to each other.
+    events.sort(key=lambda event: event["timestamp"] if event["timestamp"] is not None else 0)
+    return events, len(transactions) - len(events)
+
+
+def _result(positions, rows, ignored):
+    summaries = [position.summary() for position in positions]
+    totals = {
+        key: _usd(sum((Decimal(str(s[key])) for s in summaries if s[key] is not None), ZERO))
+        for key in ("cost_basis_usd", "realized_gain_usd", "fee_income_usd", "unrealized_gain_usd")
+    }
+    return {"positions": summaries, "results": rows, "totals": totals, "ignored": ignored}
+
+
+def analyze_lp_events(transactions, price_lookup=oracle_price_lookup):
+    """
+    Positions per pool from a list of LP transactions, in time order. Returns
+    {"positions", "results" (one row per event), "totals", "ignored" (not LP events)}.
+    """
+    events, ignored = _sorted_events(transactions)
+    positions = {}
+    rows = []
+    for event in events:
+        position = positions.get(event["pool"])
+        if position is None:
+            position = positions[event["pool"]] = LpPosition(event["pool"])
+        rows.append(position.apply(event, price_lookup))
+    return _result(positions.values(), rows, ignored)
+
+
+class LpTracker:
+    """
+    Persistent per-pool LP state per user (LP_STATE_PATH). New events are applied on top of
+    the stored positions, so each one costs O(1) regardless of history; event ids already
+    applied are ignored, so resubmitting a full history is safe.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("LP_STATE_PATH", DEFAULT_LP_STATE_PATH)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+
+    def _load(self, user_id, pools):
+        rows = self.conn.execute(
+            f"SELECT pool, state FROM lp_positions WHERE user_id = ? AND pool IN ({','.join('?' * len(pools))})",
+            (user_id, *pools),
+        ).fetchall()
+        return {pool: LpPosition.from_state(json.loads(state)) for pool, state in rows}
+
+    def positions(self, user_id: str):
+        rows = self.conn.execute("SELECT state FROM lp_positions WHERE user_id = ? ORDER BY pool", (user_id,)).fetchall()
+        return [LpPosition.from_state(json.loads(state)) for state, in rows]
+
+    def apply(self, user_id: str, transactions, price_lookup=oracle_price_lookup):
+        """Apply new LP events for a user and return all of their positions (see analyze_lp_events)."""
+        events, ignored = _sorted_events(transactions)
+        rows = []
+        with self.lock, self.conn:
+            positions = self._load(user_id, sorted({event["pool"] for event in events})) if events else {}
+            duplicates = 0
+            for event in events:
+                if event["id"] is not None:
+                    inserted = self.conn.execute(
+                        "INSERT OR IGNORE INTO lp_events (user_id, event_id) VALUES (?, ?)", (user_id, str(event["id"]))
+                    ).rowcount
+                    if not inserted:
+                        duplicates += 1
+                        continue
+                position = positions.get(event["pool"])
+                if position is None:
+                    position = positions[event["pool"]] = LpPosition(event["pool"])
+                rows.append(position.apply(event, price_lookup))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO lp_positions (user_id, pool, state) VALUES (?, ?, ?)",
+                [(user_id, pool, json.dumps(position.state())) for pool, position in positions.items()],
+            )
+        cprint(f"[INFO] LP events for {user_id}: {len(rows)} applied, {duplicates} already seen, {ignored} not LP events.", "cyan")
+        return {**_result(self.positions(user_id), rows, ignored), "duplicates": duplicates}
+
+    def reset(self, user_id: str):
+        with self.lock, self.conn:
+            for table in ("lp_positions", "lp_events"):
+                self.conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+
+_tracker = None
+
+
+def get_lp_tracker() -> LpTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = LpTracker()
+    return _tracker
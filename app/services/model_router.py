@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from app.utils.log import get_logger
+from app.services.openrouter_client import chat_content, stream_chat
+
+log = get_logger(__name__)
+
+FREE_MODELS = [
+    "deepseek-chat",
+    "gemini-pro",
+]
+PAID_MODELS = [
+    "gpt-4o",
+    "claude-3-opus",
+]
+
+# Latency samples kept per model, and how many a model needs before its stats are trusted.
+STATS_WINDOW = 200
+MIN_SAMPLES = 5
+# Share of calls sent to a random eligible model so every model's stats stay current.
+EXPLORE_RATE = float(os.getenv("MODEL_ROUTER_EXPLORE", 0.05))
+# Hedge delay before a model has enough samples for a p95, and its floor.
+DEFAULT_HEDGE_DELAY = float(os.getenv("MODEL_ROUTER_HEDGE_DELAY", 8))
+MIN_HEDGE_DELAY = 0.5
+
+
+def model_pool(task_complexity: str = "simple"):
+    """Models that fit a task's budget: free models for simple tasks, paid ones otherwise."""
+    if task_complexity == "simple":
+        return os.getenv("MODEL_ROUTER_FREE_MODELS", ",".join(FREE_MODELS)).split(",")
+    return os.getenv("MODEL_ROUTER_PAID_MODELS", ",".join(PAID_MODELS)).split(",")
+
+
+def _percentile(ordered, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelStats:
+    """Rolling latency window plus error and JSON-validity counts for one model."""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.json_checked = 0
+        self.json_valid = 0
+        self.hedges_won = 0
+        self.cancelled = 0
+
+    def error_rate(self) -> float:
+        return self.errors / self.calls if self.calls else 0.0
+
+    def json_rate(self) -> float:
+        return self.json_valid / self.json_checked if self.json_checked else 1.0
+
+    def percentile(self, q: float):
+        return _percentile(sorted(self.latencies), q) if self.latencies else None
+
+    def expected_latency(self) -> float:
+        """Median latency divided by the chance a call returns a usable answer."""
+        usable = max((1 - self.error_rate()) * self.json_rate(), 0.05)
+        return self.percentile(0.5) / usable
+
+    def snapshot(self):
+        ordered = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "p50": round(_percentile(ordered, 0.5), 3) if ordered else None,
+            "p95": round(_percentile(ordered, 0.95), 3) if ordered else None,
+            "p99": round(_percentile(ordered, 0.99), 3) if ordered else None,
+            "error_rate": round(self.error_rate(), 4),
+            "json_validity": round(self.json_rate(), 4),
+            "hedges_won": self.hedges_won,
+            "cancelled": self.cancelled,
+        }
+
+
+class ModelRouter:
+    """
+    Routes each completion to the model in the task's pool with the lowest expected latency to
+    a usable answer (median latency scaled up by error and invalid-JSON rates). Models without
+    enough samples are tried first, and a small share of calls explores at random. Hedged calls
+    start a backup request on the next-best model once the primary passes its own p95 latency;
+    the first usable answer wins and the other request is cancelled.
+    """
+
+    def __init__(self, complete=None, stream_complete=None):
+        self.complete = complete or chat_content
+        self.stream_complete = stream_complete or stream_chat
+        self.stats = {}
+        self.lock = threading.RLock()
+
+    def _stats(self, model) -> ModelStats:
+        with self.lock:
+            stats = self.stats.get(model)
+            if stats is None:
+                stats = self.stats[model] = ModelStats()
+            return stats
+
+    def record(self, model: str, latency: float, ok: bool = True, json_valid: bool = None):
+        stats = self._stats(model)
+        with self.lock:
+            stats.calls += 1
+            stats.latencies.append(latency)
+            if not ok:
+                stats.errors += 1
+            if json_valid is not None:
+                stats.json_checked += 1
+                stats.json_valid += bool(json_valid)
+
+    def ranked(self, models):
+        """Eligible models, best first."""
+        models = list(models)
+        if len(models) > 1 and random.random() < EXPLORE_RATE:
+            random.shuffle(models)
+            return models
+        cold = [m for m in models if len(self._stats(m).latencies) < MIN_SAMPLES]
+        warm = [m for m in models if m not in cold]
+        cold.sort(key=lambda m: self._stats(m).calls)
+        warm.sort(key=lambda m: self._stats(m).expected_latency())
+        return cold + warm
+
+    def hedge_delay(self, model: str) -> float:
+        stats = self._stats(model)
+        if len(stats.latencies) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(stats.percentile(0.95), MIN_HEDGE_DELAY)
+
+    def _cancelled(self, model, started):
+        # A cancelled call was at least this slow; keep that in its latency window.
+        stats = self._stats(model)
+        with self.lock:
+            stats.latencies.append(time.monotonic() - started)
+            stats.cancelled += 1
+
+    def _json_valid(self, content, json_output):
+        if not json_output:
+            return None
+        try:
+            json.loads(content)
+            return True
+        except (TypeError, ValueError):
+            return False
+
+    async def _attempt(self, model, messages, json_output, **kwargs):
+        """One timed call. Returns (model, content, usable); raises what the call raised."""
+        started = time.monotonic()
+        try:
+            content = await self.complete(model, messages, **kwargs)
+        except asyncio.CancelledError:
+            self._cancelled(model, started)
+            raise
+        except Exception:
+            self.record(model, time.monotonic() - started, ok=False)
+            raise
+        valid = self._json_valid(content, json_output)
+        self.record(model, time.monotonic() - started, json_valid=valid)
+        return model, content, valid is not False
+
+    async def route(self, task_complexity: str, messages, max_tokens: int = None, temperature: float = None,
+                    json_output: bool = False, hedge: bool = False, models=None, service: str = None):
+        """
+        Complete `messages` on the best model for the task. Returns (model, content). With
+        `hedge`, a backup request races the primary after the primary's p95 latency.
+        `service` names the calling AI service in metrics.
+        """
+        ranked = self.ranked(models or model_pool(task_complexity))
+        kwargs = {"max_tokens": max_tokens, "temperature": temperature, "service": service}
+        if not hedge or len(ranked) < 2 or os.getenv("MODEL_ROUTER_HEDGE", "1") == "0":
+            model, content, _ = await self._attempt(ranked[0], messages, json_output, **kwargs)
+            return model, content
+        primary = asyncio.ensure_future(self._attempt(ranked[0], messages, json_output, **kwargs))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay(ranked[0]))
+            if done and primary.exception() is None and primary.result()[2]:
+                return primary.result()[:2]
+            log.info("hedging model request", extra={"model": ranked[0], "backup": ranked[1], "service": service})
+            backup = asyncio.ensure_future(self._attempt(ranked[1], messages, json_output, **kwargs))
+            pending.add(backup)
+            finished = list(done)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    finished.append(task)
+                    if task.exception() is None and task.result()[2]:
+                        if task is backup:
+                            with self.lock:
+                                self._stats(ranked[1]).hedges_won += 1
+                        return task.result()[:2]
+            # Neither answer was usable: return the first one that completed, or its error.
+            for task in finished:
+                if task.exception() is None:
+                    return task.result()[:2]
+            raise finished[0].exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, task_complexity: str, messages, max_tokens: int = None, temperature: float = None,
+                     json_output: bool = False, models=None, service: str = None):
+        """
+        Streamed completion on the best model for the task; yields content deltas. Streams are
+        not hedged, since their first items arrive long before a p95. Stats are recorded when
+        the stream ends.
+        """
+        model = self.ranked(models or model_pool(task_complexity))[0]
+        log.debug("streaming completion", extra={"model": model, "service": service})
+        started = time.monotonic()
+        parts = []
+        try:
+            async for delta in self.stream_complete(model, messages, max_tokens=max_tokens, temperature=temperature, service=service):
+                parts.append(delta)
+                yield delta
+        except (asyncio.CancelledError, GeneratorExit):
+            self._cancelled(model, started)
+            raise
+        except Exception:
+            self.record(model, time.monotonic() - started, ok=False)
+            raise
+        self.record(model, time.monotonic() - started, json_valid=self._json_valid("".join(parts), json_output))
+
+    def snapshot(self):
+        with self.lock:
+            models = list(self.stats)
+        return {model: self._stats(model).snapshot() for model in models}
+
+
+_router = None
+
+
+def _router_samples(router):
+    snapshot = router.snapshot()
+    for name, key, help in (
+        ("ai_model_latency_p95_seconds", "p95", "Rolling p95 latency per model."),
+        ("ai_model_error_rate", "error_rate", "Share of calls per model that failed."),
+        ("ai_model_json_validity", "json_validity", "Share of JSON answers per model that parsed."),
+    ):
+        yield name, "gauge", help, [({"model": model}, stats[key]) for model, stats in snapshot.items() if stats[key] is not None]
+
+
+def get_model_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        from app.utils.metrics import REGISTRY
+        _router = ModelRouter()
+        REGISTRY.collector(lambda: _router_samples(_router))
+    return _router
+
+
+async def route_content(task_complexity: str, messages, **kwargs):
+    """Shorthand for get_model_router().route(...)."""
+    return await get_model_router().route(task_complexity, messages, **kwargs)
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import asyncio
+import httpx
+from termcolor import cprint
+from app.utils.metrics import observe_upstream, record_tokens
+
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+# Per-call read timeout for a completion; connecting should never take long.
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", 30))
+OPENROUTER_CONNECT_TIMEOUT = 5
+# Max concurrent in-flight completions (and pooled keep-alive connections) per process.
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", 16))
+
+# Token estimate when the response carries no usage (streams): ~4 characters per token.
+CHARS_PER_TOKEN = 4
+
+# The client and semaphore are bound to the event loop that created them.
+_client = None
+# Optional TokenBucket every request waits on first (the year-end batch installs one, see app/batch.py).
+_throttle = None
+
+
+def set_throttle(bucket):
+    """Make every OpenRouter request take a token from `bucket` (a rate_limiter.TokenBucket), or None to stop."""
+    global _throttle
+    _throttle = bucket
+
+
+def _get_client():
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client[0] is not loop or _client[1].is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OPENROUTER_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OPENROUTER_MAX_CONNECTIONS, max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS),
+        )
+        _client = (loop, client, asyncio.Semaphore(OPENROUTER_MAX_CONNECTIONS))
+    return _client[1], _client[2]
+
+
+def _request(model: str, messages, max_tokens: int = None, temperature: float = None, stream: bool = False):
+    payload = {"model": model, "messages": messages}
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    if temperature is not None:
+        payload["temperature"] = temperature
+    if stream:
+        payload["stream"] = True
+    headers = {
+        "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+    return headers, payload
+
+
+def _estimate_tokens(text) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+async def chat_completion(model: str, messages, max_tokens: int = None, temperature: float = None, timeout: float = None,
+                          service: str = None):
+    """
+    POST a chat completion to OpenRouter on the shared pooled client and return the parsed
+    response body. Raises httpx errors (including timeouts) to the caller. `service` labels
+    the token counts in /metrics.
+    """
+    headers, payload = _request(model, messages, max_tokens, temperature)
+    client, semaphore = _get_client()
+    if _throttle is not None:
+        await _throttle.acquire()
+    started = time.perf_counter()
+    async with semaphore:
+        try:
+            resp = await client.post(
+                OPENROUTER_URL, headers=headers, json=payload,
+                timeout=httpx.Timeout(timeout or OPENROUTER_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+            )
+        except httpx.TransportError as e:
+            observe_upstream("openrouter", time.perf_counter() - started, type(e).__name__)
+            raise
+    observe_upstream("openrouter", time.perf_counter() - started, resp.status_code, len(resp.content))
+    resp.raise_for_status()
+    body = resp.json()
+    usage = body.get("usage") or {}
+    record_tokens(service, usage.get("prompt_tokens") or _estimate_tokens(json.dumps(messages)), usage.get("completion_tokens") or 0)
+    return body
+
+
+async def stream_chat(model: str, messages, max_tokens: int = None, temperature: float = None, timeout: float = None,
+                      service: str = None):
+    """
+    Streamed chat completion: yields the content deltas of the first choice as OpenRouter
+    sends them (server-sent events). `timeout` bounds each read, not the whole stream.
+    Token counts are estimated from the text, since streams carry no usage by default.
+    """
+    headers, payload = _request(model, messages, max_tokens, temperature, stream=True)
+    client, semaphore = _get_client()
+    if _throttle is not None:
+        await _throttle.acquire()
+    started = time.perf_counter()
+    received = 0
+    status = "cancelled"
+    try:
+        async with semaphore:
+            async with client.stream(
+                "POST", OPENROUTER_URL, headers=headers, json=payload,
+                timeout=httpx.Timeout(timeout or OPENROUTER_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+            ) as resp:
+                status = resp.status_code
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    # Blank lines separate events; lines starting with ":" are keep-alive comments.
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    if "error" in event:
+                        raise RuntimeError(event["error"].get("message", "OpenRouter stream error"))
+                    choices = event.get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        received += len(delta)
+                        yield delta
+    except httpx.TransportError as e:
+        status = type(e).__name__
+        raise
+    finally:
+        observe_upstream("openrouter", time.perf_counter() - started, status, received)
+        record_tokens(service, _estimate_tokens(json.dumps(messages)), received // CHARS_PER_TOKEN)
+
+
+async def chat_content(model: str, messages, max_tokens: int = None, temperature: float = None, timeout: float = None,
+                       service: str = None) -> str:
+    """Like chat_completion, but returns only the first choice's message content."""
+    body = await chat_completion(model, messages, max_tokens, temperature, timeout, service)
+    return body["choices"][0]["message"]["content"]
+
+
+async def close_openrouter_client():
+    """Close the pooled OpenRouter client (called on application shutdown)."""
+    global _client
+    if _client is not None and _client[0] is asyncio.get_running_loop():
+        await _client[1].aclose()
+        cprint("[INFO] OpenRouter client closed.", "cyan")
+    _client = None
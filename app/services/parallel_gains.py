@@ -0,0 +1,217 @@
+import os
+import heapq
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+from termcolor import cprint
+from app.services.cost_basis import CostBasisEngine, TaxEvent, batch_event_rows, calculate_gains, event_value, events_from_batch
+from app.utils.transaction_batch import MISSING, TransactionBatch, from_fixed, usd_decimal
+
+# Below this many taxable events the pool's overhead outweighs the gain; run in-process.
+DEFAULT_MIN_PARALLEL_EVENTS = 50000
+# Shards per worker: more, smaller shards even out assets of very different sizes.
+SHARDS_PER_WORKER = 2
+
+# One tax event per row; `asset`, `lot` and `tx` index the string tables passed with the shard.
+# Quantity (signed fixed point) and the raw USD columns are the batch's own; workers compute
+# the event value from them in Decimal, with the batch's exact values where it has them.
+EVENT_DTYPE = np.dtype([
+    ("timestamp", np.int64), ("asset", np.int32), ("side", np.int8), ("quantity", np.int64),
+    ("price", np.float64), ("value", np.float64), ("fee", np.float64), ("lot", np.int32), ("tx", np.int64),
+])
+
+_pool = None
+
+
+def worker_count() -> int:
+    return int(os.getenv("TAX_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Process-wide pool for CPU-bound tax work. Workers are spawned, not forked, so they never
+    inherit the server's threads or open SQLite connections; they start once and are reused.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=worker_count(), mp_context=multiprocessing.get_context("spawn"))
+        cprint(f"[INFO] Tax process pool started with {worker_count()} workers.", "cyan")
+    return _pool
+
+
+def close_process_pool():
+    """Shut the pool down (called on application shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+class SharedEvents:
+    """
+    Tax events of a batch in one shared-memory block, sorted by asset and then event order, so
+    each asset is a contiguous slice. The block holds the event records followed by the
+    transaction ids (UTF-8, with an offsets array). Workers attach by name via `spec`; nothing
+    but the spec and a shard's row ranges is pickled. Use as a context manager: the block is
+    unlinked on exit.
+    """
+
+    def __init__(self, events, tx_ids):
+        encoded = [(tx_id if isinstance(tx_id, str) else "" if tx_id is None else str(tx_id)).encode() for tx_id in tx_ids]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        size = events.nbytes + offsets.nbytes + int(offsets[-1])
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.spec = (self.shm.name, len(events), len(encoded), int(offsets[-1]))
+        records, id_offsets, blob = _views(self.shm.buf, *self.spec[1:])
+        records[:] = events
+        id_offsets[:] = offsets
+        blob[:] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        del records, id_offsets, blob
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _views(buffer, n_events: int, n_ids: int, id_bytes: int):
+    records = np.ndarray(n_events, dtype=EVENT_DTYPE, buffer=buffer)
+    offsets = np.ndarray(n_ids + 1, dtype=np.int64, buffer=buffer, offset=records.nbytes)
+    blob = np.ndarray(id_bytes, dtype=np.uint8, buffer=buffer, offset=records.nbytes + offsets.nbytes)
+    return records, offsets, blob
+
+
+def event_table(batch, rows, sides):
+    """
+    Tax events (from batch_event_rows) as an EVENT_DTYPE array sorted by (asset, event order),
+    and the per-asset row ranges [(asset id, start, end)].
+    """
+    events = np.empty(len(rows), dtype=EVENT_DTYPE)
+    events["timestamp"] = batch.timestamp[rows]
+    events["asset"] = batch.token[rows]
+    events["side"] = sides[rows]
+    events["quantity"] = batch.amount[rows]
+    events["price"] = batch.price_usd[rows]
+    events["value"] = batch.value_usd[rows]
+    events["fee"] = batch.fee_usd[rows]
+    events["lot"] = batch.lot_id[rows]
+    events["tx"] = rows
+    # `rows` is already in event order, so a stable sort on asset keeps it within each asset.
+    events = events[np.argsort(events["asset"], kind="stable")]
+    assets, starts, counts = np.unique(events["asset"], return_index=True, return_counts=True)
+    ranges = [(int(a), int(s), int(s + c)) for a, s, c in zip(assets, starts, counts)]
+    return events, ranges
+
+
+def plan_shards(ranges, shards: int):
+    """
+    Group per-asset ranges into at most `shards` shards of similar event counts (largest asset
+    first onto the lightest shard). One asset is never split: its lots must be matched in order.
+    """
+    heap = [(0, i, []) for i in range(max(1, min(shards, len(ranges))))]
+    for asset, start, end in sorted(ranges, key=lambda r: r[1] - r[2]):
+        load, i, members = heapq.heappop(heap)
+        members.append((start, end))
+        heapq.heappush(heap, (load + end - start, i, members))
+    return [members for _, _, members in sorted(heap, key=lambda entry: entry[1]) if members]
+
+
+def _gains_shard(spec, ranges, assets, lots, method, exact_rows):
+    """
+    Worker: run one shard's assets through a CostBasisEngine and return its state.
+    `exact_rows` holds the shard's entries of TransactionBatch.exact ({row: {column: Decimal}}).
+    """
+    shm = shared_memory.SharedMemory(name=spec[0])
+    try:
+        records, offsets, blob = _views(shm.buf, *spec[1:])
+        engine = CostBasisEngine(method)
+        for start, end in ranges:
+            chunk = records[start:end]
+            rows = chunk.tolist()
+            id_offsets = offsets[chunk["tx"]].tolist()
+            id_ends = offsets[chunk["tx"] + 1].tolist()
+            for (timestamp, asset, side, quantity, price, value, fee, lot, row), id_start, id_end in zip(rows, id_offsets, id_ends):
+                tx_id = bytes(blob[id_start:id_end]).decode() or None
+                exact = exact_rows.get(row) or {}
+                quantity = abs(exact["amount"] if "amount" in exact else from_fixed(quantity))
+                usd = [exact[name] if name in exact else usd_decimal(raw) for name, raw in zip(TransactionBatch.USD_COLUMNS, (price, value, fee))]
+                engine.process(TaxEvent(
+                    timestamp, assets[asset] if asset != MISSING else None, side, quantity,
+                    event_value(side, quantity, *usd), lots[lot] if lot != MISSING else None, tx_id,
+                ))
+            del chunk
+        del records, offsets, blob
+        return engine.state()
+    finally:
+        shm.close()
+
+
+def _shard_rows(events, ranges, by_row):
+    """The entries of {batch row: value} that belong to a shard's event ranges."""
+    if not by_row:
+        return {}
+    rows = np.concatenate([events["tx"][start:end] for start, end in ranges])
+    return {int(row): by_row[int(row)] for row in rows[np.isin(rows, np.fromiter(by_row, dtype=np.int64))]}
+
+
+def calculate_batch_gains(batch, owned_addresses=None, method: str = "fifo", workers: int = None, min_events: int = None):
+    """
+    Realized gains for a TransactionBatch (same shape as calculate_gains, plus `skipped` and
+    `shards`). Lots are matched per asset, so assets are sharded across the process pool over a
+    shared-memory event table, and the shards' engines are merged. Small inputs, or one worker,
+    run in-process.
+    """
+    workers = workers or worker_count()
+    min_events = min_events if min_events is not None else int(os.getenv("TAX_PARALLEL_MIN_EVENTS", DEFAULT_MIN_PARALLEL_EVENTS))
+    rows, sides, _, skipped = batch_event_rows(batch, owned_addresses)
+    events, ranges = event_table(batch, rows, sides)
+    if workers <= 1 or len(events) < min_events or len(ranges) < 2:
+        result = calculate_gains(events_from_batch(batch, owned_addresses)[0], method)
+        result.update(skipped=skipped, shards=1)
+        return result
+    if skipped:
+        cprint(f"[WARN] Skipped {skipped} transactions without timestamp or USD value.", "yellow")
+    shards = plan_shards(ranges, workers * SHARDS_PER_WORKER)
+    assets, lots = batch.tables["tokens"].values, batch.tables["lots"].values
+    exact_rows = batch.exact_rows()
+    total = CostBasisEngine(method)
+    with SharedEvents(events, batch.ids) as shared:
+        futures = [
+            get_process_pool().submit(_gains_shard, shared.spec, shard, assets, lots, method, _shard_rows(events, shard, exact_rows))
+            for shard in shards
+        ]
+        try:
+            for future in futures:
+                total.merge(CostBasisEngine.from_state(method, future.result()))
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory): start a fresh pool next time.
+            close_process_pool()
+            raise
+    result = total.result()
+    result.update(skipped=skipped, shards=len(shards))
+    return result
+
+
+def _rebuild_ledger(user_id, method):
+    """Worker: rebuild one user's tax ledger; the stores open from the environment the pool inherited."""
+    from app.services.tax_ledger import get_tax_ledger
+    get_tax_ledger().rebuild(user_id, method, False)
+
+
+async def rebuild_ledger_in_pool(user_id: str, method: str = "fifo"):
+    """
+    Rebuild a user's tax ledger (TaxLedger.rebuild, without re-matching transfers) in the
+    process pool, so the year-end batch's users in flight run on separate cores. Only the user
+    id and method are pickled; the worker reads the stores and writes the ledger itself.
+    """
+    try:
+        await asyncio.wrap_future(get_process_pool().submit(_rebuild_ledger, user_id, method))
+    except BrokenProcessPool:
+        close_process_pool()
+        raise
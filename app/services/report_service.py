@@ -0,0 +1,155 @@
+import io
+import os
+import csv
+import uuid
+import hashlib
+from datetime import datetime, timezone
+from termcolor import cprint
+from app.services.cost_basis import CENT
+from app.utils.pdf_stream import iter_pdf
+
+
+def build_report_summary(user_id: str = "default", store=None):
+    """Holdings summary for a user: net token flows across every stored wallet."""
+    from app.utils.tx_store import get_store
+    store = store or get_store()
+    owned = [w["address"] for w in store.get_wallets(user_id)]
+    batch = store.load_user_batch(user_id)
+    holdings = batch.net_flows(owned)
+    cprint(f"[INFO] Report summary for {user_id}: {len(batch)} transactions.", "cyan")
+    return {
+        "user_id": user_id,
+        "transactions": len(batch),
+        "net_flows": {token: str(amount.normalize()) for token, amount in holdings.items()},
+    }
+
+
+DEFAULT_REPORT_CACHE_DIR = "data/reports"
+# Flush streamed text in chunks of about this many bytes.
+CHUNK_BYTES = 64 * 1024
+
+REPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "form8949": ("text/csv", "csv"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+CSV_COLUMNS = ["asset", "quantity", "date_acquired", "date_sold", "proceeds_usd", "cost_basis_usd", "gain_usd", "term", "lot_id", "tx_id"]
+FORM_8949_COLUMNS = [
+    "(a) Description of property", "(b) Date acquired", "(c) Date sold or disposed of", "(d) Proceeds",
+    "(e) Cost or other basis", "(f) Code(s)", "(g) Amount of adjustment", "(h) Gain or (loss)",
+]
+FORM_8949_PARTS = (
+    (False, "Part I - Short-Term. Transactions involving capital assets you held 1 year or less"),
+    (True, "Part II - Long-Term. Transactions involving capital assets you held more than 1 year"),
+)
+# Fixed-width layout of the PDF table (Form 8949 columns a-e and h).
+PDF_WIDTHS = (34, 12, 12, 16, 16, 16)
+
+
+def _date(timestamp: int, fmt: str = "%m/%d/%Y") -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime(fmt)
+
+
+def _usd(value) -> str:
+    return str(value.quantize(CENT))
+
+
+def _form_8949_fields(disposal):
+    acquired = "VARIOUS" if disposal.lot_id is None else _date(disposal.acquired_at)
+    return [
+        f"{disposal.quantity.normalize():f} {disposal.asset}", acquired, _date(disposal.disposed_at),
+        _usd(disposal.proceeds), _usd(disposal.cost_basis), "", "", _usd(disposal.gain),
+    ]
+
+
+def _csv_chunks(rows):
+    """Encode CSV rows into byte chunks of about CHUNK_BYTES."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _csv_rows(disposals):
+    yield CSV_COLUMNS
+    for d in disposals:
+        yield [
+            d.asset, f"{d.quantity.normalize():f}", _date(d.acquired_at, "%Y-%m-%d"), _date(d.disposed_at, "%Y-%m-%d"),
+            _usd(d.proceeds), _usd(d.cost_basis), _usd(d.gain), "long" if d.long_term else "short", d.lot_id or "", d.tx_id or "",
+        ]
+
+
+def _form_8949_rows(ledger, user_id, method, year):
+    # One pass over the disposals per part keeps memory flat instead of sorting them by term.
+    for long_term, title in FORM_8949_PARTS:
+        yield [title]
+        yield FORM_8949_COLUMNS
+        for d in ledger.iter_disposals(user_id, method, year):
+            if d.long_term == long_term:
+                yield _form_8949_fields(d)
+        yield []
+
+
+def _pdf_lines(ledger, user_id, method, year):
+    for long_term, title in FORM_8949_PARTS:
+        yield title
+        for d in ledger.iter_disposals(user_id, method, year):
+            if d.long_term == long_term:
+                fields = _form_8949_fields(d)
+                fields = fields[:5] + fields[7:]
+                yield "".join(value[: width - 1].ljust(width) for value, width in zip(fields, PDF_WIDTHS))
+        yield ""
+
+
+def iter_report(ledger, user_id: str, report_format: str, method: str = "fifo", year: int = None):
+    """Yield the realized-gains report as byte chunks; disposals are streamed from the tax ledger."""
+    if report_format == "csv":
+        return _csv_chunks(_csv_rows(ledger.iter_disposals(user_id, method, year)))
+    if report_format == "form8949":
+        return _csv_chunks(_form_8949_rows(ledger, user_id, method, year))
+    if report_format == "pdf":
+        header = ["".join(name[: width - 1].ljust(width) for name, width in zip(FORM_8949_COLUMNS[:5] + FORM_8949_COLUMNS[7:], PDF_WIDTHS))]
+        title = f"Form 8949 worksheet - {user_id} - {year or 'all years'} ({method.upper()})"
+        return iter_pdf(_pdf_lines(ledger, user_id, method, year), header, title)
+    raise ValueError(f"Unsupported report format '{report_format}'. Use one of {', '.join(REPORT_FORMATS)}.")
+
+
+def report_cache_path(user_id: str, report_format: str, method: str, year, version: str) -> str:
+    """Cache file for a report; the name changes with the ledger's data version."""
+    cache_dir = os.getenv("REPORT_CACHE_DIR", DEFAULT_REPORT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    prefix = hashlib.sha256(f"{user_id}|{report_format}|{method}|{year}".encode("utf-8")).hexdigest()[:24]
+    digest = hashlib.sha256(version.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{prefix}.{digest}.{REPORT_FORMATS[report_format][1]}")
+
+
+def iter_and_cache(chunks, path: str):
+    """
+    Pass chunks through while writing them to `path`. The file only appears once the report
+    is complete (older versions of the same report are then removed); an aborted download leaves nothing behind.
+    """
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    complete = False
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp, path)
+        complete = True
+        prefix = os.path.basename(path).split(".")[0]
+        directory = os.path.dirname(path)
+        for name in os.listdir(directory):
+            if name.startswith(prefix + ".") and not name.endswith(".tmp") and os.path.join(directory, name) != path:
+                os.remove(os.path.join(directory, name))
+        cprint(f"[INFO] Report cached at {path}.", "cyan")
+    finally:
+        if not complete and os.path.exists(tmp):
+            os.remove(tmp)
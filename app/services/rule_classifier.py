@@ -0,0 +1,184 @@
+import numpy as np
+
+# Known contracts per chain: (chain, lowercase address) -> (protocol, default action).
+KNOWN_CONTRACTS = {
+    ("eth", "0x7a250d5630b4cf539739df2c5dacb4c659f2488d"): ("Uniswap V2", "swap"),
+    ("eth", "0xe592427a0aece92de3edee1f18e0157c05861564"): ("Uniswap V3", "swap"),
+    ("eth", "0x68b3465833fb72a70ecdf485e0e4c7bd8665fc45"): ("Uniswap V3", "swap"),
+    ("eth", "0x3fc91a3afd70395cd496c647d5a6cc9d4b2b7fad"): ("Uniswap", "swap"),
+    ("eth", "0xc36442b4a4522e871399cd717abdd847ab11fe88"): ("Uniswap V3", "lp"),
+    ("eth", "0xd9e1ce17f2641f24ae83637ab66a2cca9c378b9f"): ("SushiSwap", "swap"),
+    ("eth", "0x1111111254eeb25477b68fb85ed929f73a960582"): ("1inch", "swap"),
+    ("eth", "0xdef1c0ded9bec7f1a1670819833240f027b25eff"): ("0x", "swap"),
+    ("eth", "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"): ("WETH", "wrap"),
+    ("eth", "0xae7ab96520de3a18e5e111b5eaab095312d7fe84"): ("Lido", "staking"),
+    ("eth", "0x7d2768de32b0b80b7a3454c06bdac94a69ddc7a9"): ("Aave V2", "lending"),
+    ("eth", "0x87870bca3f3fd6335c3f4ce8392d69350b4fa4e2"): ("Aave V3", "lending"),
+    ("eth", "0x4ddc2d193948926d02f9b1fe9e1daa0718270ed5"): ("Compound", "lending"),
+    ("eth", "0x00000000006c3852cbef3e08e8df289169ede581"): ("OpenSea Seaport", "nft_trade"),
+    ("eth", "0x00000000000000adc04c56bf30ac9d3c0aaf14dc"): ("OpenSea Seaport", "nft_trade"),
+    ("eth", "0x000000000000ad05ccc4f10045630fb830b95127"): ("Blur", "nft_trade"),
+    ("base", "0x3fc91a3afd70395cd496c647d5a6cc9d4b2b7fad"): ("Uniswap", "swap"),
+    ("base", "0x4200000000000000000000000000000000000006"): ("WETH", "wrap"),
+    ("arbitrum", "0xe592427a0aece92de3edee1f18e0157c05861564"): ("Uniswap V3", "swap"),
+    ("arbitrum", "0x82af49447d8a07e3bd95bd0d56f35241523fbab1"): ("WETH", "wrap"),
+}
+
+# 4-byte function selectors -> action.
+METHOD_SELECTORS = {
+    "0xa9059cbb": "transfer",       # transfer(address,uint256)
+    "0x23b872dd": "transfer",       # transferFrom(address,address,uint256)
+    "0x095ea7b3": "approval",       # approve(address,uint256)
+    "0x7ff36ab5": "swap",           # swapExactETHForTokens
+    "0x38ed1739": "swap",           # swapExactTokensForTokens
+    "0x18cbafe5": "swap",           # swapExactTokensForETH
+    "0x414bf389": "swap",           # exactInputSingle
+    "0xc04b8d59": "swap",           # exactInput
+    "0x3593564c": "swap",           # execute (Universal Router)
+    "0xe8e33700": "lp_add",         # addLiquidity
+    "0xf305d719": "lp_add",         # addLiquidityETH
+    "0x88316456": "lp_add",         # mint (position manager)
+    "0xbaa2abde": "lp_remove",      # removeLiquidity
+    "0x02751cec": "lp_remove",      # removeLiquidityETH
+    "0x0c49ccbe": "lp_remove",      # decreaseLiquidity
+    "0xfc6f7865": "lp_collect",     # collect
+    "0xd0e30db0": "wrap",           # deposit() (WETH)
+    "0x2e1a7d4d": "unwrap",         # withdraw(uint256) (WETH)
+    "0xa1903eab": "staking",        # submit (Lido)
+    "0xe8eda9df": "lending",        # deposit (Aave V2)
+    "0x617ba037": "lending",        # supply (Aave V3)
+    "0xa415bcad": "borrow",         # borrow (Aave V3)
+    "0x573ade81": "repay",          # repay (Aave V3)
+    "0xfb0f3ee1": "nft_trade",      # fulfillBasicOrder (Seaport)
+    "0xe7acab24": "nft_trade",      # fulfillAdvancedOrder (Seaport)
+    "0x87201b41": "nft_trade",      # fulfillAvailableAdvancedOrders (Seaport)
+    "0x42842e0e": "nft_transfer",   # safeTransferFrom (ERC-721)
+    "0xf242432a": "nft_transfer",   # safeTransferFrom (ERC-1155)
+}
+
+# Types that are already definitive: exchange imports and Helius enhanced transaction types.
+KNOWN_TYPES = {
+    "buy": "trade", "sell": "trade", "income": "income", "staking": "staking", "airdrop": "airdrop",
+    "mining": "mining", "reward": "income", "interest": "income", "send": "transfer", "receive": "transfer",
+    "swap": "swap", "nft_sale": "nft_trade", "nft_mint": "nft_mint", "nft_listing": "nft_listing",
+    "nft_bid": "nft_listing", "nft_cancel_listing": "nft_listing", "burn": "burn", "burn_nft": "burn",
+    "stake_sol": "staking", "unstake_sol": "staking", "add_liquidity": "lp_add", "withdraw_liquidity": "lp_remove",
+    "compressed_nft_mint": "nft_mint",
+}
+
+NATIVE_TOKENS = {"eth": "ETH", "base": "ETH", "arbitrum": "ETH", "solana": "SOL", "bitcoin": "BTC"}
+
+
+def _result(tx, tx_type, explanation, protocol=None):
+    result = {"id": tx.get("id"), "type": tx_type, "explanation": explanation, "source": "rules"}
+    if protocol:
+        result["protocol"] = protocol
+    return result
+
+
+def classify_transaction(tx):
+    """
+    Deterministic classification from explicit types, known contract addresses, method
+    selectors and native-coin transfers. Returns a result dict, or None when ambiguous.
+    """
+    tx_type = (tx.get("type") or "").lower()
+    if tx_type in KNOWN_TYPES:
+        return _result(tx, KNOWN_TYPES[tx_type], f"Source reported type '{tx_type}'.")
+    chain = (tx.get("chain") or "eth").lower()
+    to = (tx.get("to") or "").lower()
+    data = tx.get("input") or tx.get("method_id") or ""
+    selector = data[:10].lower() if data.startswith("0x") and len(data) >= 10 else None
+    contract = KNOWN_CONTRACTS.get((chain, to))
+    action = METHOD_SELECTORS.get(selector) if selector else None
+    if contract:
+        protocol, default_action = contract
+        return _result(tx, action or default_action, f"Call to {protocol} contract.", protocol)
+    if action and action in ("transfer", "approval", "nft_transfer", "wrap", "unwrap"):
+        # Generic token methods mean the same thing on any contract.
+        return _result(tx, action, f"Standard token method {selector}.")
+    if chain == "bitcoin":
+        return _result(tx, "transfer", "Bitcoin transfer.")
+    if tx_type in ("", "transfer") and not selector and tx.get("token") == NATIVE_TOKENS.get(chain):
+        return _result(tx, "transfer", f"Plain {tx.get('token')} transfer.")
+    return None
+
+
+def split_by_rules(transactions):
+    """
+    Classify what the rules can. Returns (results, ambiguous_indices), where `results` has
+    one entry per transaction and None at positions the rules could not decide.
+    """
+    results = [classify_transaction(tx) for tx in transactions]
+    return results, [i for i, result in enumerate(results) if result is None]
+
+
+def classify_batch(batch):
+    """
+    Vectorized rule pass over a TransactionBatch (no calldata, so selector rules do not apply).
+    Returns (type_names, protocols) object arrays with None for ambiguous rows.
+    """
+    from app.utils.transaction_batch import MISSING
+
+    tables = batch.tables
+    actions = sorted(set(KNOWN_TYPES.values()) | {action for _, action in KNOWN_CONTRACTS.values()} | {"transfer"})
+    action_codes = {action: code for code, action in enumerate(actions)}
+    protocol_names = sorted({protocol for protocol, _ in KNOWN_CONTRACTS.values()})
+    # Explicit types: one lookup per interned type, then a gather (index -1 hits the trailing "undecided").
+    type_codes = np.array([action_codes.get(KNOWN_TYPES.get(t.lower()), -1) for t in tables["types"].values] + [-1], dtype=np.int16)
+    codes = type_codes[batch.type]
+    protocol_codes = np.full(len(batch), -1, dtype=np.int16)
+    # Known contracts: one mask per contract that actually occurs in this batch.
+    for (chain, address), (protocol, action) in KNOWN_CONTRACTS.items():
+        chain_id, address_id = tables["chains"].get(chain), tables["addresses"].get(address)
+        if chain_id == MISSING or address_id == MISSING:
+            continue
+        rows = (codes == -1) & (batch.chain == chain_id) & (batch.to_addr == address_id)
+        codes[rows] = action_codes[action]
+        protocol_codes[rows] = protocol_names.index(protocol)
+    # Native-coin transfers; every Bitcoin transaction is a transfer.
+    transfer_id = tables["types"].get("transfer")
+    for chain, token in NATIVE_TOKENS.items():
+        chain_id = tables["chains"].get(chain)
+        if chain_id == MISSING:
+            continue
+        rows = batch.chain == chain_id
+        if chain != "bitcoin":
+            rows &= (batch.token == tables["tokens"].get(token)) & (batch.type == transfer_id)
+        codes[rows & (codes == -1)] = action_codes["transfer"]
+    types = np.array(actions + [None], dtype=object)[codes]
+    protocols = np.array(protocol_names + [None], dtype=object)[protocol_codes]
+    return types, protocols
+
+
+async def classify_with_rules(transactions, classify_residue):
+    """
+    Rule pass first; only the transactions the rules leave undecided go to `classify_residue`
+    (an async AI classifier taking a transaction list). Results come back in input order.
+    An error dict from the residue classifier is returned as-is.
+    """
+    results, ambiguous = split_by_rules(transactions)
+    if ambiguous:
+        residue = await classify_residue([transactions[i] for i in ambiguous])
+        if isinstance(residue, dict) and "error" in residue:
+            return residue
+        for index, result in zip(ambiguous, residue):
+            if isinstance(result, dict):
+                result.setdefault("source", "ai")
+            results[index] = result
+    return results
+
+
+async def stream_with_rules(transactions, stream_residue):
+    """
+    Streamed classify_with_rules: yields (index, result), rule results first, then the
+    residue's results as `stream_residue` (an async iterator of (residue index, result)) yields them.
+    """
+    results, ambiguous = split_by_rules(transactions)
+    for index, result in enumerate(results):
+        if result is not None:
+            yield index, result
+    if ambiguous:
+        async for position, result in stream_residue([transactions[i] for i in ambiguous]):
+            if isinstance(result, dict):
+                result.setdefault("source", "ai")
+            yield ambiguous[position], result
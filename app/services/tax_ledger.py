@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timezone
+from termcolor import cprint
+from app.services.cost_basis import CostBasisEngine, iter_tax_rows
+
+DEFAULT_TAX_STATE_PATH = "data/tax_state.db"
+PERIODS = ("year", "month")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tax_ledgers (
+    user_id TEXT NOT NULL,
+    method TEXT NOT NULL,
+    change_seq INTEGER NOT NULL,
+    owned_hash TEXT NOT NULL,
+    period TEXT NOT NULL,
+    PRIMARY KEY (user_id, method)
+);
+CREATE TABLE IF NOT EXISTS tax_checkpoints (
+    user_id TEXT NOT NULL,
+    method TEXT NOT NULL,
+    asset TEXT NOT NULL,
+    period_start INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (user_id, method, asset, period_start)
+);
+CREATE TABLE IF NOT EXISTS tax_assets (
+    user_id TEXT NOT NULL,
+    method TEXT NOT NULL,
+    asset TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (user_id, method, asset)
+);
+CREATE TABLE IF NOT EXISTS report_versions (
+    user_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (user_id, year)
+);
+"""
+
+
+def period_start(timestamp: int, period: str = "year") -> int:
+    """Start (UTC epoch seconds) of the year or month containing `timestamp`."""
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    start = moment.replace(month=1 if period == "year" else moment.month, day=1, hour=0, minute=0, second=0, microsecond=0)
+    return int(start.timestamp())
+
+
+def next_period_start(timestamp: int, period: str = "year") -> int:
+    start = datetime.fromtimestamp(period_start(timestamp, period), tz=timezone.utc)
+    if period == "year":
+        following = start.replace(year=start.year + 1)
+    else:
+        following = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return int(following.timestamp())
+
+
+def _owned_hash(owned) -> str:
+    return hashlib.sha256("\n".join(sorted(owned)).encode("utf-8")).hexdigest()
+
+
+class _AssetRun:
+    """
+    One asset's engine while streaming its rows, writing a checkpoint at each period it enters
+    (or, with `checkpoints`, collecting them there as (period start, state) for a later write).
+    The state records the price-store fingerprint of the asset as of the start of the run.
+    """
+
+    def __init__(self, ledger, user_id, method, asset, engine=None, skipped=0, boundary=None, checkpoints=None):
+        self.ledger = ledger
+        self.user_id = user_id
+        self.method = method
+        self.asset = asset
+        self.prices = ledger._price_fingerprint(asset)
+        self.engine = engine or CostBasisEngine(method)
+        self.skipped = skipped
+        self.boundary = boundary
+        self.checkpoints = checkpoints
+
+    def feed(self, timestamp, event):
+        if timestamp is not None and (self.boundary is None or timestamp >= self.boundary):
+            start = period_start(timestamp, self.ledger.period)
+            if self.checkpoints is None:
+                self.ledger._save_checkpoint(self.user_id, self.method, self.asset, start, self.state())
+            else:
+                self.checkpoints.append((start, self.state()))
+            self.boundary = next_period_start(timestamp, self.ledger.period)
+        if event:
+            self.engine.process(event)
+        else:
+            self.skipped += 1
+
+    def state(self):
+        return {**self.engine.state(), "skipped": self.skipped, "prices": self.prices}
+
+
+class TaxLedger:
+    """
+    Incremental realized-gains state per (user, method). Self-transfers are paired first
+    (transfer_matcher) so their legs are not taxed. Lots are matched per asset, so each
+    asset has its own engine; its state is checkpointed at every period boundary (year or
+    month, TAX_CHECKPOINT_PERIOD) it crosses. When stored transactions change (merges and
+    manual edits land in the store's change log), only the changed assets are replayed, from
+    the last checkpoint before the earliest change. Rows without a stored price are priced from
+    the price store, so an asset whose price series was rewritten since its state was computed
+    (backfills, PriceStore.put) is replayed from the start. Report versions are bumped per
+    affected year.
+    """
+
+    def __init__(self, path: str = None, store=None, period: str = None):
+        self.path = path or os.getenv("TAX_STATE_PATH", DEFAULT_TAX_STATE_PATH)
+        self.period = period or os.getenv("TAX_CHECKPOINT_PERIOD", "year")
+        if self.period not in PERIODS:
+            raise ValueError(f"Unsupported checkpoint period '{self.period}'. Use one of {', '.join(PERIODS)}.")
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self._store = store
+
+    @property
+    def store(self):
+        if self._store is None:
+            from app.utils.tx_store import get_store
+            self._store = get_store()
+        return self._store
+
+    def _owned(self, user_id):
+        return [w["address"] for w in self.store.get_wallets(user_id)]
+
+    def _transactions(self, user_id, token=None, since=None):
+        from app.utils.price_oracle import get_price_oracle
+        return get_price_oracle().iter_priced(self.store.iter_user_transactions(user_id, token=token, since=since))
+
+    def _price_fingerprint(self, asset):
+        from app.utils.price_oracle import get_price_oracle
+        return get_price_oracle().store.fingerprint([asset]) if asset else ""
+
+    def _stale_prices(self, user_id, method):
+        """Assets whose price series changed since their state was computed."""
+        with self.lock:
+            states = self._asset_states(user_id, method)
+        return [asset for asset, state in states.items() if state.get("prices") != self._price_fingerprint(asset)]
+
+    def _save_checkpoint(self, user_id, method, asset, start, state):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tax_checkpoints (user_id, method, asset, period_start, state) VALUES (?, ?, ?, ?, ?)",
+            (user_id, method, asset, start, json.dumps(state)),
+        )
+
+    def _save_asset(self, user_id, method, run):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tax_assets (user_id, method, asset, state) VALUES (?, ?, ?, ?)",
+            (user_id, method, run.asset, json.dumps(run.state())),
+        )
+
+    def _asset_states(self, user_id, method):
+        rows = self.conn.execute(
+            "SELECT asset, state FROM tax_assets WHERE user_id = ? AND method = ?", (user_id, method)
+        ).fetchall()
+        return {asset: json.loads(state) for asset, state in rows}
+
+    def _bump_report_versions(self, user_id, years):
+        self.conn.executemany(
+            "INSERT INTO report_versions (user_id, year, version) VALUES (?, ?, 1) "
+            "ON CONFLICT (user_id, year) DO UPDATE SET version = version + 1",
+            [(user_id, year) for year in years],
+        )
+
+    def report_version(self, user_id: str, year: int) -> int:
+        with self.lock:
+            row = self.conn.execute("SELECT version FROM report_versions WHERE user_id = ? AND year = ?", (user_id, year)).fetchone()
+        return row[0] if row else 0
+
+    def rebuild(self, user_id: str, method: str = "fifo", match_transfers: bool = True):
+        """
+        Full pass over the user's history, writing fresh checkpoints and per-asset state.
+        `match_transfers=False` skips re-matching self-transfers when the caller just did.
+        The pass runs outside the write transaction, which only covers writing its results, so
+        rebuilds in several processes (the year-end batch) do not hold each other up. Changes
+        stored meanwhile are after the recorded change sequence and picked up by the next refresh.
+        """
+        from app.services.transfer_matcher import match_user_transfers
+        started = time.time()
+        owned = self._owned(user_id)
+        if match_transfers:
+            match_user_transfers(user_id, self.store)
+        seq = self.store.latest_change()
+        runs = {}
+        for tx, timestamp, event in iter_tax_rows(self._transactions(user_id), owned):
+            if event is None:
+                continue
+            asset = tx.get("token") or ""
+            run = runs.get(asset)
+            if run is None:
+                run = runs[asset] = _AssetRun(self, user_id, method, asset, checkpoints=[])
+            run.feed(timestamp, event)
+        with self.lock, self.conn:
+            old_years = self._years(self._asset_states(user_id, method).values())
+            for table in ("tax_checkpoints", "tax_assets"):
+                self.conn.execute(f"DELETE FROM {table} WHERE user_id = ? AND method = ?", (user_id, method))
+            for run in runs.values():
+                for start, state in run.checkpoints:
+                    self._save_checkpoint(user_id, method, run.asset, start, state)
+                self._save_asset(user_id, method, run)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tax_ledgers (user_id, method, change_seq, owned_hash, period) VALUES (?, ?, ?, ?, ?)",
+                (user_id, method, seq, _owned_hash(owned), self.period),
+            )
+            self._bump_report_versions(user_id, old_years | self._years(run.state() for run in runs.values()))
+        cprint(f"[INFO] Tax ledger rebuilt for {user_id} ({method}): {len(runs)} assets in {time.time() - started:.2f}s.", "cyan")
+
+    def replay_asset(self, user_id: str, method: str, asset: str, since: int = None):
+        """
+        Recompute one asset from the last checkpoint at or before `since` (from the start if
+        None). Returns the set of years whose results changed (plus the year of `since`, whose
+        rows changed).
+        """
+        owned = self._owned(user_id)
+        with self.lock, self.conn:
+            row = None if since is None else self.conn.execute(
+                "SELECT period_start, state FROM tax_checkpoints WHERE user_id = ? AND method = ? AND asset = ? "
+                "AND period_start <= ? ORDER BY period_start DESC LIMIT 1",
+                (user_id, method, asset, since),
+            ).fetchone()
+            if row is None:
+                start, state = None, None
+            else:
+                start, state = row[0], json.loads(row[1])
+            before = self.conn.execute(
+                "SELECT state FROM tax_assets WHERE user_id = ? AND method = ? AND asset = ?", (user_id, method, asset)
+            ).fetchone()
+            before = json.loads(before[0]) if before else None
+            self.conn.execute(
+                "DELETE FROM tax_checkpoints WHERE user_id = ? AND method = ? AND asset = ? AND period_start > ?",
+                (user_id, method, asset, start if start is not None else -2 ** 62),
+            )
+            engine = CostBasisEngine.from_state(method, state) if state else None
+            run = _AssetRun(self, user_id, method, asset, engine, state["skipped"] if state else 0,
+                            next_period_start(start, self.period) if start is not None else None)
+            for _, timestamp, event in iter_tax_rows(self._transactions(user_id, token=asset, since=start), owned):
+                if event is not None:
+                    run.feed(timestamp, event)
+            self._save_asset(user_id, method, run)
+            after = run.state()
+            changed = {datetime.fromtimestamp(since, tz=timezone.utc).year} if since is not None else set()
+            before_years, after_years = (before or {}).get("by_year", {}), after["by_year"]
+            changed |= {int(year) for year in set(before_years) | set(after_years) if before_years.get(year) != after_years.get(year)}
+            self._bump_report_versions(user_id, changed)
+        return changed
+
+    def refresh(self, user_id: str, method: str = "fifo"):
+        """
+        Bring the ledger up to date with the store: rebuild if it does not exist yet or the
+        user's wallets changed, otherwise replay only the assets in the change log since the last
+        refresh and the assets whose price series changed. Returns {"rebuilt", "assets", "years"}.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT change_seq, owned_hash, period FROM tax_ledgers WHERE user_id = ? AND method = ?", (user_id, method)
+            ).fetchone()
+            if row is None or row[1] != _owned_hash(self._owned(user_id)) or row[2] != self.period:
+                self.rebuild(user_id, method)
+                return {"rebuilt": True, "assets": [], "years": []}
+            seq, changes = self.store.changes_since(user_id, row[0])
+            if changes:
+                # Re-pair transfers of the changed tokens first; that may touch more rows.
+                from app.services.transfer_matcher import match_user_transfers
+                match_user_transfers(user_id, self.store, tokens=changes)
+                seq, changes = self.store.changes_since(user_id, row[0])
+            if None in changes or "" in changes:
+                # Rows without a token cannot be selected per asset.
+                self.rebuild(user_id, method)
+                return {"rebuilt": True, "assets": [], "years": []}
+            # Price writes are not in the change log: replay those assets from the start.
+            changes.update({asset: None for asset in self._stale_prices(user_id, method)})
+            years = set()
+            for asset, since in changes.items():
+                years |= self.replay_asset(user_id, method, asset, since)
+            with self.conn:
+                self.conn.execute("UPDATE tax_ledgers SET change_seq = ? WHERE user_id = ? AND method = ?", (seq, user_id, method))
+            return {"rebuilt": False, "assets": sorted(changes), "years": sorted(years)}
+
+    def refresh_all(self, user_id: str):
+        """Refresh every method that has a ledger for this user."""
+        with self.lock:
+            methods = [m for (m,) in self.conn.execute("SELECT method FROM tax_ledgers WHERE user_id = ?", (user_id,))]
+        return {method: self.refresh(user_id, method) for method in methods}
+
+    def result(self, user_id: str, method: str = "fifo"):
+        """Realized gains (same shape as calculate_gains), refreshed incrementally first."""
+        self.refresh(user_id, method)
+        with self.lock:
+            states = self._asset_states(user_id, method)
+        total = CostBasisEngine(method)
+        skipped = 0
+        for state in states.values():
+            total.merge(CostBasisEngine.from_state(method, state))
+            skipped += state["skipped"]
+        result = total.result()
+        result["skipped"] = skipped
+        return result
+
+    def data_version(self, user_id: str, year: int = None) -> str:
+        """Version string for report caching: changes whenever gains of `year` (or any year) change."""
+        if year is not None:
+            return f"{year}v{self.report_version(user_id, year)}"
+        with self.lock:
+            rows = self.conn.execute("SELECT year, version FROM report_versions WHERE user_id = ? ORDER BY year", (user_id,)).fetchall()
+        return "-".join(f"{y}v{v}" for y, v in rows) or "empty"
+
+    def iter_disposals(self, user_id: str, method: str = "fifo", year: int = None):
+        """
+        Stream Disposal records asset by asset (in time order within an asset), optionally only
+        those in `year`. Each asset resumes from its last checkpoint before the year and stops
+        after it, so nothing beyond open lots is held in memory.
+        """
+        self.refresh(user_id, method)
+        owned = self._owned(user_id)
+        with self.lock:
+            assets = sorted(asset for (asset,) in self.conn.execute(
+                "SELECT asset FROM tax_assets WHERE user_id = ? AND method = ?", (user_id, method)
+            ))
+        year_start = int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()) if year is not None else None
+        year_end = int(datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp()) if year is not None else None
+        for asset in assets:
+            since, state = None, None
+            if year is not None:
+                with self.lock:
+                    row = self.conn.execute(
+                        "SELECT period_start, state FROM tax_checkpoints WHERE user_id = ? AND method = ? AND asset = ? "
+                        "AND period_start <= ? ORDER BY period_start DESC LIMIT 1",
+                        (user_id, method, asset, year_start),
+                    ).fetchone()
+                if row is not None:
+                    since, state = row[0], json.loads(row[1])
+            pending = []
+            engine = CostBasisEngine.from_state(method, state, pending.append) if state else CostBasisEngine(method, pending.append)
+            # Rows without a token are stored under "" and need a full scan.
+            rows = self._transactions(user_id, token=asset or None, since=since)
+            for tx, timestamp, event in iter_tax_rows(rows, owned):
+                if not event or (tx.get("token") or "") != asset:
+                    continue
+                if year_end is not None and timestamp >= year_end:
+                    break
+                engine.process(event)
+                for disposal in pending:
+                    if year_start is None or disposal.disposed_at >= year_start:
+                        yield disposal
+                pending.clear()
+
+    @staticmethod
+    def _years(states):
+        return {int(year) for state in states for year in state["by_year"]}
+
+
+_ledger = None
+
+
+def get_tax_ledger() -> TaxLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = TaxLedger()
+    return _ledger
@@ -0,0 +1,168 @@
+import os
+import time
+import hashlib
+import numpy as np
+from termcolor import cprint
+from app.utils.transaction_batch import normalize_address
+
+# Incoming legs may arrive up to WINDOW seconds after the outgoing leg (or SKEW seconds
+# before it, for exchange clocks), with up to FEE_TOLERANCE of the amount lost to fees.
+DEFAULT_WINDOW = 6 * 3600
+DEFAULT_SKEW = 600
+DEFAULT_FEE_TOLERANCE = 0.02
+
+OUT_TYPES = {"send", "withdrawal", "transfer"}
+IN_TYPES = {"receive", "deposit", "transfer"}
+
+
+def _leg(tx, owned):
+    """(direction, token, amount, timestamp, sender, receiver) of a possible self-transfer leg, or None."""
+    tx_type = (tx.get("type") or "transfer").lower()
+    sender = normalize_address(tx.get("from"))
+    receiver = normalize_address(tx.get("to"))
+    from_owned, to_owned = sender in owned, receiver in owned
+    if from_owned and to_owned:
+        # Already internal on its own.
+        return None
+    if tx_type in OUT_TYPES and (from_owned or (not sender and tx_type != "transfer")):
+        direction = -1
+    elif tx_type in IN_TYPES and (to_owned or (not receiver and tx_type != "transfer")):
+        direction = 1
+    else:
+        return None
+    try:
+        amount, timestamp = float(tx.get("amount")), int(tx.get("timestamp"))
+    except (TypeError, ValueError):
+        return None
+    if amount <= 0 or not tx.get("token"):
+        return None
+    return direction, tx["token"].upper(), amount, timestamp, sender, receiver
+
+
+def _same_chain_mismatch(out, incoming) -> bool:
+    """
+    True when two legs on one chain name different counterparties: a transfer between the
+    user's own wallets leaves to exactly the address it arrives from. Cross-chain legs and
+    legs whose counterparty is unknown (exchange rows) cannot be checked this way.
+    """
+    out_chain, receiver = out[6]
+    in_chain, sender = incoming[6]
+    return bool(out_chain) and out_chain == in_chain and bool(receiver) and bool(sender) and receiver != sender
+
+
+def find_transfer_pairs(transactions, owned_addresses, accounts=None, window: int = None,
+                        skew: int = None, fee_tolerance: float = None):
+    """
+    Pair outgoing and incoming legs of the user's own transfers. `accounts[i]` names the
+    wallet or exchange account row i belongs to (default: its chain and owned address); legs of one pair must
+    come from different accounts. Returns [(out_index, in_index, how)] where `how` is "tx_id"
+    (hash join on the transaction id or `tx_hash`) or "window" (same token, incoming amount
+    within the fee tolerance below the outgoing amount, inside the time window). Window matches
+    on one chain also need the outgoing leg's recipient to be the incoming leg's sender.
+    """
+    window = window if window is not None else int(os.getenv("TRANSFER_MATCH_WINDOW", DEFAULT_WINDOW))
+    skew = skew if skew is not None else DEFAULT_SKEW
+    fee_tolerance = fee_tolerance if fee_tolerance is not None else float(os.getenv("TRANSFER_FEE_TOLERANCE", DEFAULT_FEE_TOLERANCE))
+    owned = {normalize_address(address) for address in owned_addresses or []}
+    outs, ins = [], []
+    for i, tx in enumerate(transactions):
+        leg = _leg(tx, owned)
+        if leg is None:
+            continue
+        if accounts is not None:
+            account = accounts[i]
+        else:
+            account = (tx.get("chain"), normalize_address(tx.get("from" if leg[0] < 0 else "to")))
+        counterparty = leg[5] if leg[0] < 0 else leg[4]
+        (outs if leg[0] < 0 else ins).append((
+            i, leg[1], leg[2], leg[3], account, tx.get("tx_hash") or tx.get("id"), ((tx.get("chain") or "").lower(), counterparty),
+        ))
+    pairs = []
+    used_in = set()
+    # Hash join: the same transaction seen from both ends.
+    ins_by_key = {}
+    for leg in ins:
+        if leg[5]:
+            ins_by_key.setdefault((leg[5], leg[1]), []).append(leg)
+    remaining = []
+    for out in outs:
+        match = None
+        for candidate in ins_by_key.get((out[5], out[1]), ()) if out[5] else ():
+            if candidate[0] not in used_in and candidate[4] != out[4]:
+                match = candidate
+                break
+        if match is None:
+            remaining.append(out)
+        else:
+            used_in.add(match[0])
+            pairs.append((out[0], match[0], "tx_id"))
+    # Windowed match per token over incoming legs sorted by time.
+    by_token = {}
+    for leg in ins:
+        if leg[0] not in used_in:
+            by_token.setdefault(leg[1], []).append(leg)
+    outs_by_token = {}
+    for out in remaining:
+        outs_by_token.setdefault(out[1], []).append(out)
+    for token, token_outs in outs_by_token.items():
+        candidates = sorted(by_token.get(token, ()), key=lambda leg: leg[3])
+        if not candidates:
+            continue
+        times = np.array([leg[3] for leg in candidates], dtype=np.int64)
+        amounts = [leg[2] for leg in candidates]
+        taken = [False] * len(candidates)
+        token_outs.sort(key=lambda leg: leg[3])
+        out_times = np.array([leg[3] for leg in token_outs], dtype=np.int64)
+        # Each outgoing leg only looks at the incoming legs inside its time window.
+        starts = np.searchsorted(times, out_times - skew, side="left").tolist()
+        ends = np.searchsorted(times, out_times + window, side="right").tolist()
+        for out, lo, hi in zip(token_outs, starts, ends):
+            high, low = out[2] * (1 + 1e-9), out[2] * (1 - fee_tolerance)
+            best, best_key = None, None
+            for j in range(lo, hi):
+                if taken[j] or not low <= amounts[j] <= high or candidates[j][4] == out[4] or _same_chain_mismatch(out, candidates[j]):
+                    continue
+                # Closest in time first, then closest amount.
+                key = (abs(candidates[j][3] - out[3]), high - amounts[j])
+                if best_key is None or key < best_key:
+                    best, best_key = j, key
+            if best is not None:
+                taken[best] = True
+                pairs.append((out[0], candidates[best][0], "window"))
+    return pairs
+
+
+def pair_id(out_key, in_key) -> str:
+    return hashlib.sha1(f"{out_key}|{in_key}".encode("utf-8")).hexdigest()[:16]
+
+
+def match_user_transfers(user_id: str, store=None, tokens=None):
+    """
+    Match self-transfers across a user's stored wallets and exchange accounts (optionally only
+    for `tokens`) and record them on the stored rows as `internal_transfer`, which the cost-basis
+    engine treats as non-taxable. Only rows whose match changed are rewritten.
+    """
+    from app.utils.tx_store import get_store
+    store = store or get_store()
+    started = time.time()
+    owned = [w["address"] for w in store.get_wallets(user_id)]
+    keys, transactions = [], []
+    for chain, address, tx_id, tx in store.iter_transfer_rows(user_id, tokens):
+        keys.append((chain, address, tx_id))
+        transactions.append(tx)
+    pairs = find_transfer_pairs(transactions, owned, [key[:2] for key in keys])
+    wanted = {}
+    counts = {"tx_id": 0, "window": 0}
+    for out_index, in_index, how in pairs:
+        match = pair_id(keys[out_index], keys[in_index])
+        wanted[out_index] = wanted[in_index] = match
+        counts[how] += 1
+    updates = [
+        (*keys[i], tx, wanted.get(i))
+        for i, tx in enumerate(transactions)
+        if tx.get("internal_transfer") != wanted.get(i)
+    ]
+    store.set_internal_transfers(updates)
+    cprint(f"[INFO] Transfer matching for {user_id}: {len(pairs)} pairs ({counts['tx_id']} by tx id, "
+           f"{counts['window']} by window) in {time.time() - started:.2f}s; {len(updates)} rows updated.", "cyan")
+    return {"rows": len(transactions), "pairs": len(pairs), "by_tx_id": counts["tx_id"], "by_window": counts["window"], "updated": len(updates)}
@@ -0,0 +1,24 @@
+import asyncio
+from fastapi import HTTPException
+from termcolor import cprint
+
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+async def cancel_on_disconnect(request, awaitable, poll_interval: float = DISCONNECT_POLL_INTERVAL):
+    """
+    Await `awaitable` while watching the HTTP client. If the client disconnects first, the
+    work is cancelled (closing any in-flight upstream calls) and HTTPException(499) is raised.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                cprint(f"[WARN] Client disconnected from {request.url.path}; cancelling work.", "yellow")
+                raise HTTPException(status_code=499, detail="Client disconnected.")
+    finally:
+        if not task.done():
+            task.cancel()
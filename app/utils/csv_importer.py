@@ -0,0 +1,289 @@
+import io
+import re
+import csv
+import hashlib
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from termcolor import cprint
+
+# Rows are written to the store in batches of this size, so memory stays flat for any file size.
+CHUNK_SIZE = 5000
+
+FIAT = {"USD", "EUR", "GBP", "CAD", "AUD", "JPY", "CHF"}
+USD_STABLES = {"USD", "USDT", "USDC", "BUSD", "DAI", "TUSD", "FDUSD"}
+# Binance quote assets, longest first so "FDUSD" wins over "USD".
+BINANCE_QUOTES = sorted(USD_STABLES | {"BTC", "ETH", "BNB", "EUR", "TRY"}, key=len, reverse=True)
+# Kraken prefixes legacy asset codes with X (crypto) or Z (fiat).
+KRAKEN_ASSETS = {"XXBT": "BTC", "XBT": "BTC", "XETH": "ETH", "XXRP": "XRP", "XLTC": "LTC", "XXLM": "XLM", "XXDG": "DOGE", "ZUSD": "USD", "ZEUR": "EUR"}
+
+# Coinbase describes both legs of a convert in its Notes column.
+COINBASE_CONVERT = re.compile(r"Converted\s+([\d.,]+)\s+(\S+)\s+to\s+([\d.,]+)\s+(\S+)", re.IGNORECASE)
+
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S UTC", "%m/%d/%Y %H:%M:%S", "%Y-%m-%d")
+
+
+def _parse_time(value: str) -> int:
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        for fmt in TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Unrecognized timestamp '{value}'")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def _number(value, units=()):
+    """
+    Parse an exchange number, dropping currency symbols and thousands separators, and a unit
+    suffix if it is one of `units` (asset symbols, so "10.51INCH" with unit 1INCH is 10.51).
+    """
+    if value is None:
+        return None
+    cleaned = value.strip().replace("$", "").replace(",", "")
+    for unit in sorted(filter(None, units), key=len, reverse=True):
+        if cleaned.upper().endswith(unit.upper()):
+            cleaned = cleaned[: -len(unit)].strip()
+            break
+    if not cleaned:
+        return None
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return None
+
+
+def _row_id(exchange: str, row, occurrence: int) -> str:
+    """
+    Id for a row without one: a hash of its fields and, for repeats, how many identical rows
+    came before it, so two fills of the same size at the same second stay distinct while the
+    id does not depend on where the row sits in the file (overlapping exports re-import cleanly).
+    """
+    fields = [exchange, *row.values()] + ([str(occurrence)] if occurrence else [])
+    return hashlib.sha1("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+
+def _tx(exchange, tx_id, timestamp, tx_type, token, amount, value_usd=None, fee_usd=None, price_usd=None):
+    tx = {
+        "id": tx_id,
+        "from": "",
+        "to": "",
+        "amount": str(abs(amount)),
+        "token": token,
+        "type": tx_type,
+        "chain": exchange,
+        "timestamp": timestamp,
+    }
+    if value_usd is not None:
+        tx["value_usd"] = str(value_usd)
+    if price_usd is not None:
+        tx["price_usd"] = str(price_usd)
+    if fee_usd:
+        tx["fee_usd"] = str(fee_usd)
+    return tx
+
+
+COINBASE_TYPES = {
+    "buy": "buy", "advanced trade buy": "buy", "sell": "sell", "advanced trade sell": "sell", "convert": "sell",
+    "send": "send", "receive": "receive", "rewards income": "income", "staking income": "income",
+    "learning reward": "income", "coinbase earn": "income", "inflation reward": "income",
+}
+
+
+def _map_coinbase(row, exchange, occurrence):
+    kind = row["Transaction Type"].strip().lower()
+    tx_type = COINBASE_TYPES.get(kind)
+    if tx_type is None:
+        return []
+    quantity = _number(row["Quantity Transacted"])
+    price = _number(row.get("Spot Price at Transaction"))
+    subtotal = _number(row.get("Subtotal"))
+    value = subtotal if subtotal is not None else (quantity * price if price is not None else None)
+    tx_id = row.get("ID") or _row_id(exchange, row, occurrence)
+    timestamp = _parse_time(row["Timestamp"])
+    txs = [_tx(exchange, tx_id, timestamp, tx_type, row["Asset"].strip(), quantity,
+               value_usd=value, fee_usd=_number(row.get("Fees and/or Spread")), price_usd=price)]
+    if kind == "convert":
+        # The row is the sell leg; the asset received is only named in the notes.
+        match = COINBASE_CONVERT.search(row.get("Notes") or "")
+        if match is None:
+            raise ValueError("Convert row without 'Converted <amount> <asset> to <amount> <asset>' notes")
+        received = _number(match.group(3))
+        if received is None:
+            raise ValueError(f"Unreadable convert amount '{match.group(3)}'")
+        txs.append(_tx(exchange, f"{tx_id}:to", timestamp, "buy", match.group(4).strip(), received, value_usd=value))
+    return txs
+
+
+KRAKEN_TYPES = {"deposit": "receive", "withdrawal": "send", "staking": "income", "earn": "income", "airdrop": "airdrop"}
+
+
+def _kraken_asset(asset: str) -> str:
+    asset = asset.strip().split(".")[0]
+    return KRAKEN_ASSETS.get(asset, asset)
+
+
+def _map_kraken(row, exchange, occurrence):
+    asset = _kraken_asset(row["asset"])
+    amount = _number(row["amount"])
+    if asset in FIAT or amount is None or amount == 0:
+        return []
+    kind = row["type"].strip().lower()
+    if kind == "trade" or kind == "spend" or kind == "receive":
+        tx_type = "buy" if amount > 0 else "sell"
+    else:
+        tx_type = KRAKEN_TYPES.get(kind)
+        if tx_type is None:
+            return []
+    # Kraken ledgers carry no USD value; pricing fills it in later.
+    return [_tx(exchange, row["txid"], _parse_time(row["time"]), tx_type, asset, amount)]
+
+
+def _split_pair(pair: str):
+    pair = pair.strip().upper().replace("/", "").replace("-", "")
+    for quote in BINANCE_QUOTES:
+        if pair.endswith(quote) and len(pair) > len(quote):
+            return pair[: -len(quote)], quote
+    raise ValueError(f"Unrecognized Binance pair '{pair}'")
+
+
+def _map_binance(row, exchange, occurrence):
+    base, quote = _split_pair(row.get("Pair") or row["Market"])
+    side = (row.get("Side") or row["Type"]).strip().lower()
+    quantity = _number(row.get("Executed") or row["Amount"], (base,))
+    total = _number(row["Total"] if "Total" in row else row["Amount"], (quote,))
+    timestamp = _parse_time(row["Date(UTC)"])
+    tx_id = _row_id(exchange, row, occurrence)
+    usd_quote = quote in USD_STABLES
+    fee_coin = (row.get("Fee Coin") or "").strip().upper()
+    if not fee_coin:
+        # Older exports suffix the fee with its coin instead of a Fee Coin column.
+        fee_text = (row.get("Fee") or "").strip().upper()
+        fee_coin = next((unit for unit in sorted((base, quote), key=len, reverse=True) if fee_text.endswith(unit)), quote)
+    fee = _number(row.get("Fee"), (fee_coin,))
+    fee_usd = fee if fee and usd_quote and fee_coin == quote else None
+    value = total if usd_quote else None
+    txs = [_tx(exchange, tx_id, timestamp, "buy" if side == "buy" else "sell", base, quantity, value_usd=value, fee_usd=fee_usd)]
+    if quote not in FIAT:
+        # The quote leg moves a crypto (or stablecoin) lot too.
+        txs.append(_tx(exchange, f"{tx_id}:quote", timestamp, "sell" if side == "buy" else "buy", quote, total, value_usd=value))
+    return txs
+
+
+def _map_generic(row, exchange, occurrence):
+    tx_id = row.get("id") or _row_id(exchange, row, occurrence)
+    tx = {
+        "id": tx_id,
+        "from": row.get("from", ""),
+        "to": row.get("to", ""),
+        "amount": row.get("amount", "0"),
+        "token": row.get("token"),
+        "type": (row.get("type") or "transfer").lower(),
+        "chain": row.get("chain") or exchange,
+        "timestamp": _parse_time(row["timestamp"]),
+    }
+    for key in ("price_usd", "value_usd", "fee_usd", "lot_id"):
+        if row.get(key):
+            tx[key] = row[key]
+    return [tx]
+
+
+# Per-exchange column profiles: the header column that identifies the real header row
+# (Coinbase exports start with a preamble), the time column and the row mapper to the
+# canonical schema.
+EXCHANGE_PROFILES = {
+    "coinbase": {"header_marker": "Transaction Type", "time_column": "Timestamp", "map_row": _map_coinbase},
+    "kraken": {"header_marker": "refid", "time_column": "time", "map_row": _map_kraken},
+    "binance": {"header_marker": "Date(UTC)", "time_column": "Date(UTC)", "map_row": _map_binance},
+    "generic": {"header_marker": "timestamp", "time_column": "timestamp", "map_row": _map_generic},
+}
+
+
+def get_profile(exchange_name: str):
+    profile = EXCHANGE_PROFILES.get(exchange_name.lower())
+    if profile is None:
+        cprint(f"[WARN] No CSV profile for '{exchange_name}', using the generic profile.", "yellow")
+        profile = EXCHANGE_PROFILES["generic"]
+    return profile
+
+
+def iter_csv_chunks(binary_file, profile, exchange: str, chunk_size: int = CHUNK_SIZE, stats=None):
+    """
+    Read an exchange CSV row by row from a binary file object and yield lists of canonical
+    transaction dicts of at most `chunk_size`. Unmappable rows are counted in `stats["errors"]`.
+    Mappers also get the number of identical rows seen before each row, for ids of rows that
+    carry none. Identical rows share a time, and exports are sorted by time (either way), so
+    only the rows of the current time are remembered.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("rows", 0)
+    stats.setdefault("errors", 0)
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = None
+        for fields in reader:
+            if profile["header_marker"] in [field.strip() for field in fields]:
+                header = [field.strip() for field in fields]
+                break
+        if header is None:
+            raise ValueError(f"CSV header with column '{profile['header_marker']}' not found.")
+        chunk = []
+        seen, seen_time = {}, None
+        for fields in reader:
+            if not any(fields):
+                continue
+            stats["rows"] += 1
+            row = dict(zip(header, fields))
+            if row.get(profile["time_column"]) != seen_time:
+                seen, seen_time = {}, row.get(profile["time_column"])
+            occurrence = seen.get(tuple(fields), 0)
+            seen[tuple(fields)] = occurrence + 1
+            try:
+                chunk.extend(profile["map_row"](row, exchange, occurrence))
+            except (KeyError, ValueError, TypeError) as e:
+                stats["errors"] += 1
+                if stats["errors"] <= 5:
+                    cprint(f"[WARN] Skipping CSV row {stats['rows']}: {e}", "yellow")
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        # Leave the underlying upload open for the caller.
+        text.detach()
+
+
+def import_csv(binary_file, exchange_name: str, account: str = "default", user_id: str = "default",
+               store=None, total_bytes: int = None, progress=None, profile_name: str = None):
+    """
+    Stream an exchange CSV into the transaction store in bulk batches, keyed by
+    (exchange, account). The column profile defaults to the exchange's own.
+    `progress(rows, bytes_read, total_bytes)` is called after each batch.
+    Returns counts of rows read, transactions stored and rows skipped.
+    """
+    from app.utils.tx_store import get_store
+    store = store or get_store()
+    exchange = exchange_name.lower()
+    profile = get_profile(profile_name or exchange)
+    store.add_wallet(user_id, exchange, account)
+    stats = {}
+    imported = 0
+    for chunk in iter_csv_chunks(binary_file, profile, exchange, stats=stats):
+        imported += store.merge_transactions(exchange, account, chunk)
+        bytes_read = binary_file.tell()
+        if progress is not None:
+            progress(stats["rows"], bytes_read, total_bytes)
+        else:
+            cprint(f"[INFO] {exchange} import: {stats['rows']} rows, {bytes_read} / {total_bytes or '?'} bytes.", "cyan")
+    return {"exchange": exchange, "account": account, "rows": stats.get("rows", 0), "imported": imported, "errors": stats.get("errors", 0)}
@@ -1,118 +1,292 @@
 import os
-import requests
-import random
+import asyncio
+from functools import partial
+from datetime import datetime
+from decimal import Decimal
+import httpx
 from termcolor import cprint
+from app.utils.rate_limiter import Coalescer, ProviderError, RateLimiter
 
-def fetch_wallet_transactions(address: str, chain: str = "eth"):
+# Overridable so benchmarks can point the fetchers at a local stand-in (benchmarks/provider_stub.py).
+COVALENT_BASE_URL = os.getenv("COVALENT_BASE_URL", "https://api.covalenthq.com/v1")
+HELIUS_BASE_URL = os.getenv("HELIUS_BASE_URL", "https://api.helius.xyz/v0")
+BLOCKSTREAM_BASE_URL = os.getenv("BLOCKSTREAM_BASE_URL", "https://blockstream.info/api")
+
+EVM_CHAIN_IDS = {"eth": "1", "base": "8453", "arbitrum": "42161"}
+CHAIN_ALIASES = {"ethereum": "eth", "arb": "arbitrum", "sol": "solana", "btc": "bitcoin"}
+SUPPORTED_CHAINS = set(EVM_CHAIN_IDS) | {"solana", "bitcoin"}
+
+# Native coin decimals used to turn provider base units (wei, satoshi) into token amounts.
+EVM_NATIVE_DECIMALS = 18
+BITCOIN_DECIMALS = 8
+
+COVALENT_PAGE_SIZE = 100
+HELIUS_PAGE_SIZE = 100
+# Blockstream returns confirmed transactions in fixed pages of 25.
+BLOCKSTREAM_PAGE_SIZE = 25
+
+# Max concurrent in-flight requests (and pooled keep-alive connections) per provider.
+PROVIDER_LIMITS = {
+    "covalent": 4,
+    "helius": 4,
+    "blockstream": 4,
+}
+# Request quotas per provider: (requests per second, burst). Override with e.g. COVALENT_RATE_LIMIT.
+PROVIDER_RATES = {
+    "covalent": (float(os.getenv("COVALENT_RATE_LIMIT", 4)), 4),
+    "helius": (float(os.getenv("HELIUS_RATE_LIMIT", 10)), 10),
+    "blockstream": (float(os.getenv("BLOCKSTREAM_RATE_LIMIT", 5)), 5),
+}
+REQUEST_TIMEOUT = 20
+
+
+class UnsupportedChainError(ValueError):
+    def __init__(self, chain: str):
+        super().__init__(f"Unsupported chain '{chain}'. Supported: {', '.join(sorted(SUPPORTED_CHAINS))}.")
+
+
+# Clients and semaphores are bound to the event loop that created them.
+_clients = {}
+_semaphores = {}
+_limiter = RateLimiter(PROVIDER_RATES)
+# Identical wallet fetches running at the same time share one upstream fetch.
+_wallet_fetches = Coalescer()
+
+
+def _get_client(provider: str) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(provider)
+    if entry is None or entry[0] is not loop or entry[1].is_closed:
+        limit = PROVIDER_LIMITS[provider]
+        client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+        )
+        _clients[provider] = (loop, client)
+        _semaphores[provider] = (loop, asyncio.Semaphore(limit))
+    return _clients[provider][1]
+
+
+async def _get_json(provider: str, url: str, params=None):
+    client = _get_client(provider)
+    return await _limiter.get_json(provider, client, url, params, _semaphores[provider][1])
+
+
+async def close_provider_clients():
+    """Close the pooled provider clients (called on application shutdown)."""
+    for provider, (loop, client) in list(_clients.items()):
+        if loop is asyncio.get_running_loop():
+            await client.aclose()
+    _clients.clear()
+    _semaphores.clear()
+
+
+def normalize_chain(chain: str) -> str:
+    """Map chain aliases (ethereum, arb, sol, btc) to the canonical names used as store keys."""
+    chain = chain.lower()
+    return CHAIN_ALIASES.get(chain, chain)
+
+
+def _from_base_units(value, decimals: int) -> str:
+    if value in (None, ""):
+        return "0"
+    return str(Decimal(value).scaleb(-decimals).normalize())
+
+
+def _parse_iso_timestamp(value):
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def _is_older(block, since):
+    return since is not None and block is not None and block < since["block"]
+
+
+def _drop_older(txs, since):
+    return [tx for tx in txs if not _is_older(tx["block"], since)]
+
+
+async def fetch_wallet_transactions(address: str, chain: str = "eth", since=None):
     """
-    Fetch transactions for a wallet address on ETH, Base, Arbitrum, Solana, or Bitcoin.
-    - EVM chains (ETH, BASE, ARB): Covalent API
-    - Solana: Helius API
-    - Bitcoin: Blockstream API
-    Falls back to mock data if no API key or on error.
+    Fetch the transaction history for a wallet address on ETH, Base, Arbitrum, Solana, or Bitcoin.
+    - EVM chains (ETH, BASE, ARB): Covalent API (page-number pagination)
+    - Solana: Helius API (`before` signature cursor)
+    - Bitcoin: Blockstream API (`/txs/chain/:last_seen_txid` cursor)
+    `since` is a sync cursor ({"block", "tx_id"}); when given, paging stops once it reaches
+    blocks older than the cursor, so only new transactions (plus the cursor block) come back.
+    Concurrent calls for the same wallet and cursor share one fetch.
+    Raises UnsupportedChainError for unknown chains and ProviderError when the provider fails;
+    never returns partial or made-up data.
     """
-    chain = chain.lower()
-    if chain in ["eth", "ethereum", "base", "arbitrum", "arb"]:
-        return _fetch_evm_transactions(address, chain)
-    elif chain == "sol" or chain == "solana":
-        return _fetch_solana_transactions(address)
-    elif chain == "btc" or chain == "bitcoin":
-        return _fetch_bitcoin_transactions(address)
+    chain = normalize_chain(chain)
+    if chain in EVM_CHAIN_IDS:
+        fetch = partial(_fetch_evm_transactions, address, chain, since)
+    elif chain == "solana":
+        fetch = partial(_fetch_solana_transactions, address, since)
+    elif chain == "bitcoin":
+        fetch = partial(_fetch_bitcoin_transactions, address, since)
     else:
-        cprint(f"[WARN] Unsupported chain '{chain}', using mock data.", "yellow")
-        return _mock_transactions(address)
+        raise UnsupportedChainError(chain)
+    key = (chain, address, since["block"] if since else None)
+    return await _wallet_fetches.run(key, fetch)
 
 
-def _fetch_evm_transactions(address: str, chain: str):
+async def fetch_many_wallet_transactions(wallets):
+    """
+    Fetch many (address, chain) pairs concurrently. Each provider's pool limits how many
+    requests are in flight against it, so wallets on different chains proceed in parallel.
+    Returns a list of {"address", "chain", "transactions"} in the order given.
+    """
+    results = await asyncio.gather(
+        *(fetch_wallet_transactions(address, chain) for address, chain in wallets)
+    )
+    return [
+        {"address": address, "chain": chain, "transactions": txs}
+        for (address, chain), txs in zip(wallets, results)
+    ]
+
+
+async def _fetch_evm_transactions(address: str, chain: str, since=None):
     COVALENT_API_KEY = os.getenv("COVALENT_API_KEY")
     if not COVALENT_API_KEY:
-        cprint("[WARN] COVALENT_API_KEY not set, using mock data.", "yellow")
-        return _mock_transactions(address)
-    chain_ids = {"eth": "1", "ethereum": "1", "base": "8453", "arbitrum": "42161", "arb": "42161"}
-    chain_id = chain_ids.get(chain, "1")
-    url = f"https://api.covalenthq.com/v1/{chain_id}/address/{address}/transactions_v2/?key={COVALENT_API_KEY}"
+        raise ProviderError("covalent", "COVALENT_API_KEY not set.")
+    chain_id = EVM_CHAIN_IDS[chain]
+    url = f"{COVALENT_BASE_URL}/{chain_id}/address/{address}/transactions_v2/"
     cprint(f"[INFO] Fetching transactions for {address} on {chain} via Covalent API", "cyan")
+
+    def page_params(page_number):
+        return {"key": COVALENT_API_KEY, "page-number": page_number, "page-size": COVALENT_PAGE_SIZE}
+
     try:
-        resp = requests.get(url, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
+        first = await _get_json("covalent", url, page_params(0))
+        items = list(first.get("data", {}).get("items", []))
+        has_more = (first.get("data", {}).get("pagination") or {}).get("has_more", False)
+        # Covalent returns newest first; stop once a page reaches blocks older than the cursor.
+        if items and _is_older(items[-1].get("block_height"), since):
+            has_more = False
+        # Covalent pages are addressable by number, so a full sync fetches a window of them at once.
+        # Incremental syncs usually end within a page, so they go one page at a time.
+        window = 1 if since else PROVIDER_LIMITS["covalent"]
+        next_page = 1
+        while has_more:
+            pages = await asyncio.gather(
+                *(_get_json("covalent", url, page_params(n)) for n in range(next_page, next_page + window))
+            )
+            next_page += window
+            for page in pages:
+                data = page.get("data", {})
+                items.extend(data.get("items", []))
+                has_more = (data.get("pagination") or {}).get("has_more", False)
+                if data.get("items") and _is_older(data["items"][-1].get("block_height"), since):
+                    has_more = False
+                if not has_more:
+                    break
         txs = []
-        for tx in data.get("data", {}).get("items", []):
+        for tx in items:
             txs.append({
                 "id": tx.get("tx_hash"),
                 "from": tx.get("from_address"),
                 "to": tx.get("to_address"),
-                "amount": tx.get("value"),
+                "amount": _from_base_units(tx.get("value"), EVM_NATIVE_DECIMALS),
                 "token": tx.get("contract_ticker_symbol", "ETH"),
-                "type": "transfer"
+                "type": "transfer",
+                "chain": chain,
+                "timestamp": _parse_iso_timestamp(tx.get("block_signed_at")),
+                "block": tx.get("block_height"),
             })
-        if not txs:
-            cprint("[WARN] No transactions found from Covalent, using mock data.", "yellow")
-            return _mock_transactions(address)
+        txs = _drop_older(txs, since)
+        cprint(f"[INFO] Covalent returned {len(txs)} transactions for {address}.", "green")
         return txs
+    except ProviderError:
+        raise
     except Exception as e:
-        cprint(f"[ERROR] Covalent API failed: {e}. Using mock data.", "red")
-        return _mock_transactions(address)
+        # Malformed payloads and the like: surface them instead of returning partial data.
+        raise ProviderError("covalent", f"Unexpected response: {e}") from e
 
 
-def _fetch_solana_transactions(address: str):
+async def _fetch_solana_transactions(address: str, since=None):
     HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
     if not HELIUS_API_KEY:
-        cprint("[WARN] HELIUS_API_KEY not set, using mock data.", "yellow")
-        return _mock_transactions(address)
-    url = f"https://api.helius.xyz/v0/addresses/{address}/transactions?api-key={HELIUS_API_KEY}"
+        raise ProviderError("helius", "HELIUS_API_KEY not set.")
+    url = f"{HELIUS_BASE_URL}/addresses/{address}/transactions"
     cprint(f"[INFO] Fetching Solana transactions for {address} via Helius API", "cyan")
     try:
-        resp = requests.get(url, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
+        items = []
+        before = None
+        while True:
+            params = {"api-key": HELIUS_API_KEY, "limit": HELIUS_PAGE_SIZE}
+            if before:
+                params["before"] = before
+            if since:
+                params["until"] = since["tx_id"]
+            page = await _get_json("helius", url, params)
+            if not page:
+                break
+            items.extend(page)
+            if _is_older(page[-1].get("slot"), since):
+                break
+            before = page[-1].get("signature")
+            if not before:
+                break
         txs = []
-        for tx in data:
+        for tx in items:
             txs.append({
                 "id": tx.get("signature"),
                 "from": tx.get("accountData", [{}])[0].get("account", ""),
                 "to": tx.get("accountData", [{}])[-1].get("account", ""),
                 "amount": tx.get("amount", ""),
                 "token": tx.get("token", "SOL"),
-                "type": tx.get("type", "transfer")
+                "type": tx.get("type", "transfer"),
+                "chain": "solana",
+                "timestamp": tx.get("timestamp"),
+                "block": tx.get("slot"),
             })
-        if not txs:
-            cprint("[WARN] No transactions found from Helius, using mock data.", "yellow")
-            return _mock_transactions(address)
+        txs = _drop_older(txs, since)
+        cprint(f"[INFO] Helius returned {len(txs)} transactions for {address}.", "green")
         return txs
+    except ProviderError:
+        raise
     except Exception as e:
-        cprint(f"[ERROR] Helius API failed: {e}. Using mock data.", "red")
-        return _mock_transactions(address)
+        # Malformed payloads and the like: surface them instead of returning partial data.
+        raise ProviderError("helius", f"Unexpected response: {e}") from e
 
 
-def _fetch_bitcoin_transactions(address: str):
+async def _fetch_bitcoin_transactions(address: str, since=None):
     # Blockstream API is public, no key needed
-    url = f"https://blockstream.info/api/address/{address}/txs"
+    url = f"{BLOCKSTREAM_BASE_URL}/address/{address}/txs"
     cprint(f"[INFO] Fetching Bitcoin transactions for {address} via Blockstream API", "cyan")
     try:
-        resp = requests.get(url, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
+        items = []
+        page_url = url
+        while True:
+            page = await _get_json("blockstream", page_url)
+            items.extend(page)
+            # The first page also carries mempool transactions; only confirmed ones advance the cursor.
+            confirmed = [tx for tx in page if tx.get("status", {}).get("confirmed")]
+            if len(confirmed) < BLOCKSTREAM_PAGE_SIZE:
+                break
+            if _is_older(confirmed[-1]["status"].get("block_height"), since):
+                break
+            page_url = f"{url}/chain/{confirmed[-1].get('txid')}"
         txs = []
-        for tx in data:
+        for tx in items:
             txs.append({
                 "id": tx.get("txid"),
                 "from": tx.get("vin", [{}])[0].get("prevout", {}).get("scriptpubkey_address", ""),
                 "to": tx.get("vout", [{}])[0].get("scriptpubkey_address", ""),
-                "amount": tx.get("vout", [{}])[0].get("value", 0) / 1e8,
+                "amount": _from_base_units(tx.get("vout", [{}])[0].get("value", 0), BITCOIN_DECIMALS),
                 "token": "BTC",
-                "type": "transfer"
+                "type": "transfer",
+                "chain": "bitcoin",
+                "timestamp": tx.get("status", {}).get("block_time"),
+                "block": tx.get("status", {}).get("block_height"),
             })
-        if not txs:
-            cprint("[WARN] No transactions found from Blockstream, using mock data.", "yellow")
-            return _mock_transactions(address)
+        txs = _drop_older(txs, since)
+        cprint(f"[INFO] Blockstream returned {len(txs)} transactions for {address}.", "green")
         return txs
+    except ProviderError:
+        raise
     except Exception as e:
-        cprint(f"[ERROR] Blockstream API failed: {e}. Using mock data.", "red")
-        return _mock_transactions(address)
-
-def _mock_transactions(address: str):
-    return [
-        {"id": f"tx_{random.randint(1000,9999)}", "from": address, "to": "0xabc...", "amount": 1.23, "token": "ETH", "type": "transfer"},
-        {"id": f"tx_{random.randint(1000,9999)}", "from": address, "to": "0xdef...", "amount": 0.5, "token": "USDC", "type": "swap"},
-    ]
+        # Malformed payloads and the like: surface them instead of returning partial data.
+        raise ProviderError("blockstream", f"Unexpected response: {e}") from e
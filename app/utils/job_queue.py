@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from termcolor import cprint
+
+DEFAULT_JOB_STORE_PATH = "data/jobs.db"
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PER_USER = 2
+# Idle workers re-check the queue at this interval even without a wake-up.
+POLL_INTERVAL = 1.0
+# Runners touch `updated_at` of their running jobs this often; a running job not touched for
+# JOB_STALE_AFTER seconds belongs to a dead process and goes back to the queue.
+HEARTBEAT_INTERVAL = 15.0
+DEFAULT_STALE_AFTER = 120.0
+# Attempts at claiming a job another process keeps claiming first.
+CLAIM_ATTEMPTS = 5
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress TEXT,
+    checkpoint TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, created_at);
+"""
+
+COLUMNS = ("id", "user_id", "kind", "params", "status", "progress", "checkpoint", "result", "error",
+           "attempts", "created_at", "started_at", "finished_at", "updated_at")
+JSON_COLUMNS = ("params", "progress", "checkpoint", "result")
+
+
+def _row_to_job(row):
+    job = dict(zip(COLUMNS, row))
+    for column in JSON_COLUMNS:
+        job[column] = json.loads(job[column]) if job[column] is not None else None
+    return job
+
+
+class JobStore:
+    """
+    Persistent job queue in SQLite. A job keeps its parameters, progress, resume checkpoint
+    and result, so work interrupted by a restart is picked up again from its last checkpoint.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("JOB_STORE_PATH", DEFAULT_JOB_STORE_PATH)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def submit(self, user_id: str, kind: str, params=None):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (id, user_id, kind, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, kind, json.dumps(params or {}), QUEUED, now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self.lock:
+            row = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, user_id: str, limit: int = 50):
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def claim_next(self, max_per_user: int):
+        """
+        Mark the oldest queued job whose user is under the concurrency limit as running, and
+        return it. The update only applies while the job is still queued, so when several
+        processes share the store exactly one of them claims a job.
+        """
+        for _ in range(CLAIM_ATTEMPTS):
+            now = time.time()
+            with self.lock, self.conn:
+                row = self.conn.execute(
+                    "SELECT id FROM jobs j WHERE status = ? AND "
+                    "(SELECT COUNT(*) FROM jobs r WHERE r.user_id = j.user_id AND r.status = ?) < ? "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, max_per_user),
+                ).fetchone()
+                if row is None:
+                    return None
+                cursor = self.conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, updated_at = ?, attempts = attempts + 1 WHERE id = ? AND status = ?",
+                    (RUNNING, now, now, row[0], QUEUED),
+                )
+            if cursor.rowcount:
+                return self.get(row[0])
+        return None
+
+    def update_progress(self, job_id: str, progress=None, checkpoint=None):
+        with self.lock, self.conn:
+            if checkpoint is not None:
+                self.conn.execute(
+                    "UPDATE jobs SET progress = ?, checkpoint = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(progress), json.dumps(checkpoint), time.time(), job_id),
+                )
+            else:
+                self.conn.execute(
+                    "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(progress), time.time(), job_id),
+                )
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, now, now, job_id),
+            )
+
+    def requeue(self, job_id: str) -> int:
+        """Put a running job back in the queue, keeping its checkpoint."""
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?", (QUEUED, time.time(), job_id, RUNNING)
+            )
+            return cursor.rowcount
+
+    def heartbeat(self, job_ids):
+        """Mark running jobs as alive (see requeue_stale)."""
+        if not job_ids:
+            return
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = ?", [(now, job_id, RUNNING) for job_id in job_ids]
+            )
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """
+        Put running jobs whose heartbeat is older than `stale_after` seconds back in the queue,
+        keeping their checkpoints. Jobs of live runners, in this or another process, are left alone.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, now, RUNNING, now - stale_after),
+            )
+            return cursor.rowcount
+
+    def cancel_queued(self, job_id: str) -> bool:
+        now = time.time()
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, now, now, job_id, QUEUED),
+            )
+            return cursor.rowcount > 0
+
+
+class JobContext:
+    """Handed to a job handler: its parameters, the checkpoint to resume from, and progress reporting."""
+
+    def __init__(self, store: JobStore, job):
+        self.store = store
+        self.job_id = job["id"]
+        self.user_id = job["user_id"]
+        self.params = job["params"] or {}
+        self.checkpoint = job["checkpoint"] or {}
+        self.attempt = job["attempts"]
+
+    def progress(self, **progress):
+        self.store.update_progress(self.job_id, progress)
+
+    def save_checkpoint(self, checkpoint, **progress):
+        """Persist resume state; a restarted job sees it as `context.checkpoint`."""
+        self.checkpoint = checkpoint
+        self.store.update_progress(self.job_id, progress, checkpoint)
+
+
+class JobRunner:
+    """
+    Runs queued jobs on a fixed set of worker tasks in the server's event loop.
+    Handlers are `async def handler(context)` functions keyed by job kind; blocking work inside
+    them goes through asyncio.to_thread. At most `max_per_user` jobs of one user run at once.
+    Several runners (one per server process) can share a store: each heartbeats its own jobs
+    and requeues only jobs whose runner stopped heartbeating.
+    """
+
+    def __init__(self, store: JobStore, handlers, workers: int = None, max_per_user: int = None):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers or int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS))
+        self.max_per_user = max_per_user or int(os.getenv("JOB_MAX_PER_USER", DEFAULT_MAX_PER_USER))
+        self.stale_after = float(os.getenv("JOB_STALE_AFTER", DEFAULT_STALE_AFTER))
+        self.running = {}
+        self.cancel_requested = set()
+        self.tasks = []
+        self.wakeup = None
+        self.stopping = False
+
+    def start(self):
+        if self.tasks:
+            return
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._heartbeat()))
+        cprint(f"[INFO] Job runner started with {self.workers} workers (max {self.max_per_user} per user).", "cyan")
+
+    async def stop(self):
+        """Stop the workers; jobs still running go back to the queue and resume on the next start."""
+        # The flag covers a worker whose wake-up races the cancellation.
+        self.stopping = True
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def notify(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def submit(self, user_id: str, kind: str, params=None):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'.")
+        job = self.store.submit(user_id, kind, params)
+        cprint(f"[INFO] Job {job['id']} ({kind}) queued for {user_id}.", "cyan")
+        self.notify()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        if self.store.cancel_queued(job_id):
+            return True
+        task = self.running.get(job_id)
+        if task is None:
+            return False
+        self.cancel_requested.add(job_id)
+        task.cancel()
+        return True
+
+    async def _worker(self):
+        while not self.stopping:
+            job = self.store.claim_next(self.max_per_user)
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+            # A finished job may free a per-user slot for another worker.
+            self.notify()
+
+    def _requeue_stale(self):
+        requeued = self.store.requeue_stale(self.stale_after)
+        if requeued:
+            cprint(f"[INFO] Requeued {requeued} interrupted jobs; they resume from their checkpoints.", "cyan")
+            self.notify()
+
+    async def _heartbeat(self):
+        """Keep this runner's jobs alive and pick up jobs of runners that died."""
+        while not self.stopping:
+            try:
+                self.store.heartbeat(list(self.running))
+                self._requeue_stale()
+            except Exception as e:
+                # A missed beat is fine (stale_after spans several ticks); a dead loop would let
+                # other processes requeue jobs that are still running here.
+                cprint(f"[WARN] Job heartbeat failed, retrying next tick: {e}", "yellow")
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def _run(self, job):
+        job_id = job["id"]
+        context = JobContext(self.store, job)
+        task = asyncio.create_task(self.handlers[job["kind"]](context))
+        self.running[job_id] = task
+        started = time.time()
+        try:
+            result = await task
+            self.store.finish(job_id, SUCCEEDED, result=result)
+            cprint(f"[INFO] Job {job_id} ({job['kind']}) finished in {time.time() - started:.1f}s.", "green")
+        except asyncio.CancelledError:
+            if job_id in self.cancel_requested:
+                self.store.finish(job_id, CANCELLED)
+                cprint(f"[WARN] Job {job_id} cancelled.", "yellow")
+            else:
+                # Shutdown: keep the checkpoint and run it again on the next start.
+                task.cancel()
+                self.store.requeue(job_id)
+                raise
+        except Exception as e:
+            self.store.finish(job_id, FAILED, error=str(e))
+            cprint(f"[ERROR] Job {job_id} ({job['kind']}) failed: {e}", "red")
+        finally:
+            self.running.pop(job_id, None)
+            self.cancel_requested.discard(job_id)
+
+
+_runner = None
+
+
+def get_job_runner() -> JobRunner:
+    """Return the process-wide job runner (not started until `start()` is called)."""
+    global _runner
+    if _runner is None:
+        from app.services.job_handlers import JOB_HANDLERS
+        _runner = JobRunner(JobStore(), JOB_HANDLERS)
+    return _runner
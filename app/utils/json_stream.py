@@ -0,0 +1,70 @@
+import json
+
+OPEN, CLOSE = "{[", "}]"
+
+
+class JsonArrayParser:
+    """
+    Incremental parser for a JSON array arriving in pieces (a streamed model completion).
+    `feed(text)` returns the elements completed by that text, parsed. Anything before the
+    first "[" (prose, a code fence) is skipped. If the stream stops early, the elements
+    already returned stand and only the unfinished one is lost; `finished` tells whether
+    the closing "]" arrived.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.current = []
+        self.invalid = 0
+
+    def _flush(self, items):
+        text = "".join(self.current).strip()
+        self.current = []
+        if not text:
+            return
+        try:
+            items.append(json.loads(text))
+        except ValueError:
+            self.invalid += 1
+
+    def feed(self, text: str):
+        items = []
+        for ch in text:
+            if self.finished:
+                break
+            if not self.started:
+                self.started = ch == "["
+                continue
+            if self.in_string:
+                self.current.append(ch)
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+                self.current.append(ch)
+            elif ch in OPEN:
+                self.depth += 1
+                self.current.append(ch)
+            elif ch in CLOSE:
+                if self.depth == 0:
+                    # The array's own closing bracket; flush a trailing scalar element.
+                    self._flush(items)
+                    self.finished = True
+                    continue
+                self.depth -= 1
+                self.current.append(ch)
+                if self.depth == 0:
+                    self._flush(items)
+            elif ch == "," and self.depth == 0:
+                self._flush(items)
+            else:
+                self.current.append(ch)
+        return items
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import time
+import logging
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is a field.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_configured = False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus the fields passed via `extra`."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        stamp = time.strftime("%H:%M:%S", time.localtime(record.created))
+        return f"{stamp} [{record.levelname}] {record.name}: {record.getMessage()}" + (f" {fields}" if fields else "")
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger under the "app" hierarchy. LOG_LEVEL (default INFO) filters before a message is
+    formatted; LOG_FORMAT=json (default) or text picks the output format. Goes to stdout.
+    """
+    global _configured
+    if not _configured:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json") == "text" else JsonFormatter())
+        root = logging.getLogger("app")
+        root.addHandler(handler)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.propagate = False
+        _configured = True
+    return logging.getLogger(name if name.startswith("app") else f"app.{name}")
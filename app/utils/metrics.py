@@ -0,0 +1,211 @@
+import time
+import threading
+
+# Latency buckets (seconds) and payload-size buckets (bytes).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            items = sorted((key, list(row)) for key, row in self.values.items())
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(row[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram, self.labels = histogram, labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """
+    Metrics in the Prometheus text exposition format. Counters and histograms are recorded
+    as events happen; collectors are called at scrape time for values kept elsewhere
+    (cache counters, model router stats) and yield (name, type, help, [(labels, value)]).
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def collector(self, collect):
+        with self.lock:
+            self.collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            metrics, collectors = list(self.metrics.values()), list(self.collectors)
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels, labels.values()) if labels else ''} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "Time to the end of the response body.", ("method", "route"))
+HTTP_REQUEST_BYTES = REGISTRY.histogram("http_request_size_bytes", "Request body size.", ("route",), SIZE_BUCKETS)
+HTTP_RESPONSE_BYTES = REGISTRY.histogram("http_response_size_bytes", "Response body size.", ("route",), SIZE_BUCKETS)
+UPSTREAM_REQUESTS = REGISTRY.counter("upstream_requests_total", "Calls to upstream providers by outcome.", ("provider", "status"))
+UPSTREAM_LATENCY = REGISTRY.histogram("upstream_request_duration_seconds", "Upstream call duration.", ("provider",))
+UPSTREAM_BYTES = REGISTRY.histogram("upstream_response_size_bytes", "Upstream response body size.", ("provider",), SIZE_BUCKETS)
+AI_TOKENS = REGISTRY.counter("ai_tokens_total", "Tokens sent to and received from the model, per AI service.", ("service", "direction"))
+CACHE_LOOKUPS = REGISTRY.counter("cache_lookups_total", "Cache lookups by cache and result (hit or miss).", ("cache", "result"))
+
+
+def observe_upstream(provider: str, seconds: float, status, size: int = None):
+    """Record one upstream call; `status` is the HTTP status code or an error class name."""
+    UPSTREAM_REQUESTS.inc(provider=provider, status=str(status))
+    UPSTREAM_LATENCY.observe(seconds, provider=provider)
+    if size is not None:
+        UPSTREAM_BYTES.observe(size, provider=provider)
+
+
+def record_tokens(service: str, sent: int, received: int):
+    AI_TOKENS.inc(sent, service=service or "other", direction="sent")
+    AI_TOKENS.inc(received, service=service or "other", direction="received")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route request counts, latency and payload sizes. Routes are
+    labelled by their path template (/jobs/{job_id}), never the raw path; unmatched paths
+    share one label. Templates include the prefix the router is mounted at (/lp/analyze, not
+    /analyze). Latency runs to the last body chunk, so streamed responses count in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.templates = None
+
+    def route_label(self, route) -> str:
+        if route is None:
+            return "unmatched"
+        if self.templates is None:
+            from app.routes.registry import route_templates
+            self.templates = route_templates()
+        return self.templates.get(id(route)) or getattr(route, "path", None) or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        state = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = self.route_label(scope.get("route"))
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(state["status"]))
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=route)
+            HTTP_RESPONSE_BYTES.observe(state["bytes"], route=route)
+            length = dict(scope.get("headers") or ()).get(b"content-length")
+            if length and length.isdigit():
+                HTTP_REQUEST_BYTES.observe(int(length), route=route)
@@ -0,0 +1,28 @@
+import json
+from fastapi.responses import StreamingResponse
+from termcolor import cprint
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def ndjson_response(results, total: int = None) -> StreamingResponse:
+    """
+    Stream (index, result) pairs from an async iterator as NDJSON lines {"index", "result"},
+    in arrival order, ending with {"done": true, "count", "errors", "total"}. If the iterator
+    fails, the last line is {"error": ...} instead. A client disconnect cancels the iterator.
+    """
+
+    async def lines():
+        count = errors = 0
+        try:
+            async for index, result in results:
+                count += 1
+                errors += isinstance(result, dict) and "error" in result
+                yield json.dumps({"index": index, "result": result}, default=str) + "\n"
+        except Exception as e:
+            cprint(f"[ERROR] NDJSON stream failed after {count} results: {e}", "red")
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        yield json.dumps({"done": True, "count": count, "errors": errors, "total": total}) + "\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
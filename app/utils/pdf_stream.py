@@ -0,0 +1,81 @@
+# US Letter, landscape.
+PAGE_WIDTH, PAGE_HEIGHT = 792, 612
+MARGIN = 36
+FONT_SIZE = 8
+LEADING = 10
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+# Fixed object numbers; page objects follow. The page tree is written last, once all pages are known.
+CATALOG, PAGES, FONT = 1, 2, 3
+
+
+def _escape(text: str) -> bytes:
+    text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return text.encode("latin-1", "replace")
+
+
+class _Writer:
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+
+    def raw(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def obj(self, number: int, body: bytes) -> bytes:
+        self.offsets[number] = self.offset
+        return self.raw(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+
+def _page_content(lines, header) -> bytes:
+    y = PAGE_HEIGHT - MARGIN - FONT_SIZE
+    parts = [b"BT /F1 %d Tf %d TL %d %d Td" % (FONT_SIZE, LEADING, MARGIN, y)]
+    for line in header + lines:
+        parts.append(b"(" + _escape(line) + b") Tj T*")
+    parts.append(b"ET")
+    return b"\n".join(parts)
+
+
+def iter_pdf(lines, header=(), title: str = "Report", lines_per_page: int = None):
+    """
+    Yield a PDF as byte chunks, one page at a time, from an iterable of text lines (Courier,
+    so fixed-width columns line up). `header` lines repeat at the top of every page.
+    Only the current page and the list of page object numbers are held in memory.
+    """
+    header = list(header)
+    per_page = (lines_per_page or LINES_PER_PAGE) - len(header) - 1
+    w = _Writer()
+    yield w.raw(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    yield w.obj(CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES)
+    yield w.obj(FONT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+    kids = []
+    next_number = FONT + 1
+
+    def page(chunk, number):
+        nonlocal next_number
+        content = _page_content(chunk, [f"{title} - page {number}"] + header)
+        content_number, page_number = next_number, next_number + 1
+        next_number += 2
+        kids.append(page_number)
+        return (
+            w.obj(content_number, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+            + w.obj(page_number, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                    % (PAGES, PAGE_WIDTH, PAGE_HEIGHT, FONT, content_number))
+        )
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= per_page:
+            yield page(chunk, len(kids) + 1)
+            chunk = []
+    if chunk or not kids:
+        yield page(chunk, len(kids) + 1)
+    yield w.obj(PAGES, b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids))
+    xref_offset = w.offset
+    count = next_number
+    xref = [b"xref\n0 %d\n" % count, b"0000000000 65535 f \n"]
+    xref += [b"%010d 00000 n \n" % w.offsets[n] for n in range(1, count)]
+    yield w.raw(b"".join(xref))
+    yield w.raw(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, CATALOG, xref_offset))
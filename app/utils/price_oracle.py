@@ -0,0 +1,270 @@
+import os
+import csv
+import json
+import numpy as np
+from termcolor import cprint
+
+DEFAULT_PRICE_DIR = "data/prices"
+# Bar length in seconds per resolution; lookups prefer the finest resolution available.
+RESOLUTIONS = {"1h": 3600, "1d": 86400}
+USD_STABLES = {"USD", "USDT", "USDC", "BUSD", "DAI", "TUSD", "FDUSD"}
+# Wrapped and staked tokens priced from their underlying asset's series.
+PRICE_ALIASES = {"WETH": "ETH", "STETH": "ETH", "WBTC": "BTC", "WSOL": "SOL", "XBT": "BTC"}
+# Columns of the stored OHLC arrays.
+OPEN, HIGH, LOW, CLOSE = range(4)
+
+
+def price_symbol(token) -> str:
+    symbol = (token or "").upper()
+    return PRICE_ALIASES.get(symbol, symbol)
+
+
+class PriceSeries:
+    """Sorted bar open times (int64, epoch seconds) with a parallel (n, 4) float64 OHLC array."""
+
+    def __init__(self, times, ohlc, resolution: str):
+        self.times = times
+        self.ohlc = ohlc
+        self.resolution = resolution
+        self.bar_seconds = RESOLUTIONS[resolution]
+
+    def __len__(self):
+        return len(self.times)
+
+    def lookup(self, timestamps):
+        """
+        Price at each timestamp, interpolated between the open and close of the bar that
+        contains it (binary search over bar open times). NaN where no bar covers the timestamp.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        prices = np.full(len(timestamps), np.nan)
+        if not len(self.times):
+            return prices
+        index = np.searchsorted(self.times, timestamps, side="right") - 1
+        clipped = np.clip(index, 0, None)
+        offset = timestamps - self.times[clipped]
+        covered = (index >= 0) & (offset < self.bar_seconds)
+        rows = clipped[covered]
+        fraction = offset[covered] / self.bar_seconds
+        bars = self.ohlc[rows]
+        prices[covered] = bars[:, OPEN] + (bars[:, CLOSE] - bars[:, OPEN]) * fraction
+        return prices
+
+    def merged(self, times, ohlc):
+        """New series with these bars added; on duplicate open times the new bar wins."""
+        all_times = np.concatenate([np.asarray(times, dtype=np.int64), self.times])
+        all_ohlc = np.concatenate([np.asarray(ohlc, dtype=np.float64).reshape(-1, 4), self.ohlc])
+        # np.unique keeps the first occurrence, which is the new bar.
+        unique_times, first = np.unique(all_times, return_index=True)
+        return PriceSeries(unique_times, all_ohlc[first], self.resolution)
+
+
+class PriceStore:
+    """
+    OHLC series per (asset, resolution) saved as .npy files and opened memory-mapped,
+    so only the pages a lookup touches are read from disk.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.getenv("PRICE_STORE_DIR", DEFAULT_PRICE_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self.series = {}
+
+    def _path(self, asset: str, resolution: str, part: str) -> str:
+        return os.path.join(self.directory, f"{asset}.{resolution}.{part}.npy")
+
+    def get(self, asset: str, resolution: str) -> PriceSeries:
+        key = (asset, resolution)
+        if key not in self.series:
+            times_path = self._path(asset, resolution, "times")
+            if os.path.exists(times_path):
+                times = np.load(times_path, mmap_mode="r")
+                ohlc = np.load(self._path(asset, resolution, "ohlc"), mmap_mode="r")
+            else:
+                times, ohlc = np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float64)
+            self.series[key] = PriceSeries(times, ohlc, resolution)
+        return self.series[key]
+
+    def put(self, asset: str, resolution: str, times, ohlc) -> PriceSeries:
+        """Merge bars into the stored series and rewrite it atomically."""
+        series = self.get(asset, resolution).merged(times, ohlc)
+        for part, array in (("times", series.times), ("ohlc", series.ohlc)):
+            path = self._path(asset, resolution, part)
+            tmp = path + ".tmp.npy"
+            np.save(tmp, np.ascontiguousarray(array))
+            os.replace(tmp, path)
+        self.series.pop((asset, resolution), None)
+        return self.get(asset, resolution)
+
+    def assets(self):
+        return sorted({name.split(".")[0] for name in os.listdir(self.directory) if name.endswith(".times.npy")})
+
+    def fingerprint(self, assets) -> str:
+        """Size and modification time of the stored series of `assets`; changes whenever one is rewritten."""
+        parts = []
+        for asset in sorted({price_symbol(asset) for asset in assets}):
+            for resolution in RESOLUTIONS:
+                path = self._path(asset, resolution, "times")
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    parts.append(f"{asset}.{resolution}:{stat.st_size}:{stat.st_mtime_ns}")
+        return ";".join(parts)
+
+
+class FixtureSource:
+    """
+    Backfill source reading bars from a local file: CSV with columns
+    asset, resolution, timestamp, open, high, low, close, or a JSON list of the same objects.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.bars = {}
+        with open(path, newline="") as f:
+            rows = json.load(f) if path.endswith(".json") else csv.DictReader(f)
+            for row in rows:
+                key = (price_symbol(row["asset"]), row.get("resolution") or "1d")
+                self.bars.setdefault(key, []).append(
+                    (int(row["timestamp"]), [float(row[c]) for c in ("open", "high", "low", "close")])
+                )
+
+    def fetch(self, asset: str, resolution: str, start: int, end: int):
+        bars = [bar for bar in self.bars.get((asset, resolution), []) if start <= bar[0] <= end]
+        return (np.array([t for t, _ in bars], dtype=np.int64),
+                np.array([ohlc for _, ohlc in bars], dtype=np.float64).reshape(-1, 4))
+
+
+class CryptoCompareSource:
+    """Backfill source for CryptoCompare's public histohour/histoday endpoints (2000 bars per call)."""
+
+    BASE_URL = "https://min-api.cryptocompare.com/data/v2"
+    ENDPOINTS = {"1h": "histohour", "1d": "histoday"}
+    PAGE_BARS = 2000
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("CRYPTOCOMPARE_API_KEY")
+
+    def fetch(self, asset: str, resolution: str, start: int, end: int):
+        import httpx
+        times, ohlc = [], []
+        to_ts = end
+        with httpx.Client(timeout=20) as client:
+            while to_ts >= start:
+                params = {"fsym": asset, "tsym": "USD", "limit": self.PAGE_BARS, "toTs": to_ts}
+                if self.api_key:
+                    params["api_key"] = self.api_key
+                resp = client.get(f"{self.BASE_URL}/{self.ENDPOINTS[resolution]}", params=params)
+                resp.raise_for_status()
+                data = (resp.json().get("Data") or {}).get("Data") or []
+                bars = [bar for bar in data if bar.get("close") and start <= bar["time"] <= end]
+                if not bars:
+                    break
+                times.extend(bar["time"] for bar in bars)
+                ohlc.extend([bar["open"], bar["high"], bar["low"], bar["close"]] for bar in bars)
+                to_ts = data[0]["time"] - 1
+        return np.array(times, dtype=np.int64), np.array(ohlc, dtype=np.float64).reshape(-1, 4)
+
+
+class PriceOracle:
+    """
+    Fair-market-value lookup over the local OHLC store. Lookups never hit the network;
+    `backfill` pulls missing bars from the configured source ahead of time.
+    """
+
+    def __init__(self, store: PriceStore = None, source=None):
+        self.store = store or PriceStore()
+        self.source = source
+
+    def backfill(self, asset: str, start: int, end: int, resolution: str = "1d") -> int:
+        """Fetch bars for [start, end] that extend the stored series; returns the number of new bars."""
+        if self.source is None:
+            raise RuntimeError("No price source configured for backfill.")
+        asset = price_symbol(asset)
+        series = self.store.get(asset, resolution)
+        before = len(series)
+        ranges = [(start, end)]
+        if before:
+            # Only fetch the parts outside the stored range.
+            first, last = int(series.times[0]), int(series.times[-1])
+            ranges = [(lo, hi) for lo, hi in ((start, first - 1), (last + 1, end)) if lo <= hi]
+        for lo, hi in ranges:
+            times, ohlc = self.source.fetch(asset, resolution, lo, hi)
+            if len(times):
+                series = self.store.put(asset, resolution, times, ohlc)
+        added = len(series) - before
+        cprint(f"[INFO] Price backfill {asset} {resolution}: {added} new bars.", "cyan")
+        return added
+
+    def prices(self, asset: str, timestamps):
+        """Vectorized USD price of `asset` at each timestamp (finest resolution first); NaN if unknown."""
+        symbol = price_symbol(asset)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if symbol in USD_STABLES:
+            return np.ones(len(timestamps))
+        prices = np.full(len(timestamps), np.nan)
+        for resolution in sorted(RESOLUTIONS, key=RESOLUTIONS.get):
+            missing = np.isnan(prices)
+            if not missing.any():
+                break
+            prices[missing] = self.store.get(symbol, resolution).lookup(timestamps[missing])
+        return prices
+
+    def price_batch(self, batch) -> int:
+        """
+        Fill `price_usd` for rows of a TransactionBatch that have neither a price nor a value.
+        Rows are grouped by token id, so each asset's series is searched once. Returns rows priced.
+        """
+        from app.utils.transaction_batch import MISSING
+        need = np.isnan(batch.price_usd) & np.isnan(batch.value_usd) & (batch.timestamp != MISSING) & (batch.token != MISSING)
+        rows = np.flatnonzero(need)
+        if not len(rows):
+            return 0
+        order = rows[np.argsort(batch.token[rows], kind="stable")]
+        token_ids, starts = np.unique(batch.token[order], return_index=True)
+        priced = 0
+        for token_id, group in zip(token_ids, np.split(order, starts[1:])):
+            prices = self.prices(batch.tables["tokens"].lookup(token_id), batch.timestamp[group])
+            batch.price_usd[group] = prices
+            priced += int(np.count_nonzero(~np.isnan(prices)))
+        return priced
+
+    def price_transactions(self, transactions):
+        """Set `price_usd` on transaction dicts that have neither a price nor a value. Returns rows priced."""
+        from app.utils.transaction_batch import TransactionBatch
+        # Only rows that need a price go into the batch; most stored rows already carry a value.
+        transactions = [tx for tx in transactions if tx.get("price_usd") in (None, "") and tx.get("value_usd") in (None, "")]
+        if not transactions:
+            return 0
+        batch = TransactionBatch.from_dicts(transactions)
+        self.price_batch(batch)
+        priced = 0
+        for tx, price in zip(transactions, batch.price_usd):
+            if not np.isnan(price):
+                tx["price_usd"] = float(price)
+                priced += 1
+        return priced
+
+    def iter_priced(self, transactions, chunk_size: int = 10000):
+        """Stream transaction dicts through `price_transactions` in chunks, preserving order."""
+        chunk = []
+        for tx in transactions:
+            chunk.append(tx)
+            if len(chunk) >= chunk_size:
+                self.price_transactions(chunk)
+                yield from chunk
+                chunk = []
+        if chunk:
+            self.price_transactions(chunk)
+            yield from chunk
+
+
+_oracle = None
+
+
+def get_price_oracle() -> PriceOracle:
+    """Process-wide oracle; PRICE_FIXTURE_PATH selects a local fixture file as the backfill source."""
+    global _oracle
+    if _oracle is None:
+        fixture = os.getenv("PRICE_FIXTURE_PATH")
+        _oracle = PriceOracle(source=FixtureSource(fixture) if fixture else CryptoCompareSource())
+    return _oracle
@@ -0,0 +1,166 @@
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+import httpx
+from app.utils.log import get_logger
+from app.utils.metrics import observe_upstream
+
+log = get_logger(__name__)
+
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# After a 429 the refill rate is halved (never below MIN_RATE) and then climbs back by
+# RATE_RECOVERY of the configured rate per successful request, up to the configured rate.
+MIN_RATE = 0.5
+RATE_RECOVERY = 0.05
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """A data provider could not serve a request (throttled past all retries, HTTP error, bad response, missing key)."""
+
+    def __init__(self, provider: str, message: str, status_code: int = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    """Exponential backoff with jitter: a random delay in [d/2, d] with d = base * 2**attempt, capped."""
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.random() * delay / 2
+
+
+def parse_retry_after(value, now: float = None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to `burst` request tokens and refilling at `rate` per second.
+    The rate adapts to throttling (multiplicative decrease, additive recovery), and a
+    Retry-After pause blocks the whole bucket.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttled(self, retry_after: float):
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+
+class Coalescer:
+    """
+    Runs one shared task per key: concurrent callers with the same key await the same result.
+    The task is cancelled only when every caller waiting on it has gone away.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+
+    async def run(self, key, factory):
+        entry = self.inflight.get(key)
+        if entry is None or entry[0].done():
+            entry = [asyncio.ensure_future(factory()), 0]
+            self.inflight[key] = entry
+            entry[0].add_done_callback(lambda _: self.inflight.pop(key, None) if self.inflight.get(key) is entry else None)
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+
+
+class RateLimiter:
+    """
+    Per-provider token buckets in front of HTTP GETs, with retries on 429/5xx and transport
+    errors (honoring Retry-After, else exponential backoff with jitter) and coalescing of
+    identical in-flight requests. Raises ProviderError instead of returning partial data.
+    """
+
+    def __init__(self, rates, max_retries: int = DEFAULT_MAX_RETRIES):
+        self.buckets = {provider: TokenBucket(rate, burst) for provider, (rate, burst) in rates.items()}
+        self.max_retries = max_retries
+        self.coalescer = Coalescer()
+
+    async def get_json(self, provider: str, client: httpx.AsyncClient, url: str, params=None, semaphore=None):
+        key = (provider, url, tuple(sorted((params or {}).items())))
+        return await self.coalescer.run(key, lambda: self._get_with_retries(provider, client, url, params, semaphore))
+
+    async def _get_with_retries(self, provider, client, url, params, semaphore):
+        bucket = self.buckets[provider]
+        error = None
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            started = time.perf_counter()
+            try:
+                if semaphore is not None:
+                    async with semaphore:
+                        resp = await client.get(url, params=params)
+                else:
+                    resp = await client.get(url, params=params)
+            except httpx.TransportError as e:
+                observe_upstream(provider, time.perf_counter() - started, type(e).__name__)
+                error = f"{type(e).__name__}: {e}"
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            observe_upstream(provider, time.perf_counter() - started, resp.status_code, len(resp.content))
+            if resp.status_code in RETRYABLE_STATUS:
+                error = f"HTTP {resp.status_code}"
+                delay = parse_retry_after(resp.headers.get("Retry-After"))
+                if resp.status_code == 429:
+                    bucket.throttled(delay if delay is not None else backoff_delay(attempt))
+                    log.warning("provider throttled", extra={"provider": provider, "status": 429, "rate": round(bucket.rate, 2)})
+                else:
+                    await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+                continue
+            if resp.status_code >= 400:
+                raise ProviderError(provider, f"HTTP {resp.status_code} for {url}", resp.status_code)
+            bucket.succeeded()
+            try:
+                return resp.json()
+            except ValueError:
+                raise ProviderError(provider, f"Invalid JSON from {url}", resp.status_code)
+        raise ProviderError(provider, f"Giving up after {self.max_retries + 1} attempts ({error}).")
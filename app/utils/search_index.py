@@ -0,0 +1,240 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+from termcolor import cprint
+from app.utils.transaction_batch import MISSING, normalize_address, to_fixed
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Users whose indexes stay in memory.
+INDEX_CACHE_ENTRIES = 8
+
+# Filter keys and the inverted index each one reads.
+LIST_FILTERS = {"tokens": "token", "addresses": "address", "types": "type", "protocols": "protocol", "chains": "chain"}
+RANGE_FILTERS = ("start", "end", "min_amount", "max_amount", "min_value_usd", "max_value_usd")
+DIRECTIONS = {"incoming": 1, "outgoing": -1, "internal": 0}
+SORTS = ("time_desc", "time_asc", "amount_desc", "amount_asc")
+FILTER_KEYS = set(LIST_FILTERS) | set(RANGE_FILTERS) | {"direction", "sort"}
+
+
+def _timestamp(value):
+    """Epoch seconds from an int or an ISO date/datetime string (UTC unless it has an offset)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        return int(value)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def _postings(column, keys):
+    """
+    Inverted index over an int id column: {key: sorted row ids}. `keys[id]` is the normalized
+    key of each id, so ids that normalize alike ("eth" and "ETH") share one posting list.
+    """
+    known = np.flatnonzero(column != MISSING)
+    order = known[np.argsort(column[known], kind="stable")]
+    ids, starts = np.unique(column[order], return_index=True)
+    postings = {}
+    for value_id, rows in zip(ids, np.split(order, starts[1:])):
+        key = keys[value_id]
+        postings[key] = np.union1d(postings[key], rows) if key in postings else rows
+    return postings
+
+
+def validate_filter(search_filter):
+    """Check a structured filter, dropping unknown keys. Raises ValueError on bad values."""
+    if not isinstance(search_filter, dict):
+        raise ValueError("Filter must be an object.")
+    clean = {}
+    for key, value in search_filter.items():
+        if key not in FILTER_KEYS or value is None or value == [] or value == "":
+            continue
+        if key in LIST_FILTERS:
+            clean[key] = [str(v) for v in (value if isinstance(value, list) else [value])]
+        elif key == "direction":
+            if value not in DIRECTIONS:
+                raise ValueError(f"Unsupported direction '{value}'. Use one of {', '.join(DIRECTIONS)}.")
+            clean[key] = value
+        elif key == "sort":
+            if value not in SORTS:
+                raise ValueError(f"Unsupported sort '{value}'. Use one of {', '.join(SORTS)}.")
+            clean[key] = value
+        elif key in ("start", "end"):
+            clean[key] = _timestamp(value)
+        else:
+            clean[key] = float(value)
+    return clean
+
+
+class TransactionIndex:
+    """
+    Search index over a TransactionBatch: inverted indexes (sorted row-id posting lists) on
+    token, address (from or to), type, protocol and chain, and sorted orders on time and amount.
+    List filters intersect posting lists; time and amount ranges are binary searches over the
+    sorted orders, so a query touches only the rows that can match.
+    """
+
+    def __init__(self, batch, owned_addresses=None, protocols=None):
+        self.batch = batch
+        tables = batch.tables
+        token_keys = [value.upper() for value in tables["tokens"].values]
+        type_keys = [value.lower() for value in tables["types"].values]
+        address_keys = [normalize_address(value) for value in tables["addresses"].values]
+        chain_keys = [value.lower() for value in tables["chains"].values]
+        addresses = np.concatenate([batch.from_addr, batch.to_addr])
+        rows = np.concatenate([np.arange(len(batch))] * 2)
+        address_postings = {key: np.unique(rows[positions]) for key, positions in _postings(addresses, address_keys).items()}
+        self.postings = {
+            "token": _postings(batch.token, token_keys),
+            "type": _postings(batch.type, type_keys),
+            "address": address_postings,
+            "chain": _postings(batch.chain, chain_keys),
+            "protocol": {},
+        }
+        self.protocols = protocols
+        if protocols is not None:
+            known = np.array([p is not None for p in protocols], dtype=bool)
+            names, codes = np.unique(protocols[known].astype(str), return_inverse=True)
+            column = np.full(len(batch), MISSING, dtype=np.int32)
+            column[known] = codes
+            self.postings["protocol"] = _postings(column, [name.lower() for name in names])
+        self.direction = batch.direction(owned_addresses) if owned_addresses else None
+        self.time_order = np.argsort(batch.timestamp, kind="stable")
+        self.sorted_times = batch.timestamp[self.time_order]
+        self.amount_order = np.argsort(batch.amount, kind="stable")
+        self.sorted_amounts = batch.amount[self.amount_order]
+        self.usd_values = batch.usd_values()
+
+    def __len__(self):
+        return len(self.batch)
+
+    def vocabulary(self, limit: int = 50):
+        """Most frequent tokens, types and protocols (bounded, for the query translator)."""
+        return {
+            field: [key for key, _ in sorted(self.postings[field].items(), key=lambda item: -len(item[1]))[:limit]]
+            for field in ("token", "type", "protocol", "chain")
+        }
+
+    def _posting_rows(self, field, values):
+        postings = self.postings[field]
+        if field == "token":
+            keys = [v.upper() for v in values]
+        elif field == "address":
+            keys = [normalize_address(v) for v in values]
+        else:
+            keys = [v.lower() for v in values]
+        lists = [postings[key] for key in keys if key in postings]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        return lists[0] if len(lists) == 1 else np.unique(np.concatenate(lists))
+
+    def _range_rows(self, order, sorted_values, low, high):
+        lo = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        hi = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side="right")
+        return order[lo:hi]
+
+    def query(self, search_filter):
+        """Row ids matching a validated filter (unordered)."""
+        f = search_filter
+        candidates = None
+        # Smallest posting list first, so each intersection shrinks the candidate set.
+        lists = sorted((self._posting_rows(LIST_FILTERS[key], f[key]) for key in LIST_FILTERS if key in f), key=len)
+        for rows in lists:
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+        start, end = f.get("start"), f.get("end")
+        min_amount = to_fixed(f["min_amount"]) if "min_amount" in f else None
+        max_amount = to_fixed(f["max_amount"]) if "max_amount" in f else None
+        if candidates is None:
+            # No list filter: start from the narrower of the two range slices (or everything).
+            slices = []
+            if start is not None or end is not None:
+                slices.append(self._range_rows(self.time_order, self.sorted_times, start, None if end is None else end - 1))
+            if min_amount is not None or max_amount is not None:
+                slices.append(self._range_rows(self.amount_order, self.sorted_amounts, min_amount, max_amount))
+            candidates = min(slices, key=len) if slices else np.arange(len(self.batch))
+        batch = self.batch
+        mask = np.ones(len(candidates), dtype=bool)
+        if start is not None or end is not None:
+            times = batch.timestamp[candidates]
+            mask &= times != MISSING
+            if start is not None:
+                mask &= times >= start
+            if end is not None:
+                mask &= times < end
+        if min_amount is not None:
+            mask &= batch.amount[candidates] >= min_amount
+        if max_amount is not None:
+            mask &= batch.amount[candidates] <= max_amount
+        if "min_value_usd" in f or "max_value_usd" in f:
+            values = self.usd_values[candidates]
+            if "min_value_usd" in f:
+                mask &= values >= f["min_value_usd"]
+            if "max_value_usd" in f:
+                mask &= values <= f["max_value_usd"]
+        if "direction" in f:
+            if self.direction is None:
+                raise ValueError("Direction filters need the owner's addresses.")
+            mask &= self.direction[candidates] == DIRECTIONS[f["direction"]]
+        return candidates[mask]
+
+    def search(self, search_filter, limit: int = DEFAULT_LIMIT, offset: int = 0):
+        """Run a filter and return {"total", "results"} with one sorted page of transaction dicts."""
+        search_filter = validate_filter(search_filter)
+        rows = self.query(search_filter)
+        limit = max(0, min(int(limit), MAX_LIMIT))
+        offset = max(0, int(offset))
+        sort = search_filter.get("sort", "time_desc")
+        keys = self.batch.timestamp[rows] if sort.startswith("time") else self.batch.amount[rows]
+        if sort.endswith("desc"):
+            keys = -keys
+        wanted = offset + limit
+        if wanted < len(rows):
+            # Partial selection: only the first `wanted` rows need a full sort.
+            top = np.argpartition(keys, wanted - 1)[:wanted] if wanted else np.empty(0, dtype=np.int64)
+            ordered = top[np.lexsort((rows[top], keys[top]))]
+        else:
+            ordered = np.lexsort((rows, keys))
+        page = rows[ordered[offset:wanted]]
+        results = self.batch.take(page).to_dicts()
+        if self.protocols is not None:
+            for tx, protocol in zip(results, self.protocols[page]):
+                if protocol is not None:
+                    tx["protocol"] = protocol
+        return {"total": int(len(rows)), "results": results}
+
+
+def build_index(batch, owned_addresses=None) -> TransactionIndex:
+    from app.services.rule_classifier import classify_batch
+    _, protocols = classify_batch(batch)
+    return TransactionIndex(batch, owned_addresses, protocols)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_user_index(user_id: str, store=None) -> TransactionIndex:
+    """
+    Index over a user's stored transactions, kept in memory and rebuilt only when the
+    store's change log has moved on or the user's wallets changed.
+    """
+    from app.utils.tx_store import get_store
+    store = store or get_store()
+    owned = [w["address"] for w in store.get_wallets(user_id)]
+    version = (store.latest_change(), tuple(sorted(owned)))
+    with _indexes_lock:
+        entry = _indexes.get(user_id)
+        if entry is not None and entry[0] == version:
+            _indexes.move_to_end(user_id)
+            return entry[1]
+        index = build_index(store.load_user_batch(user_id), owned)
+        _indexes[user_id] = (version, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > INDEX_CACHE_ENTRIES:
+            _indexes.popitem(last=False)
+    cprint(f"[INFO] Search index built for {user_id}: {len(index)} transactions.", "cyan")
+    return index
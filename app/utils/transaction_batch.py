@@ -0,0 +1,335 @@
+import math
+from decimal import Decimal, ROUND_HALF_EVEN
+import numpy as np
+
+# Amounts are stored as fixed-point int64 with 8 decimal places (satoshi precision); rows the
+# fixed point cannot hold exactly also keep the Decimal (see fixed_amount).
+AMOUNT_DECIMALS = 8
+AMOUNT_SCALE = 10 ** AMOUNT_DECIMALS
+AMOUNT_MAX = np.iinfo(np.int64).max
+# Sentinel for missing timestamps and missing interned values.
+MISSING = -1
+# Human-readable parts of the bech32 (segwit) address formats of the supported chains.
+BECH32_PREFIXES = ("bc1", "tb1", "bcrt1")
+
+
+def to_fixed(value) -> int:
+    """Convert an amount (str, int, float or Decimal, in token units) to fixed-point int, saturating beyond int64."""
+    return fixed_amount(value)[0]
+
+
+def fixed_amount(value):
+    """
+    (fixed-point int, exact Decimal or None) for an amount. The Decimal is returned when the
+    fixed point loses digits (more than AMOUNT_DECIMALS places) or range (beyond int64, where
+    the fixed value saturates so ordering and comparisons on the column stay right).
+    """
+    if value is None or value == "":
+        return 0, None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    fixed = int((value * AMOUNT_SCALE).to_integral_value(rounding=ROUND_HALF_EVEN))
+    if abs(fixed) > AMOUNT_MAX:
+        return (AMOUNT_MAX if fixed > 0 else -AMOUNT_MAX), value
+    return fixed, None if from_fixed(fixed) == value else value
+
+
+def from_fixed(value: int) -> Decimal:
+    return Decimal(int(value)).scaleb(-AMOUNT_DECIMALS)
+
+
+def normalize_address(address):
+    """
+    Comparable form of an address: EVM hex and bech32 addresses are case-insensitive and are
+    lowercased; base58 addresses (Solana, legacy Bitcoin) are case-sensitive and kept as given.
+    """
+    if not address:
+        return ""
+    lowered = address.lower()
+    return lowered if lowered.startswith(("0x", *BECH32_PREFIXES)) else address
+
+
+def _timestamp_or_missing(value, parse) -> int:
+    """Epoch seconds of a timestamp (int, digit string or ISO 8601), or MISSING if absent or unparseable."""
+    try:
+        timestamp = parse(value)
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        return MISSING
+    return MISSING if timestamp is None else timestamp
+
+
+def _usd(value):
+    """
+    (float64 value, exact Decimal or None) for a USD amount. Floats parsed from decimal text
+    round-trip through repr() for up to 15 significant digits; the Decimal is returned only for
+    values that do not, so the float column plus `exact` always give back the source value.
+    """
+    if value is None or value == "":
+        return math.nan, None
+    number = float(value)
+    if isinstance(value, float):
+        return number, None
+    exact = value if isinstance(value, Decimal) else Decimal(str(value))
+    return number, None if usd_decimal(number) == exact else exact
+
+
+def usd_decimal(value: float):
+    """Decimal of a float64 USD column value (None for NaN)."""
+    return None if math.isnan(value) else Decimal(repr(float(value)))
+
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class StringTable:
+    """Interns strings (tokens, addresses, types) to dense int ids."""
+
+    def __init__(self, values=None):
+        self.values = []
+        self.ids = {}
+        for value in values or []:
+            self.intern(value)
+
+    def intern(self, value) -> int:
+        if value is None or value == "":
+            return MISSING
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def get(self, value) -> int:
+        """Id of an already interned value, or MISSING."""
+        if value is None or value == "":
+            return MISSING
+        return self.ids.get(value, MISSING)
+
+    def lookup(self, value_id: int):
+        return self.values[value_id] if value_id != MISSING else None
+
+    def __len__(self):
+        return len(self.values)
+
+
+class TransactionBatch:
+    """
+    Columnar, array-backed set of transactions.
+    Timestamps and amounts are int64 arrays (amounts in fixed point, see AMOUNT_SCALE),
+    USD price/value/fee columns are float64 (NaN when unknown), and chain, token, type,
+    from/to address and lot id are int32 ids into shared StringTables. `exact` is None for
+    most rows and a {column: Decimal} dict where a numeric column only approximates the
+    source value; `decimal()` reads a value exactly. Filters return new
+    batches that share the tables, so per-asset aggregation is a handful of array operations.
+    """
+
+    USD_COLUMNS = ("price_usd", "value_usd", "fee_usd")
+    STRING_COLUMNS = ("chain", "token", "type", "from_addr", "to_addr", "lot_id")
+    TABLES = {"chain": "chains", "token": "tokens", "type": "types", "from_addr": "addresses", "to_addr": "addresses", "lot_id": "lots"}
+
+    def __init__(self, ids, timestamp, amount, price_usd, value_usd, fee_usd,
+                 chain, token, type, from_addr, to_addr, lot_id, exact, tables):
+        self.ids = ids
+        self.timestamp = timestamp
+        self.amount = amount
+        self.price_usd = price_usd
+        self.value_usd = value_usd
+        self.fee_usd = fee_usd
+        self.chain = chain
+        self.token = token
+        self.type = type
+        self.from_addr = from_addr
+        self.to_addr = to_addr
+        self.lot_id = lot_id
+        self.exact = exact
+        self.tables = tables
+
+    @classmethod
+    def empty_tables(cls):
+        return {"chains": StringTable(), "tokens": StringTable(), "types": StringTable(), "addresses": StringTable(), "lots": StringTable()}
+
+    @classmethod
+    def from_dicts(cls, transactions, tables=None):
+        """
+        Build a batch from canonical transaction dicts (`id`, `from`, `to`, `amount`, `token`, `type`, ...).
+        Timestamps are parsed like the dict-based tax path; unparseable ones become MISSING. The
+        type column holds each row's tax type (cost_basis.tax_type), which is its own `type`
+        unless a stored classification says the row moves no lot.
+        """
+        from app.services.cost_basis import _to_timestamp, tax_type
+        tables = tables or cls.empty_tables()
+        chains, tokens, types, addresses, lots = (
+            tables["chains"], tables["tokens"], tables["types"], tables["addresses"], tables["lots"]
+        )
+        columns = {name: [] for name in ("ids", "timestamp", "amount", "price_usd", "value_usd", "fee_usd", "exact") + cls.STRING_COLUMNS}
+        for tx in transactions:
+            columns["ids"].append(tx.get("id"))
+            columns["timestamp"].append(_timestamp_or_missing(tx.get("timestamp"), _to_timestamp))
+            amount, exact_amount = fixed_amount(tx.get("amount"))
+            columns["amount"].append(amount)
+            exact = None if exact_amount is None else {"amount": exact_amount}
+            for name in cls.USD_COLUMNS:
+                value, exact_value = _usd(tx.get(name))
+                columns[name].append(value)
+                if exact_value is not None:
+                    exact = exact or {}
+                    exact[name] = exact_value
+            columns["exact"].append(exact)
+            columns["chain"].append(chains.intern(tx.get("chain")))
+            columns["token"].append(tokens.intern(tx.get("token")))
+            columns["type"].append(types.intern(tax_type(tx)))
+            columns["from_addr"].append(addresses.intern(normalize_address(tx.get("from"))))
+            columns["to_addr"].append(addresses.intern(normalize_address(tx.get("to"))))
+            columns["lot_id"].append(lots.intern(tx.get("lot_id")))
+        return cls(
+            np.array(columns["ids"], dtype=object),
+            np.array(columns["timestamp"], dtype=np.int64),
+            np.array(columns["amount"], dtype=np.int64),
+            np.array(columns["price_usd"], dtype=np.float64),
+            np.array(columns["value_usd"], dtype=np.float64),
+            np.array(columns["fee_usd"], dtype=np.float64),
+            *(np.array(columns[name], dtype=np.int32) for name in cls.STRING_COLUMNS),
+            _object_array(columns["exact"]),
+            tables=tables,
+        )
+
+    def _columns(self):
+        return (self.ids, self.timestamp, self.amount, self.price_usd, self.value_usd, self.fee_usd,
+                self.chain, self.token, self.type, self.from_addr, self.to_addr, self.lot_id, self.exact)
+
+    def take(self, selector):
+        """New batch with the rows selected by a boolean mask or index array."""
+        return TransactionBatch(*(column[selector] for column in self._columns()), tables=self.tables)
+
+    @classmethod
+    def concat(cls, batches):
+        """Concatenate batches, re-interning ids into the first batch's tables where they differ."""
+        batches = list(batches)
+        if not batches:
+            return cls.from_dicts([])
+        tables = batches[0].tables
+        parts = []
+        for batch in batches:
+            if batch.tables is not tables:
+                batch = batch._reinterned(tables)
+            parts.append(batch._columns())
+        return cls(*(np.concatenate(column) for column in zip(*parts)), tables=tables)
+
+    def _reinterned(self, tables):
+        remapped = {}
+        for column_name in self.STRING_COLUMNS:
+            table_name = self.TABLES[column_name]
+            source = self.tables[table_name]
+            # Append a trailing slot so MISSING (-1) maps to MISSING.
+            mapping = np.array([tables[table_name].intern(v) for v in source.values] + [MISSING], dtype=np.int32)
+            remapped[column_name] = mapping[getattr(self, column_name)]
+        return TransactionBatch(self.ids, self.timestamp, self.amount, self.price_usd, self.value_usd, self.fee_usd,
+                                *(remapped[name] for name in self.STRING_COLUMNS), self.exact, tables=tables)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns())
+
+    def address_ids(self, addresses):
+        table = self.tables["addresses"]
+        ids = [table.get(normalize_address(address)) for address in addresses]
+        return np.array([i for i in ids if i != MISSING], dtype=np.int32)
+
+    def direction(self, owned_addresses):
+        """Per-row +1 (into an owned address), -1 (out of one) or 0 (internal or unrelated)."""
+        owned = self.address_ids(owned_addresses)
+        incoming = np.isin(self.to_addr, owned)
+        outgoing = np.isin(self.from_addr, owned)
+        return incoming.astype(np.int8) - outgoing.astype(np.int8)
+
+    def exact_rows(self, name: str = None):
+        """
+        {row: Decimal} for the rows whose `name` column only approximates the source value, or
+        with no name, {row: {column: Decimal}} for every row that has an exact value.
+        """
+        rows = np.flatnonzero(self.exact.astype(bool))
+        if name is None:
+            return {int(i): self.exact[i] for i in rows}
+        return {int(i): self.exact[i][name] for i in rows if name in self.exact[i]}
+
+    def decimal(self, name: str, i: int):
+        """Exact value of numeric column `name` at row `i` as a Decimal (None for an unknown USD value)."""
+        exact = self.exact[i]
+        if exact is not None and name in exact:
+            return exact[name]
+        if name == "amount":
+            return from_fixed(self.amount[i])
+        return usd_decimal(getattr(self, name)[i])
+
+    def float_amounts(self):
+        """Amounts in token units as float64, including those beyond the fixed-point range."""
+        amounts = self.amount / AMOUNT_SCALE
+        for i, value in self.exact_rows("amount").items():
+            amounts[i] = float(value)
+        return amounts
+
+    def usd_values(self):
+        """USD value per row: `value_usd` where known, else amount * price (NaN if neither)."""
+        derived = self.float_amounts() * self.price_usd
+        return np.where(np.isnan(self.value_usd), derived, self.value_usd)
+
+    def sum_by_token(self, mask=None, signs=None):
+        """Exact totals per token id (optionally masked and signed), as {token: Decimal}."""
+        amounts = self.amount if signs is None else self.amount * signs
+        selected = self.token != MISSING
+        if mask is not None:
+            selected &= mask
+        # Fixed-point rows are summed column-wise; the few rows it cannot hold are added exactly.
+        exact = {i: value for i, value in self.exact_rows("amount").items() if selected[i]}
+        fixed = selected.copy()
+        fixed[list(exact)] = False
+        # A token's int64 total can overflow (a few SHIB-sized rows do), so each amount is split
+        # into 32-bit halves, whose sums cannot, and the halves are recombined as Python ints.
+        highs = np.zeros(len(self.tables["tokens"]), dtype=np.int64)
+        lows = np.zeros(len(self.tables["tokens"]), dtype=np.int64)
+        np.add.at(highs, self.token[fixed], amounts[fixed] >> 32)
+        np.add.at(lows, self.token[fixed], amounts[fixed] & 0xFFFFFFFF)
+        lookup = self.tables["tokens"].lookup
+        result = {lookup(i): from_fixed((int(highs[i]) << 32) + int(lows[i])) for i in np.unique(self.token[fixed])}
+        for i, value in exact.items():
+            token = lookup(self.token[i])
+            result[token] = result.get(token, Decimal(0)) + (value if signs is None else value * int(signs[i]))
+        return result
+
+    def net_flows(self, owned_addresses, mask=None):
+        """Net quantity per token into the owned addresses."""
+        return self.sum_by_token(mask, self.direction(owned_addresses))
+
+    def iter_dicts(self):
+        lookup = {name: self.tables[self.TABLES[name]].lookup for name in self.STRING_COLUMNS}
+        for i in range(len(self)):
+            tx = {
+                "id": self.ids[i],
+                "from": lookup["from_addr"](self.from_addr[i]),
+                "to": lookup["to_addr"](self.to_addr[i]),
+                "amount": str(self.decimal("amount", i)),
+                "token": lookup["token"](self.token[i]),
+                "type": lookup["type"](self.type[i]),
+                "chain": lookup["chain"](self.chain[i]),
+                "timestamp": None if self.timestamp[i] == MISSING else int(self.timestamp[i]),
+            }
+            exact = self.exact[i] or {}
+            for name in self.USD_COLUMNS:
+                value = getattr(self, name)[i]
+                if name in exact:
+                    tx[name] = str(exact[name])
+                elif not math.isnan(value):
+                    tx[name] = float(value)
+            lot_id = lookup["lot_id"](self.lot_id[i])
+            if lot_id is not None:
+                tx["lot_id"] = lot_id
+            yield tx
+
+    def to_dicts(self):
+        return list(self.iter_dicts())
@@ -0,0 +1,454 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from termcolor import cprint
+
+DEFAULT_STORE_PATH = "data/transactions.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    chain TEXT NOT NULL,
+    address TEXT NOT NULL,
+    tx_id TEXT NOT NULL,
+    timestamp INTEGER,
+    block INTEGER,
+    token TEXT,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (chain, address, tx_id)
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_time ON transactions (chain, address, timestamp);
+CREATE INDEX IF NOT EXISTS idx_transactions_token ON transactions (chain, address, token, timestamp);
+CREATE TABLE IF NOT EXISTS wallets (
+    user_id TEXT NOT NULL,
+    chain TEXT NOT NULL,
+    address TEXT NOT NULL,
+    PRIMARY KEY (user_id, chain, address)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    chain TEXT NOT NULL,
+    address TEXT NOT NULL,
+    cursor_block INTEGER,
+    cursor_tx_id TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    last_synced_at INTEGER,
+    PRIMARY KEY (chain, address)
+);
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chain TEXT NOT NULL,
+    address TEXT NOT NULL,
+    token TEXT,
+    min_timestamp INTEGER
+);
+"""
+
+# Payload fields read by the transfer matcher (see iter_transfer_rows).
+TRANSFER_FIELDS = ("id", "tx_hash", "type", "from", "to", "amount", "internal_transfer")
+# SQLite caps bound parameters per statement; look ids up in slices of this size.
+LOOKUP_SLICE = 500
+# Fields of a stored transaction that a manual edit may change.
+EDITABLE_FIELDS = {"amount", "token", "type", "timestamp", "from", "to", "price_usd", "value_usd", "fee_usd", "lot_id"}
+# Edited fields that must be numbers (stored as decimal strings); the USD ones may be cleared with null.
+DECIMAL_FIELDS = {"amount", "price_usd", "value_usd", "fee_usd"}
+
+
+def _clean_edit(changes):
+    """
+    Validated manual-edit changes: the timestamp as epoch seconds (ISO strings accepted) and
+    numeric fields as decimal strings. Raises ValueError naming the first bad field.
+    """
+    from decimal import Decimal, InvalidOperation
+    from app.services.cost_basis import _to_timestamp
+    if not isinstance(changes, dict):
+        raise ValueError("changes must be an object.")
+    unknown = set(changes) - EDITABLE_FIELDS
+    if unknown:
+        raise ValueError(f"Fields not editable: {', '.join(sorted(unknown))}.")
+    clean = dict(changes)
+    if "timestamp" in clean:
+        try:
+            clean["timestamp"] = _to_timestamp(clean["timestamp"])
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            clean["timestamp"] = None
+        if clean["timestamp"] is None:
+            raise ValueError("timestamp must be epoch seconds or an ISO 8601 date.")
+    for field in DECIMAL_FIELDS & set(clean):
+        value = clean[field]
+        if value is None and field != "amount":
+            continue
+        try:
+            number = Decimal(str(value)) if isinstance(value, (str, int, float)) and not isinstance(value, bool) else None
+        except InvalidOperation:
+            number = None
+        if number is None or not number.is_finite():
+            raise ValueError(f"{field} must be a number.")
+        clean[field] = str(number)
+    if "token" in clean and (not isinstance(clean["token"], str) or not clean["token"].strip()):
+        raise ValueError("token must be a non-empty string.")
+    return clean
+
+
+class TransactionStore:
+    """
+    SQLite-backed transaction store keyed by (chain, address, tx id).
+    Keeps a per-address sync cursor (high-water block and tx id) and a data version that
+    is bumped whenever new rows are merged in. Every merge or edit also appends the earliest
+    affected timestamp per token to `change_log`, so derived state can be recomputed from there.
+    The connection is shared between threads, so every statement and fetch runs under `lock`;
+    iterators take it per batch, never across a yield.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("TX_STORE_PATH", DEFAULT_STORE_PATH)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints; bulk imports commit once per batch.
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+
+    def add_wallet(self, user_id: str, chain: str, address: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO wallets (user_id, chain, address) VALUES (?, ?, ?)",
+                (user_id, chain, address),
+            )
+
+    def _fetchall(self, query: str, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def _fetchone(self, query: str, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchone()
+
+    def _iter_rows(self, query: str, params=(), batch_size: int = 10000):
+        with self.lock:
+            cursor = self.conn.execute(query, params)
+            rows = cursor.fetchmany(batch_size)
+        while rows:
+            yield from rows
+            with self.lock:
+                rows = cursor.fetchmany(batch_size)
+
+    def get_wallets(self, user_id: str):
+        rows = self._fetchall(
+            "SELECT chain, address FROM wallets WHERE user_id = ? ORDER BY chain, address", (user_id,)
+        )
+        return [{"chain": chain, "address": address} for chain, address in rows]
+
+    def get_users(self):
+        """Every user with at least one stored wallet or account, sorted."""
+        return [user_id for (user_id,) in self._fetchall("SELECT DISTINCT user_id FROM wallets ORDER BY user_id")]
+
+    def content_hash(self, user_id: str) -> str:
+        """SHA-256 over a user's wallets and stored rows (raw payloads, in key order); changes with any merge or edit."""
+        digest = hashlib.sha256()
+        for wallet in self.get_wallets(user_id):
+            digest.update(f"{wallet['chain']}|{wallet['address']}\n".encode("utf-8"))
+        rows = self._iter_rows(
+            "SELECT t.chain, t.address, t.tx_id, t.payload FROM transactions t "
+            "JOIN wallets w ON t.chain = w.chain AND t.address = w.address WHERE w.user_id = ? "
+            "ORDER BY t.chain, t.address, t.tx_id",
+            (user_id,),
+        )
+        for row in rows:
+            digest.update("|".join(row).encode("utf-8"))
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def unpriced_ranges(self, user_id: str):
+        """{token: (first, last timestamp)} of a user's rows that carry neither `price_usd` nor `value_usd`."""
+        rows = self._fetchall(
+            "SELECT t.token, MIN(t.timestamp), MAX(t.timestamp) FROM transactions t "
+            "JOIN wallets w ON t.chain = w.chain AND t.address = w.address WHERE w.user_id = ? "
+            "AND t.token IS NOT NULL AND t.timestamp IS NOT NULL "
+            "AND json_extract(t.payload, '$.price_usd') IS NULL AND json_extract(t.payload, '$.value_usd') IS NULL "
+            "GROUP BY t.token",
+            (user_id,),
+        )
+        return {token: (first, last) for token, first, last in rows}
+
+    def user_tokens(self, user_id: str):
+        return [token for (token,) in self._fetchall(
+            "SELECT DISTINCT t.token FROM transactions t JOIN wallets w ON t.chain = w.chain AND t.address = w.address "
+            "WHERE w.user_id = ? AND t.token IS NOT NULL ORDER BY t.token",
+            (user_id,),
+        )]
+
+    def get_sync_state(self, chain: str, address: str):
+        row = self._fetchone(
+            "SELECT cursor_block, cursor_tx_id, version, last_synced_at FROM sync_state WHERE chain = ? AND address = ?",
+            (chain, address),
+        )
+        if row is None:
+            return None
+        return {"block": row[0], "tx_id": row[1], "version": row[2], "last_synced_at": row[3]}
+
+    def get_sync_cursor(self, chain: str, address: str):
+        """Return the high-water mark ({"block", "tx_id"}) for an address, or None if never synced."""
+        state = self.get_sync_state(chain, address)
+        if state is None or state["block"] is None:
+            return None
+        return {"block": state["block"], "tx_id": state["tx_id"]}
+
+    def merge_transactions(self, chain: str, address: str, txs, synced_at: int = None) -> int:
+        """
+        Insert transactions that are not stored yet and advance the sync cursor to the newest
+        confirmed block seen. A stored row that is still unconfirmed (no block or no timestamp)
+        is replaced when the incoming copy has what it lacked, so a transaction first seen
+        pending picks up its block and time; a manually edited row only takes the block.
+        Returns the number of rows inserted or confirmed.
+        """
+        rows = [
+            (chain, address, str(tx["id"]), tx.get("timestamp"), tx.get("block"), tx.get("token"), json.dumps(tx))
+            for tx in txs
+            if tx.get("id") is not None
+        ]
+        with self.lock, self.conn:
+            # Confirming a row can move it in time, so its old timestamp goes to the change log too.
+            pending = self._unconfirmed(chain, address, txs)
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT INTO transactions (chain, address, tx_id, timestamp, block, token, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (chain, address, tx_id) DO UPDATE SET "
+                "block = COALESCE(excluded.block, transactions.block), "
+                "timestamp = CASE WHEN json_extract(transactions.payload, '$.manual_edit') IS NULL "
+                "THEN COALESCE(excluded.timestamp, transactions.timestamp) ELSE transactions.timestamp END, "
+                "token = CASE WHEN json_extract(transactions.payload, '$.manual_edit') IS NULL "
+                "THEN excluded.token ELSE transactions.token END, "
+                "payload = CASE WHEN json_extract(transactions.payload, '$.manual_edit') IS NULL "
+                "THEN excluded.payload ELSE json_set(transactions.payload, '$.block', excluded.block) END "
+                "WHERE (transactions.block IS NULL AND excluded.block IS NOT NULL) "
+                "OR (transactions.timestamp IS NULL AND excluded.timestamp IS NOT NULL)",
+                rows,
+            )
+            inserted = self.conn.total_changes - before
+            if inserted:
+                self._log_changes(chain, address, pending + list(txs))
+            state = self.get_sync_state(chain, address) or {"block": None, "tx_id": None}
+            cursor_block, cursor_tx_id = state["block"], state["tx_id"]
+            for tx in txs:
+                block = tx.get("block")
+                if block is not None and (cursor_block is None or block > cursor_block):
+                    cursor_block, cursor_tx_id = block, str(tx["id"])
+            self.conn.execute(
+                "INSERT INTO sync_state (chain, address, cursor_block, cursor_tx_id, version, last_synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (chain, address) DO UPDATE SET cursor_block = excluded.cursor_block, "
+                "cursor_tx_id = excluded.cursor_tx_id, version = sync_state.version + ?, "
+                "last_synced_at = excluded.last_synced_at",
+                (chain, address, cursor_block, cursor_tx_id, 1 if inserted else 0, synced_at, 1 if inserted else 0),
+            )
+        return inserted
+
+    def _unconfirmed(self, chain, address, txs):
+        """Stored payloads of the rows in `txs` that lack a block or timestamp the incoming copy has."""
+        wanted = {
+            "block": [str(tx["id"]) for tx in txs if tx.get("id") is not None and tx.get("block") is not None],
+            "timestamp": [str(tx["id"]) for tx in txs if tx.get("id") is not None and tx.get("timestamp") is not None],
+        }
+        found = {}
+        for column, ids in wanted.items():
+            for start in range(0, len(ids), LOOKUP_SLICE):
+                chunk = ids[start:start + LOOKUP_SLICE]
+                found.update(self.conn.execute(
+                    f"SELECT tx_id, payload FROM transactions WHERE chain = ? AND address = ? AND {column} IS NULL "
+                    f"AND tx_id IN ({','.join('?' * len(chunk))})",
+                    (chain, address, *chunk),
+                ).fetchall())
+        return [json.loads(payload) for payload in found.values()]
+
+    def _log_changes(self, chain, address, txs):
+        earliest = {}
+        for tx in txs:
+            token, timestamp = tx.get("token"), tx.get("timestamp")
+            if timestamp is not None and (token not in earliest or timestamp < earliest[token]):
+                earliest[token] = timestamp
+        self.conn.executemany(
+            "INSERT INTO change_log (chain, address, token, min_timestamp) VALUES (?, ?, ?, ?)",
+            [(chain, address, token, timestamp) for token, timestamp in earliest.items()],
+        )
+
+    def get_transaction(self, chain: str, address: str, tx_id: str):
+        row = self._fetchone(
+            "SELECT payload FROM transactions WHERE chain = ? AND address = ? AND tx_id = ?", (chain, address, str(tx_id))
+        )
+        return json.loads(row[0]) if row else None
+
+    def update_transaction(self, chain: str, address: str, tx_id: str, changes):
+        """
+        Apply a manual edit to one stored transaction and bump the address's data version.
+        Returns (before, after) payloads, or None if the transaction does not exist.
+        Changes are validated first (see _clean_edit); a bad value raises ValueError.
+        """
+        changes = _clean_edit(changes)
+        with self.lock, self.conn:
+            before = self.get_transaction(chain, address, tx_id)
+            if before is None:
+                return None
+            after = {**before, **changes, "manual_edit": True}
+            self.conn.execute(
+                "UPDATE transactions SET timestamp = ?, token = ?, payload = ? WHERE chain = ? AND address = ? AND tx_id = ?",
+                (after.get("timestamp"), after.get("token"), json.dumps(after), chain, address, str(tx_id)),
+            )
+            self.conn.execute("UPDATE sync_state SET version = version + 1 WHERE chain = ? AND address = ?", (chain, address))
+            self._log_changes(chain, address, [before, after])
+        return before, after
+
+    def changes_since(self, user_id: str, seq: int = 0):
+        """
+        Earliest changed timestamp per token across a user's wallets for change-log entries
+        after `seq`. Returns (latest_seq, {token: min_timestamp}).
+        """
+        rows = self._fetchall(
+            "SELECT c.seq, c.token, c.min_timestamp FROM change_log c JOIN wallets w ON c.chain = w.chain AND c.address = w.address "
+            "WHERE w.user_id = ? AND c.seq > ?",
+            (user_id, seq),
+        )
+        earliest = {}
+        for _, token, timestamp in rows:
+            if token not in earliest or timestamp < earliest[token]:
+                earliest[token] = timestamp
+        return max([row[0] for row in rows], default=self.latest_change()), earliest
+
+    def latest_change(self) -> int:
+        return self._fetchone("SELECT COALESCE(MAX(seq), 0) FROM change_log")[0]
+
+    def get_transactions(self, chain: str, address: str):
+        """Return stored transactions for an address, oldest first."""
+        rows = self._fetchall(
+            "SELECT payload FROM transactions WHERE chain = ? AND address = ? ORDER BY timestamp, rowid",
+            (chain, address),
+        )
+        return [json.loads(payload) for (payload,) in rows]
+
+    def iter_user_transactions(self, user_id: str, batch_size: int = 10000, token: str = None, since: int = None):
+        """Stream stored transactions across a user's wallets in time order, optionally for one token and from `since`."""
+        query = (
+            "SELECT t.payload FROM transactions t JOIN wallets w ON t.chain = w.chain AND t.address = w.address "
+            "WHERE w.user_id = ?"
+        )
+        params = [user_id]
+        if token is not None:
+            query += " AND t.token = ?"
+            params.append(token)
+        if since is not None:
+            query += " AND t.timestamp >= ?"
+            params.append(since)
+        for (payload,) in self._iter_rows(query + " ORDER BY t.timestamp, t.rowid", params, batch_size):
+            yield json.loads(payload)
+
+    def iter_user_rows(self, user_id: str, batch_size: int = 10000):
+        """Like iter_user_transactions, but yields (chain, address, tx_id, transaction) so rows can be updated in place."""
+        query = (
+            "SELECT t.chain, t.address, t.tx_id, t.payload FROM transactions t "
+            "JOIN wallets w ON t.chain = w.chain AND t.address = w.address WHERE w.user_id = ? ORDER BY t.timestamp, t.rowid"
+        )
+        for chain, address, tx_id, payload in self._iter_rows(query, (user_id,), batch_size):
+            yield chain, address, tx_id, json.loads(payload)
+
+    def iter_transfer_rows(self, user_id: str, tokens=None):
+        """
+        Yield (chain, address, tx_id, fields) for a user's rows that can be a leg of a
+        self-transfer (send/receive/transfer types) or already carry a match, optionally only
+        for some tokens (case-insensitive). Filtering and field extraction run in SQLite, so only
+        the few fields the matcher needs reach Python; `fields` holds TRANSFER_FIELDS plus token and timestamp.
+        """
+        # One multi-path json_extract returns the fields as a small JSON array.
+        paths = ", ".join(f"'$.{field}'" for field in TRANSFER_FIELDS)
+        query = (
+            f"SELECT t.chain, t.address, t.tx_id, t.token, t.timestamp, json_extract(t.payload, {paths}) FROM transactions t "
+            "JOIN wallets w ON t.chain = w.chain AND t.address = w.address WHERE w.user_id = ? "
+            "AND (LOWER(COALESCE(json_extract(t.payload, '$.type'), 'transfer')) IN "
+            "('send', 'withdrawal', 'transfer', 'receive', 'deposit') "
+            "OR json_extract(t.payload, '$.internal_transfer') IS NOT NULL)"
+        )
+        params = [user_id]
+        if tokens is not None:
+            tokens = sorted({(token or "").upper() for token in tokens})
+            query += f" AND UPPER(t.token) IN ({', '.join('?' * len(tokens))})"
+            params += tokens
+        for row in self._iter_rows(query, params):
+            fields = dict(zip(TRANSFER_FIELDS, json.loads(row[5])))
+            fields["token"], fields["timestamp"] = row[3], row[4]
+            yield row[0], row[1], row[2], fields
+
+    def set_internal_transfers(self, updates):
+        """
+        Set (or clear, with None) the `internal_transfer` match id on stored rows.
+        `updates` is [(chain, address, tx_id, payload, match_id)]; changes go to the change log.
+        """
+        if not updates:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE transactions SET payload = json_set(payload, '$.internal_transfer', ?) "
+                "WHERE chain = ? AND address = ? AND tx_id = ?",
+                [(match_id, chain, address, tx_id) for chain, address, tx_id, _, match_id in updates if match_id is not None],
+            )
+            self.conn.executemany(
+                "UPDATE transactions SET payload = json_remove(payload, '$.internal_transfer') "
+                "WHERE chain = ? AND address = ? AND tx_id = ?",
+                [(chain, address, tx_id) for chain, address, tx_id, _, match_id in updates if match_id is None],
+            )
+            changed = {}
+            for chain, address, _, tx, _ in updates:
+                changed.setdefault((chain, address), []).append(tx)
+            for (chain, address), txs in changed.items():
+                self._log_changes(chain, address, txs)
+
+    def set_classifications(self, updates):
+        """
+        Store classifier types on rows as `classification`. `updates` is
+        [(chain, address, tx_id, payload, classification)]; changes go to the change log.
+        """
+        if not updates:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE transactions SET payload = json_set(payload, '$.classification', ?) "
+                "WHERE chain = ? AND address = ? AND tx_id = ?",
+                [(classification, chain, address, tx_id) for chain, address, tx_id, _, classification in updates],
+            )
+            changed = {}
+            for chain, address, _, tx, _ in updates:
+                changed.setdefault((chain, address), []).append(tx)
+            for (chain, address), txs in changed.items():
+                self._log_changes(chain, address, txs)
+
+    def load_user_batch(self, user_id: str, chunk_size: int = 100000):
+        """Load a user's stored history, time-ordered, as a columnar TransactionBatch."""
+        from app.utils.transaction_batch import TransactionBatch
+        tables = TransactionBatch.empty_tables()
+        chunks = []
+        chunk = []
+        for tx in self.iter_user_transactions(user_id):
+            chunk.append(tx)
+            if len(chunk) >= chunk_size:
+                chunks.append(TransactionBatch.from_dicts(chunk, tables))
+                chunk = []
+        chunks.append(TransactionBatch.from_dicts(chunk, tables))
+        return TransactionBatch.concat(chunks)
+
+    def count_transactions(self, chain: str, address: str) -> int:
+        return self._fetchone(
+            "SELECT COUNT(*) FROM transactions WHERE chain = ? AND address = ?", (chain, address)
+        )[0]
+
+
+_store = None
+
+
+def get_store() -> TransactionStore:
+    """Return the process-wide transaction store, opening it on first use."""
+    global _store
+    if _store is None:
+        _store = TransactionStore()
+        cprint(f"[INFO] Transaction store opened at {_store.path}", "cyan")
+    return _store
@@ -0,0 +1,41 @@
+import time
+import asyncio
+from termcolor import cprint
+from app.utils.fetch_wallet_transactions import fetch_wallet_transactions, normalize_chain
+from app.utils.tx_store import get_store
+
+
+async def sync_wallet(address: str, chain: str = "eth", store=None):
+    """
+    Incrementally sync one wallet into the transaction store.
+    Only transactions at or above the stored high-water block are fetched; rows already
+    stored are skipped on merge. Returns counts of fetched and newly stored transactions.
+    """
+    store = store or get_store()
+    chain = normalize_chain(chain)
+    cursor = store.get_sync_cursor(chain, address)
+    txs = await fetch_wallet_transactions(address, chain, since=cursor)
+    inserted = await asyncio.to_thread(store.merge_transactions, chain, address, txs, int(time.time()))
+    cprint(
+        f"[INFO] Synced {address} on {chain}: {len(txs)} fetched, {inserted} new"
+        + (f" (since block {cursor['block']})." if cursor else " (full history)."),
+        "green",
+    )
+    return {"address": address, "chain": chain, "fetched": len(txs), "inserted": inserted}
+
+
+async def sync_wallets(wallets, store=None):
+    """
+    Sync many (address, chain) pairs concurrently. A wallet whose provider fails gets an
+    "error" entry instead of counts; the others are still synced.
+    """
+    results = await asyncio.gather(*(sync_wallet(address, chain, store) for address, chain in wallets), return_exceptions=True)
+    for (address, chain), result in zip(wallets, results):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, Exception):
+            cprint(f"[ERROR] Sync failed for {address} on {chain}: {result}", "red")
+    return [
+        {"address": address, "chain": chain, "error": str(result)} if isinstance(result, Exception) else result
+        for (address, chain), result in zip(wallets, results)
+    ]
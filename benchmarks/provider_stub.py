@@ -0,0 +1,206 @@
+"""
+Local stand-in for the data and AI providers: serves Covalent, Helius and Blockstream
+wallet histories and OpenRouter chat completions from synthetic data, with configurable
+latency, pagination and a share of 429 responses (with Retry-After). Point the app at it with
+the variables from `stub.env()`:
+
+    COVALENT_BASE_URL, HELIUS_BASE_URL, BLOCKSTREAM_BASE_URL, OPENROUTER_URL
+
+Every wallet address has `per_wallet` transactions generated from its address and the seed.
+Run standalone with `python benchmarks/provider_stub.py [--port 8900] [--latency 0.05] ...`.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import to_blockstream, to_covalent, to_helius, wallet_history  # noqa: E402
+
+COVALENT_CHAINS = {"1": "eth", "8453": "base", "42161": "arbitrum"}
+BLOCKSTREAM_PAGE_SIZE = 25
+# Transaction ids echoed in a classification prompt (the transactions are in Python repr).
+PROMPT_IDS = re.compile(r"'id': '([^']+)'")
+
+
+class ProviderStub:
+    def __init__(self, port: int = 0, per_wallet: int = 1000, seed: int = 0, latency: float = 0.05,
+                 jitter: float = 0.02, throttle: float = 0.0, retry_after: float = 0.1, stream_chunks: int = 4):
+        self.per_wallet, self.seed = per_wallet, seed
+        self.latency, self.jitter = latency, jitter
+        self.throttle, self.retry_after = throttle, retry_after
+        self.stream_chunks = stream_chunks
+        self.histories = {}
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.counts = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def env(self):
+        return {
+            "COVALENT_BASE_URL": f"{self.url}/covalent",
+            "HELIUS_BASE_URL": f"{self.url}/helius",
+            "BLOCKSTREAM_BASE_URL": f"{self.url}/blockstream",
+            "OPENROUTER_URL": f"{self.url}/openrouter/chat/completions",
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def history(self, chain: str, address: str, convert):
+        """The wallet's provider items, newest first (as the providers return them), and an id -> position map."""
+        key = (chain, address)
+        with self.lock:
+            entry = self.histories.get(key)
+        if entry is None:
+            items = [convert(tx) for tx in wallet_history(chain, address, self.per_wallet, self.seed)]
+            items.reverse()
+            entry = (items, {_item_id(item): i for i, item in enumerate(items)})
+            with self.lock:
+                self.histories[key] = entry
+        return entry
+
+    def delay(self):
+        with self.lock:
+            jitter = self.rng.random() * self.jitter
+            throttled = self.rng.random() < self.throttle
+        time.sleep(self.latency + jitter)
+        return throttled
+
+
+def _item_id(item):
+    return item.get("tx_hash") or item.get("signature") or item.get("txid")
+
+
+def _handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, body, status: int = 200, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _throttled(self, provider):
+            stub.count(provider)
+            if stub.delay():
+                stub.count(f"{provider}_429")
+                self._send_json({"error": "rate limited"}, 429, {"Retry-After": str(stub.retry_after)})
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            parts = url.path.strip("/").split("/")
+            provider = parts[0]
+            if provider == "covalent" and len(parts) >= 4:
+                if self._throttled(provider):
+                    return
+                items, _ = stub.history(COVALENT_CHAINS.get(parts[1], "eth"), parts[3], to_covalent)
+                size = int(query.get("page-size", 100))
+                start = int(query.get("page-number", 0)) * size
+                page = items[start:start + size]
+                return self._send_json({"data": {"items": page, "pagination": {"has_more": start + size < len(items)}}})
+            if provider == "helius" and len(parts) >= 3:
+                if self._throttled(provider):
+                    return
+                items, positions = stub.history("solana", parts[2], to_helius)
+                start = positions[query["before"]] + 1 if query.get("before") in positions else 0
+                page = items[start:start + int(query.get("limit", 100))]
+                until = query.get("until")
+                if until in positions:
+                    page = [item for item in page if positions[item["signature"]] < positions[until]]
+                return self._send_json(page)
+            if provider == "blockstream" and len(parts) >= 4:
+                if self._throttled(provider):
+                    return
+                items, positions = stub.history("bitcoin", parts[2], to_blockstream)
+                start = positions[parts[5]] + 1 if len(parts) >= 6 and parts[5] in positions else 0
+                return self._send_json(items[start:start + BLOCKSTREAM_PAGE_SIZE])
+            self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.startswith("/openrouter"):
+                return self._send_json({"error": "not found"}, 404)
+            if self._throttled("openrouter"):
+                return
+            prompt = (body.get("messages") or [{}])[-1].get("content", "")
+            content = json.dumps([
+                {"id": tx_id, "type": "transfer", "explanation": "Synthetic classification."}
+                for tx_id in PROMPT_IDS.findall(prompt)
+            ])
+            if not body.get("stream"):
+                return self._send_json({
+                    "model": body.get("model"),
+                    "choices": [{"message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(content) // 4 + 1},
+                })
+            # Server-sent events, the answer split into a few deltas; the connection closes at the end.
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            step = max(1, len(content) // stub.stream_chunks + 1)
+            for i in range(0, len(content), step):
+                event = {"choices": [{"delta": {"content": content[i:i + step]}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--per-wallet", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.02, help="up to this many extra seconds, at random")
+    parser.add_argument("--throttle", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    args = parser.parse_args()
+    stub = ProviderStub(args.port, args.per_wallet, args.seed, args.latency, args.jitter, args.throttle, args.retry_after)
+    for name, value in stub.env().items():
+        print(f"{name}={value}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
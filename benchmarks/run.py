@@ -0,0 +1,241 @@
+"""
+Benchmark suite: fetch, import, classify, tax and report over a synthetic portfolio
+(benchmarks/synthetic.py), against the local provider stand-in (benchmarks/provider_stub.py).
+
+    python benchmarks/run.py [--size 10000] [--scenarios fetch,import,classify,tax,report]
+                             [--out results.json] [--baseline results.json] [--tolerance 0.25]
+
+Each scenario runs in a fresh interpreter with its own stores in a temporary directory, so
+its peak RSS is its own. Untimed setup (writing the CSV, filling the store, building the
+ledger) runs in a separate interpreter first. Results give throughput (items per second)
+and peak memory. With --baseline, a scenario whose throughput drops or whose peak memory
+grows by more than --tolerance is a regression, and the run exits 1.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+SCENARIOS = ("fetch", "import", "classify", "tax", "report")
+USER_ID = "bench"
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _populate(args):
+    from synthetic import iter_account_histories
+    from app.utils.tx_store import get_store
+    store = get_store()
+    for chain, address, rows in iter_account_histories(args.size, args.seed):
+        store.add_wallet(USER_ID, chain, address)
+        chunk = []
+        for tx in rows:
+            chunk.append(tx)
+            if len(chunk) >= 10000:
+                store.merge_transactions(chain, address, chunk)
+                chunk = []
+        store.merge_transactions(chain, address, chunk)
+    return store
+
+
+# Setup and timed body per scenario. Setup runs in its own interpreter; the body returns
+# (items processed, extra result fields).
+
+def prepare_import(args):
+    from synthetic import iter_portfolio, write_csv
+    write_csv(os.path.join(args.workdir, "import.csv"), iter_portfolio(args.size, args.seed))
+
+
+def prepare_tax(args):
+    _populate(args)
+
+
+def prepare_report(args):
+    from app.services.tax_ledger import get_tax_ledger
+    _populate(args)
+    get_tax_ledger().rebuild(USER_ID)
+
+
+def run_fetch(args):
+    from synthetic import portfolio_wallets
+    from app.utils.fetch_wallet_transactions import fetch_many_wallet_transactions
+    results = asyncio.run(fetch_many_wallet_transactions(portfolio_wallets(args.seed)))
+    return sum(len(r["transactions"]) for r in results), {"wallets": len(results)}
+
+
+def run_import(args):
+    from app.utils.csv_importer import import_csv
+    path = os.path.join(args.workdir, "import.csv")
+    with open(path, "rb") as f:
+        result = import_csv(f, "synthetic", user_id=USER_ID, total_bytes=os.path.getsize(path),
+                            progress=lambda *_: None, profile_name="generic")
+    return result["rows"], {"imported": result["imported"], "errors": result["errors"], "bytes": os.path.getsize(path)}
+
+
+def run_classify(args):
+    from synthetic import iter_portfolio
+    from app.services.ai_service import ai_classify_transactions
+    from app.services.rule_classifier import classify_with_rules
+    from app.utils.metrics import UPSTREAM_REQUESTS
+    transactions = list(iter_portfolio(args.size, args.seed))
+    started = time.perf_counter()
+    results = asyncio.run(classify_with_rules(transactions, ai_classify_transactions))
+    if isinstance(results, dict):
+        raise RuntimeError(results.get("error"))
+    by_source = {}
+    for result in results:
+        source = result.get("source", "ai") if isinstance(result, dict) else "missing"
+        by_source[source] = by_source.get(source, 0) + 1
+    requests = sum(v for (provider, _), v in UPSTREAM_REQUESTS.values.items() if provider == "openrouter")
+    # Generating the input is not part of the measurement.
+    return len(results), {"by_source": by_source, "ai_requests": requests, "seconds": time.perf_counter() - started}
+
+
+def run_tax(args):
+    from app.services.tax_ledger import get_tax_ledger
+    ledger = get_tax_ledger()
+    ledger.rebuild(USER_ID)
+    result = ledger.result(USER_ID)
+    return args.size, {"disposals": result.get("disposals"), "skipped": result.get("skipped")}
+
+
+def run_report(args):
+    from app.services.report_service import iter_report
+    from app.services.tax_ledger import get_tax_ledger
+    size = lines = 0
+    for chunk in iter_report(get_tax_ledger(), USER_ID, "csv"):
+        size += len(chunk)
+        lines += chunk.count("\n") if isinstance(chunk, str) else chunk.count(b"\n")
+    return lines - 1, {"bytes": size}
+
+
+def child(args):
+    """Run one scenario's setup (--prepare) or timed body in this interpreter and print JSON."""
+    sys.path[:0] = [BENCH, ROOT]
+    if args.prepare:
+        globals()[f"prepare_{args.child}"](args)
+        return
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    items, extra = globals()[f"run_{args.child}"](args)
+    seconds = extra.pop("seconds", None) or time.perf_counter() - started
+    print(json.dumps({
+        "items": items, "seconds": round(seconds, 4), "items_per_sec": round(items / seconds, 1) if seconds else None,
+        "peak_rss_mb": round(_rss_mb(), 1), "rss_before_mb": round(rss_before, 1), **extra,
+    }))
+
+
+def _spawn(args, scenario, workdir, env, prepare=False):
+    command = [sys.executable, os.path.abspath(__file__), "--child", scenario, "--workdir", workdir,
+               "--size", str(args.size), "--seed", str(args.seed)] + (["--prepare"] if prepare else [])
+    proc = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{scenario}{' setup' if prepare else ''} failed:\n{proc.stderr[-2000:]}")
+    return proc.stdout
+
+
+def run_scenario(args, scenario, stub):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{scenario}_")
+    env = {
+        **os.environ, **stub.env(),
+        "PYTHONPATH": ROOT, "LOG_LEVEL": "WARNING",
+        "TX_STORE_PATH": os.path.join(workdir, "transactions.db"),
+        "TAX_STATE_PATH": os.path.join(workdir, "tax_state.db"),
+        "AI_CACHE_PATH": os.path.join(workdir, "ai_cache.db"),
+        "CLASSIFICATION_MEMO_PATH": os.path.join(workdir, "classifications.db"),
+        "REPORT_CACHE_DIR": os.path.join(workdir, "reports"),
+        "PRICE_STORE_DIR": os.path.join(workdir, "prices"),
+        "COVALENT_API_KEY": "bench", "HELIUS_API_KEY": "bench", "OPENROUTER_API_KEY": "bench",
+        "COVALENT_RATE_LIMIT": str(args.provider_rate), "HELIUS_RATE_LIMIT": str(args.provider_rate),
+        "BLOCKSTREAM_RATE_LIMIT": str(args.provider_rate),
+        "MODEL_ROUTER_HEDGE": "0",
+    }
+    try:
+        if f"prepare_{scenario}" in globals():
+            _spawn(args, scenario, workdir, env, prepare=True)
+        return json.loads(_spawn(args, scenario, workdir, env).strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance: float):
+    """Regressions against a baseline run: throughput down or peak memory up by more than `tolerance`."""
+    regressions = []
+    for scenario, result in results.items():
+        before = baseline.get("results", {}).get(scenario)
+        if not before:
+            continue
+        if before.get("items_per_sec") and result["items_per_sec"] < before["items_per_sec"] * (1 - tolerance):
+            regressions.append(f"{scenario}: {result['items_per_sec']:.0f} items/s, baseline {before['items_per_sec']:.0f}")
+        if before.get("peak_rss_mb") and result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{scenario}: peak RSS {result['peak_rss_mb']:.0f} MB, baseline {before['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000, help="transactions in the synthetic portfolio")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.02, help="stub response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--throttle", type=float, default=0.02, help="share of stub responses that are 429s")
+    parser.add_argument("--provider-rate", type=float, default=200, help="client-side requests per second per provider")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    sys.path.insert(0, BENCH)
+    from synthetic import portfolio_accounts
+    from provider_stub import ProviderStub
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    # The stub serves every wallet the same number of rows: the portfolio's per-wallet average.
+    per_wallet = max(1, sum(n for chain, _, n in portfolio_accounts(args.size, args.seed) if chain != "exchange")
+                     // (len(portfolio_accounts(args.size, args.seed)) - 1))
+    stub = ProviderStub(per_wallet=per_wallet, seed=args.seed, latency=args.latency, jitter=args.jitter,
+                        throttle=args.throttle).start()
+    results = {}
+    try:
+        for scenario in scenarios:
+            result = results[scenario] = run_scenario(args, scenario, stub)
+            print(f"{scenario:<9} {result['items']:>10} items  {result['seconds']:>8.2f} s  "
+                  f"{result['items_per_sec']:>10.0f} items/s  peak RSS {result['peak_rss_mb']:>7.1f} MB", flush=True)
+    finally:
+        stub.stop()
+    print(f"stub requests: {json.dumps(dict(sorted(stub.counts.items())))}")
+    report = {"size": args.size, "seed": args.seed, "python": platform.python_version(), "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"[regression] {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Cold-start benchmark: imports `main` in fresh interpreters and reports the import time, the
+number of modules loaded and which heavy dependencies came along. Then checks that every
+router in the table resolves (app.routes.registry.check_routers); exits 1 on problems.
+
+    python benchmarks/startup.py [--runs N] [--eager]
+
+--eager also times importing every service module, i.e. what the first requests pay.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("numpy", "httpx", "sqlite3")
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+loaded = set(sys.modules)
+extra = None
+if {eager}:
+    import pkgutil, importlib, app.services, app.utils
+    started = time.perf_counter()
+    for package in (app.services, app.utils):
+        for info in pkgutil.iter_modules(package.__path__):
+            importlib.import_module(package.__name__ + "." + info.name)
+    extra = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": len(loaded), "app_modules": sorted(m for m in loaded if m.startswith("app.")),
+                  "heavy": [m for m in {heavy} if m in loaded], "services_seconds": extra}}))
+"""
+
+
+def probe(eager: bool):
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    out = subprocess.run([sys.executable, "-c", PROBE.format(eager=eager, heavy=HEAVY)], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true")
+    args = parser.parse_args()
+    runs = [probe(args.eager) for _ in range(args.runs)]
+    seconds = sorted(run["seconds"] for run in runs)
+    print(f"import main: median {statistics.median(seconds) * 1000:.0f} ms, min {seconds[0] * 1000:.0f} ms over {len(runs)} runs")
+    print(f"modules loaded: {runs[0]['modules']} ({len(runs[0]['app_modules'])} from app)")
+    print(f"heavy dependencies loaded at startup: {', '.join(runs[0]['heavy']) or 'none'}")
+    services = [run["services_seconds"] for run in runs if run["services_seconds"] is not None]
+    if services:
+        print(f"deferred service imports (paid on first requests): median {statistics.median(services) * 1000:.0f} ms")
+    sys.path.insert(0, ROOT)
+    from app.routes.registry import ROUTERS, check_routers
+    problems = check_routers()
+    for problem in problems:
+        print(f"[router] {problem}")
+    print(f"routers: {len(ROUTERS)} registered, {len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
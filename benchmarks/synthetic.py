@@ -0,0 +1,241 @@
+"""
+Synthetic portfolios for benchmarks. Histories are generated per wallet from a seed, in time
+order, so any size (10k to 10M rows) streams without being held in memory and the same seed
+always gives the same rows. A portfolio mixes EVM, Solana and Bitcoin wallets with an exchange
+account; rows cover buys, sells, income, transfers (including self-transfers), swaps, LP
+adds/removes/collects, NFT trades and token transfers the rules cannot decide.
+
+The converters turn canonical rows into Covalent, Helius and Blockstream response items,
+which is what benchmarks/provider_stub.py serves.
+"""
+import csv
+import math
+import heapq
+import random
+import hashlib
+from datetime import datetime, timezone
+from decimal import Decimal
+
+START = 1609459200  # 2021-01-01
+SPAN = 3 * 365 * 86400
+EXCHANGE = "coinbase"
+
+# Rough USD price per token; prices drift around these along a deterministic curve.
+BASE_PRICES = {"ETH": 2000.0, "BTC": 40000.0, "SOL": 100.0, "USDC": 1.0, "UNI": 6.0, "LINK": 15.0, "ARB": 1.2}
+CHAIN_TOKENS = {
+    "eth": ("ETH", "ETH", "USDC", "UNI", "LINK"),
+    "base": ("ETH", "ETH", "USDC"),
+    "arbitrum": ("ETH", "ARB", "USDC"),
+    "solana": ("SOL", "SOL", "USDC"),
+    "bitcoin": ("BTC",),
+}
+EVM_CHAINS = ("eth", "base", "arbitrum")
+
+# Contracts and selectors the rule classifier knows (app/services/rule_classifier.py).
+UNISWAP_ROUTER = "0x7a250d5630b4cf539739df2c5dacb4c659f2488d"
+UNISWAP_POSITIONS = "0xc36442b4a4522e871399cd717abdd847ab11fe88"
+SEAPORT = "0x00000000006c3852cbef3e08e8df289169ede581"
+SELECTORS = {"swap": "0x38ed1739", "lp_add": "0x88316456", "lp_remove": "0x0c49ccbe", "lp_collect": "0xfc6f7865",
+             "nft_trade": "0xfb0f3ee1", "token_transfer": "0xa9059cbb"}
+
+# Row kinds and their weights per account kind.
+EVM_KINDS = (("receive", 22), ("send", 14), ("self", 5), ("swap", 14), ("lp_add", 4), ("lp_remove", 3),
+             ("lp_collect", 3), ("nft_trade", 5), ("token_transfer", 10), ("unknown_call", 12), ("income", 8))
+SOLANA_KINDS = (("receive", 30), ("send", 20), ("self", 5), ("SWAP", 20), ("NFT_SALE", 8), ("STAKE_SOL", 7), ("unknown_call", 10))
+BITCOIN_KINDS = (("receive", 55), ("send", 35), ("self", 10))
+EXCHANGE_KINDS = (("buy", 50), ("sell", 30), ("staking", 12), ("interest", 8))
+
+# Share of a portfolio's rows per account kind.
+ACCOUNT_SHARES = {"exchange": 0.3, "eth": 0.3, "base": 0.1, "arbitrum": 0.1, "solana": 0.12, "bitcoin": 0.08}
+
+CSV_FIELDS = ("id", "timestamp", "type", "token", "amount", "from", "to", "chain", "price_usd", "value_usd", "fee_usd")
+
+
+def price(token: str, timestamp: int) -> float:
+    """Deterministic USD price of `token` at `timestamp` (a slow wave around its base price)."""
+    base = BASE_PRICES.get(token, 1.0)
+    if token == "USDC":
+        return base
+    phase = int(hashlib.md5(token.encode()).hexdigest()[:6], 16) % 628 / 100
+    t = (timestamp - START) / SPAN
+    return round(base * math.exp(0.6 * math.sin(2 * math.pi * 1.5 * t + phase) + 0.2 * t), 6)
+
+
+def _address(rng, chain: str) -> str:
+    if chain in EVM_CHAINS:
+        return f"0x{rng.getrandbits(160):040x}"
+    if chain == "bitcoin":
+        return f"bc1q{rng.getrandbits(160):040x}"[:42]
+    return f"{rng.getrandbits(256):064x}"[:44]
+
+
+def _tx_id(rng, chain: str) -> str:
+    if chain in EVM_CHAINS:
+        return f"0x{rng.getrandbits(256):064x}"
+    if chain == "solana":
+        return f"{rng.getrandbits(512):0128x}"[:88]
+    return f"{rng.getrandbits(256):064x}"
+
+
+def _block(chain: str, timestamp: int) -> int:
+    elapsed = timestamp - START
+    if chain == "solana":
+        return 60_000_000 + elapsed * 2
+    if chain == "bitcoin":
+        return 665_000 + elapsed // 600
+    return 11_500_000 + elapsed // 12
+
+
+def _amount(rng, token: str, scale: float = 1.0) -> str:
+    usd = rng.lognormvariate(5.5, 1.2) * scale
+    return f"{usd / BASE_PRICES.get(token, 1.0):.8f}"
+
+
+def _pick(rng, kinds):
+    total = sum(weight for _, weight in kinds)
+    point = rng.random() * total
+    for kind, weight in kinds:
+        point -= weight
+        if point < 0:
+            return kind
+    return kinds[-1][0]
+
+
+def _seed(*parts) -> int:
+    return int(hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()[:16], 16)
+
+
+def wallet_history(chain: str, address: str, count: int, seed: int = 0, owned=(), start: int = START, span: int = SPAN):
+    """
+    Yield `count` canonical rows for one wallet (or, with chain "exchange", an exchange
+    account named `address`) in time order. `owned` lists the user's other addresses on the
+    chain, the targets of self-transfers.
+    """
+    rng = random.Random(_seed(seed, chain, address))
+    step = span / max(count, 1)
+    others = [other for other in owned if other != address]
+    is_exchange = chain == "exchange"
+    kinds = EXCHANGE_KINDS if is_exchange else SOLANA_KINDS if chain == "solana" else BITCOIN_KINDS if chain == "bitcoin" else EVM_KINDS
+    tokens = ("BTC", "ETH", "ETH", "SOL", "LINK", "UNI") if is_exchange else CHAIN_TOKENS[chain]
+    for i in range(count):
+        timestamp = int(start + i * step + rng.random() * step * 0.9)
+        kind = _pick(rng, kinds)
+        token = rng.choice(tokens)
+        if is_exchange:
+            amount = _amount(rng, token, 0.05 if kind in ("staking", "interest") else 1.0)
+            tx = {"id": f"{EXCHANGE}-{address}-{i}", "from": "", "to": "", "amount": amount, "token": token,
+                  "type": kind, "chain": EXCHANGE, "timestamp": timestamp}
+            unit = price(token, timestamp)
+            tx["value_usd"] = f"{float(amount) * unit:.2f}"
+            if kind in ("buy", "sell"):
+                tx["fee_usd"] = f"{float(amount) * unit * 0.005:.2f}"
+            yield tx
+            continue
+        counterparty = _address(rng, chain)
+        tx = {"id": _tx_id(rng, chain), "from": counterparty, "to": address, "amount": _amount(rng, token),
+              "token": token, "type": "transfer", "chain": chain, "timestamp": timestamp, "block": _block(chain, timestamp)}
+        if kind == "receive":
+            pass
+        elif kind == "send":
+            tx.update({"from": address, "to": counterparty, "amount": _amount(rng, token, 0.6)})
+        elif kind == "self":
+            tx.update({"from": address, "to": rng.choice(others) if others else counterparty})
+        elif kind in ("swap", "lp_add", "lp_remove", "lp_collect", "nft_trade"):
+            contract = SEAPORT if kind == "nft_trade" else UNISWAP_POSITIONS if kind.startswith("lp_") else UNISWAP_ROUTER
+            if chain != "eth":
+                contract = _address(rng, chain)
+            incoming = kind in ("lp_remove", "lp_collect")
+            tx.update({"from": contract if incoming else address, "to": address if incoming else contract,
+                       "input": SELECTORS[kind] + f"{rng.getrandbits(64):016x}", "amount": _amount(rng, token, 0.5)})
+        elif kind == "token_transfer":
+            tx.update({"input": SELECTORS[kind] + f"{rng.getrandbits(64):016x}"})
+        elif kind == "unknown_call":
+            # No selector, unknown contract, not the native coin: the rules leave these to the AI.
+            tx.update({"from": address, "to": _address(rng, chain), "token": "USDC", "amount": _amount(rng, "USDC", 0.3)})
+        elif kind == "income":
+            tx.update({"type": "reward", "amount": _amount(rng, token, 0.05)})
+        else:
+            # Helius enhanced transaction types.
+            tx["type"] = kind
+            if kind == "NFT_SALE":
+                tx.update({"from": address, "to": counterparty})
+        tx["price_usd"] = str(price(tx["token"], timestamp))
+        yield tx
+
+
+def portfolio_wallets(seed: int = 0, per_chain: int = 2):
+    """The (address, chain) pairs of a synthetic user's wallets, `per_chain` on each chain."""
+    rng = random.Random(_seed(seed, "wallets"))
+    return [(_address(rng, chain), chain) for chain in CHAIN_TOKENS for _ in range(per_chain)]
+
+
+def portfolio_accounts(size: int, seed: int = 0, per_chain: int = 2):
+    """[(chain, address, row count)] for a portfolio of `size` rows: the wallets plus one exchange account."""
+    wallets = portfolio_wallets(seed, per_chain)
+    accounts = [("exchange", "main", int(size * ACCOUNT_SHARES["exchange"]))]
+    for address, chain in wallets:
+        accounts.append((chain, address, int(size * ACCOUNT_SHARES[chain] / per_chain)))
+    # Give the rounding remainder to the exchange account, so the total is exactly `size`.
+    chain, address, count = accounts[0]
+    accounts[0] = (chain, address, count + size - sum(n for _, _, n in accounts))
+    return accounts
+
+
+def iter_account_histories(size: int, seed: int = 0, per_chain: int = 2):
+    """Yield (chain, address, rows iterator) per account of a portfolio; the exchange's chain is EXCHANGE."""
+    wallets = portfolio_wallets(seed, per_chain)
+    for chain, address, count in portfolio_accounts(size, seed, per_chain):
+        owned = [a for a, c in wallets if c == chain]
+        yield (EXCHANGE if chain == "exchange" else chain), address, wallet_history(chain, address, count, seed, owned)
+
+
+def iter_portfolio(size: int, seed: int = 0, per_chain: int = 2):
+    """All rows of a portfolio of `size` rows, merged across accounts in time order."""
+    return heapq.merge(*(rows for _, _, rows in iter_account_histories(size, seed, per_chain)), key=lambda tx: tx["timestamp"])
+
+
+def write_csv(path: str, transactions) -> int:
+    """Write rows in the generic CSV import profile. Returns the number of rows written."""
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for tx in transactions:
+            writer.writerow({**tx, "timestamp": datetime.fromtimestamp(tx["timestamp"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S")})
+            count += 1
+    return count
+
+
+def _iso(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _base_units(amount: str, decimals: int) -> str:
+    return str(int(Decimal(amount).scaleb(decimals)))
+
+
+def to_covalent(tx):
+    """A Covalent transactions_v2 item."""
+    return {
+        "tx_hash": tx["id"], "from_address": tx["from"], "to_address": tx["to"], "value": _base_units(tx["amount"], 18),
+        "contract_ticker_symbol": tx["token"], "block_signed_at": _iso(tx["timestamp"]), "block_height": tx["block"],
+        "successful": True,
+    }
+
+
+def to_helius(tx):
+    """A Helius enhanced transaction."""
+    return {
+        "signature": tx["id"], "accountData": [{"account": tx["from"]}, {"account": tx["to"]}], "amount": tx["amount"],
+        "token": tx["token"], "type": tx["type"].upper(), "timestamp": tx["timestamp"], "slot": tx["block"],
+    }
+
+
+def to_blockstream(tx):
+    """A Blockstream (Esplora) transaction."""
+    return {
+        "txid": tx["id"],
+        "vin": [{"prevout": {"scriptpubkey_address": tx["from"]}}],
+        "vout": [{"scriptpubkey_address": tx["to"], "value": int(_base_units(tx["amount"], 8))}],
+        "status": {"confirmed": True, "block_height": tx["block"], "block_time": tx["timestamp"]},
+    }
@@ -16,6 +16,7 @@ export const LpAiAnalyzer: React.FC = () => {
   const [walletAddress, setWalletAddress] = useState<string>("");
   const [lpTransactions, setLpTransactions] = useState<LpTransaction[]>([]);
   const [results, setResults] = useState<LpAiResult[]>([]);
+  const [explanation, setExplanation] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState<boolean>(false);
   const [error, setError] = useState<string | null>(null);
 
@@ -74,6 +75,7 @@ export const LpAiAnalyzer: React.FC = () => {
     });
     const data = await response.json();
     setResults(data.results || []);
+    setExplanation(data.explanation || null);
   };
 
   return (
@@ -100,6 +102,7 @@ export const LpAiAnalyzer: React.FC = () => {
         <div id="lp-ai-loader" className="w-8 h-8 mx-auto my-4 border-4 border-secondary border-t-transparent rounded-full animate-spin"></div>
       )}
       {error && <div className="text-error mb-2">{error}</div>}
+      {explanation && <div className="mb-4 whitespace-pre-line text-sm">{explanation}</div>}
       {results.length > 0 && (
         <div className="overflow-x-auto">
           <table className="table w-full">
@@ -1,5 +1,6 @@
 import React, { useState } from "react";
 import anime from "animejs";
+import { streamClassifications } from "../utils/aiClient";
 
 interface Transaction {
   id: string;
@@ -66,13 +67,13 @@ export const TransactionClassifier: React.FC = () => {
   };
 
   const classifyAndSetResults = async (txs: Transaction[]) => {
-    const response = await fetch("/api/ai/classify_transactions", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ transactions: txs, task_complexity: "simple" }),
+    // Results stream in as the model produces them; each fills its own row.
+    const rows: ClassificationResult[] = txs.map(() => ({ type: "…", explanation: "" }));
+    setResults([...rows]);
+    await streamClassifications({ transactions: txs, task_complexity: "simple" }, ({ index, result }) => {
+      rows[index] = result;
+      setResults([...rows]);
     });
-    const data = await response.json();
-    setResults(data.results || []);
   };
 
   return (
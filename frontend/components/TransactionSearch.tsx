@@ -34,7 +34,8 @@ export const TransactionSearch: React.FC = () => {
       const response = await fetch("/api/ai/search_transactions", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ transactions, query }),
+        // Without an uploaded file, search the stored history of the user's wallets.
+        body: JSON.stringify(transactions.length > 0 ? { transactions, query } : { user_id: "default", query }),
       });
       const data = await response.json();
       setResults(data.results || []);
@@ -61,12 +62,11 @@ export const TransactionSearch: React.FC = () => {
         placeholder="Search (e.g. show all swaps in 2024)"
         value={query}
         onChange={e => setQuery(e.target.value)}
-        disabled={transactions.length === 0}
       />
       <button
         className="btn btn-primary w-full"
         onClick={handleSearch}
-        disabled={isLoading || !query || transactions.length === 0}
+        disabled={isLoading || !query}
       >
         Search
       </button>
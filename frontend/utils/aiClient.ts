@@ -27,3 +27,51 @@ export async function classifyTransactions(
   const data = await response.json();
   return data.results || [];
 }
+
+export interface StreamedResult<T> {
+  index: number;
+  result: T;
+}
+
+/**
+ * POST a request with `stream: true` and call `onResult` for each NDJSON result line
+ * as soon as it arrives. Resolves with the final summary line.
+ */
+export async function streamNdjson<T>(
+  url: string,
+  body: Record<string, unknown>,
+  onResult: (item: StreamedResult<T>) => void
+): Promise<{ count: number; errors: number; total: number | null }> {
+  const response = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ ...body, stream: true }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error("AI request failed");
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    buffer += decoder.decode(value, { stream: !done });
+    const lines = buffer.split("\n");
+    buffer = done ? "" : lines.pop() ?? "";
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const message = JSON.parse(line);
+      if (message.error) throw new Error(message.error);
+      if (message.done) return message;
+      onResult(message);
+    }
+    if (done) throw new Error("AI stream ended early");
+  }
+}
+
+export async function streamClassifications(
+  req: ClassifyRequest,
+  onResult: (item: StreamedResult<ClassificationResult>) => void
+) {
+  return streamNdjson<ClassificationResult>("/api/ai/classify_transactions", { ...req }, onResult);
+}
@@ -1,39 +1,28 @@
 from fastapi import FastAPI
 from termcolor import cprint
-from app.routes.health import router as health_router
-from app.routes.auth import router as auth_router
-from app.routes.wallet import router as wallet_router
-from app.routes.exchange import router as exchange_router
-from app.routes.transactions import router as transactions_router
-from app.routes.classification import router as classification_router
-from app.routes.manual_edit import router as manual_edit_router
-from app.routes.audit import router as audit_router
-from app.routes.tax import router as tax_router
-from app.routes.report import router as report_router
-from app.routes.lp import router as lp_router
-from app.routes.ai import router as ai_router
-from app.routes.lp_ai import router as lp_ai_router
-from app.routes.ai_nft import router as ai_nft_router
+from app.routes.registry import register_routers
+from app.utils.metrics import MetricsMiddleware
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 
-# Register API routers
-app.include_router(health_router)
-app.include_router(auth_router)
-app.include_router(wallet_router, prefix="/wallet")
-app.include_router(exchange_router)
-app.include_router(transactions_router)
-app.include_router(classification_router)
-app.include_router(manual_edit_router)
-app.include_router(audit_router)
-app.include_router(tax_router)
-app.include_router(report_router)
-app.include_router(lp_router, prefix="/lp")
-app.include_router(ai_router, prefix="/ai")
-app.include_router(ai_nft_router, prefix="/ai")
-app.include_router(ai_tax_router, prefix="/ai")
-app.include_router(ai_search_router, prefix="/ai")
-app.include_router(ai_defi_router, prefix="/ai")
-app.include_router(lp_ai_router, prefix="/lp/ai")
+# Register API routers (see ROUTERS in app/routes/registry.py)
+register_routers(app)
+
+@app.on_event("startup")
+async def start_job_runner():
+    from app.utils.job_queue import get_job_runner
+    get_job_runner().start()
+
+@app.on_event("shutdown")
+async def shutdown_provider_clients():
+    from app.utils.job_queue import get_job_runner
+    await get_job_runner().stop()
+    from app.services.openrouter_client import close_openrouter_client
+    from app.services.parallel_gains import close_process_pool
+    from app.utils.fetch_wallet_transactions import close_provider_clients
+    await close_provider_clients()
+    await close_openrouter_client()
+    close_process_pool()
 
 cprint("[INFO] Crypto Tax App FastAPI server initialized.", "cyan")